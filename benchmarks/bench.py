@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Benchmark stages of plate_mapper and plate_linker on synthetic data.
+
+Each stage is timed (best of several runs) and its peak memory measured
+(in a separate run under tracemalloc). Results can be saved as a baseline,
+and later runs compared against it to flag regressions.
+
+No baseline is shipped, as timings depend on the machine. Create one by
+running with --save on the commit to compare against, then run with
+--compare on later commits, on the same machine and scales.
+
+Usage:
+    python benchmarks/bench.py [-n 1 100 1000] [-w 96 384] [--save]
+    python benchmarks/bench.py [-n ...] [-w ...] --compare [-r 1.2]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import subprocess
+from shutil import rmtree
+from tempfile import mkdtemp
+from collections import Counter
+if __name__ == '__main__':
+    # run by path, only this directory is in the path, not the package
+    sys.path.insert(1, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+from plate_mapper.plate_mapper import (_read_plate_map, _read_special,
+                                       _read_barseq, _resolve, _check_repeated,
+                                       _check_names)
+from plate_mapper.writer import BatchWriter
+from plate_linker.plate_linker import plate_linker
+from generate import generate
+
+
+_baseline_fp = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'baseline.json')
+
+# stages faster than this (in seconds) are too noisy to flag slowdowns
+_min_time = 0.005
+
+
+def _stages(fps, outdir):
+    """Define benchmark stages on a set of input files.
+
+    Parameters
+    ----------
+    fps : dict of str
+        Input files returned by `generate`
+    outdir : str
+        Directory for output files
+
+    Returns
+    -------
+    list of tuple of (str, callable)
+        Stage name and function; functions are run in order, and each may
+        use the results of previous ones through a shared state dict
+    """
+    def parse(state):
+        state['plates'] = _read_plate_map(open(fps['plate_map'], 'r'))
+        state['specs'] = _read_special(open(fps['special'], 'r'))
+        state['barseqs'] = list(_read_barseq(open(fps['barseq'], 'r')))
+
+    def resolve(state):
+        state['counts'] = Counter()
+        state['rows'] = list(_resolve(state['barseqs'], state['plates'],
+                                      state['specs'], state['counts']))
+
+    def write(state):
+        writer = BatchWriter(open(os.path.join(outdir, 'mapping.tsv'), 'w'))
+        writer.writelines('\t'.join(fields) + suffix
+                          for fields, suffix in state['rows'])
+        writer.close()
+
+    def validate(state):
+        _check_repeated(state['counts'])
+        _check_names(state['counts'], open(fps['names'], 'r'))
+
+    def _link(engine):
+        def link(state):
+            plate_linker(open(fps['metadata'], 'r'), open(fps['primer'], 'r'),
+                         open(os.path.join(outdir, 'linked.tsv'), 'w'),
+                         engine=engine)
+        return link
+
+    return [('mapper.parse', parse), ('mapper.resolve', resolve),
+            ('mapper.write', write), ('mapper.validate', validate),
+            ('linker.hash', _link('hash')), ('linker.merge', _link('merge'))]
+
+
+def run(plates, wells, repeat=3):
+    """Benchmark all stages at one scale.
+
+    Parameters
+    ----------
+    plates : int
+        Number of plates
+    wells : int
+        Number of wells per plate
+    repeat : int (optional)
+        Number of timed runs per stage (default: 3)
+
+    Returns
+    -------
+    dict of dict
+        Stage name : {'time': best wall time in seconds, 'peak': peak memory
+        in bytes}
+    """
+    wkdir = mkdtemp()
+    devnull = open(os.devnull, 'w')
+    stdout = sys.stdout
+    try:
+        fps = generate(wkdir, plates, wells)
+        stages = _stages(fps, wkdir)
+        res = {name: {'time': float('inf')} for name, _ in stages}
+        sys.stdout = devnull  # silence progress messages
+        for _ in range(repeat):
+            state = {}
+            for name, func in stages:
+                start = time.perf_counter()
+                func(state)
+                res[name]['time'] = min(res[name]['time'],
+                                        time.perf_counter() - start)
+        state = {}
+        for name, func in stages:
+            tracemalloc.start()
+            func(state)
+            res[name]['peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+        rmtree(wkdir)
+    return res
+
+
+def compare(results, baseline, ratio):
+    """Compare results with baseline.
+
+    Parameters
+    ----------
+    results : dict of dict
+        Current results, keyed by scale then stage
+    baseline : dict of dict
+        Baseline results, in the same layout
+    ratio : float
+        Maximum allowed ratio of current to baseline time or peak memory
+
+    Returns
+    -------
+    list of str
+        Descriptions of regressions
+
+    Notes
+    -----
+    Timings of stages that took less than `_min_time` in the baseline are
+    not compared, as they are dominated by noise.
+    """
+    regressions = []
+    for scale, stages in sorted(results.items()):
+        for stage, res in sorted(stages.items()):
+            base = baseline.get(scale, {}).get(stage)
+            if not base:
+                continue
+            for metric in ('time', 'peak'):
+                if metric == 'time' and base[metric] < _min_time:
+                    continue
+                if base[metric] and res[metric] / base[metric] > ratio:
+                    regressions.append('%s %s %s: %.4g -> %.4g (x%.2f)' % (
+                        scale, stage, metric, base[metric], res[metric],
+                        res[metric] / base[metric]))
+    return regressions
+
+
+def _commit():
+    """Get current git commit, if available."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--plates', type=int, nargs='+', default=[10],
+                        help='numbers of plates (default: 10)')
+    parser.add_argument('-w', '--wells', type=int, nargs='+', default=[96],
+                        choices=[96, 384, 1536],
+                        help='numbers of wells per plate (default: 96)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of timed runs per stage (default: 3)')
+    parser.add_argument('-b', '--baseline', default=_baseline_fp,
+                        help='baseline file (default: %(default)s)')
+    parser.add_argument('--save', action='store_true',
+                        help='save results as baseline')
+    parser.add_argument('--compare', action='store_true',
+                        help='compare results with baseline')
+    parser.add_argument('-r', '--ratio', type=float, default=1.2,
+                        help='maximum allowed ratio to baseline before a '
+                             'regression is flagged (default: 1.2)')
+    args = parser.parse_args(argv)
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error('cannot read baseline %s (%s); create one with '
+                         '--save first' % (args.baseline, e))
+
+    results = {}
+    print('%-16s %-16s %12s %12s %14s'
+          % ('scale', 'stage', 'time (s)', 'us/well', 'peak (KiB)'))
+    for wells in args.wells:
+        for plates in args.plates:
+            scale = '%dx%d' % (plates, wells)
+            results[scale] = run(plates, wells, args.repeat)
+            for stage, res in sorted(results[scale].items()):
+                print('%-16s %-16s %12.4f %12.3f %14.1f' % (
+                    scale, stage, res['time'],
+                    res['time'] / (plates * wells) * 1e6,
+                    res['peak'] / 1024))
+
+    code = 0
+    if args.compare:
+        print('Comparing with baseline of commit %s...'
+              % (baseline.get('commit') or 'unknown'))
+        regressions = compare(results, baseline['results'], args.ratio)
+        if regressions:
+            print('Regressions:\n  %s' % '\n  '.join(regressions))
+            code = 1
+        else:
+            print('  No regression.')
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'commit': _commit(), 'results': results}, f,
+                      indent=2, sort_keys=True)
+        print('Baseline saved to %s.' % args.baseline)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Benchmark reading a barcode sequence template with and without its index.
+
+Compares parsing the text template, as plate_mapper does by default, with
+loading its compiled index (already built, as on every run after the first
+one with -x) and reading its rows, on a synthetic template of 100,000 rows.
+
+Usage: python benchmarks/bench_index.py [rows]
+"""
+
+import os
+import sys
+import timeit
+from shutil import rmtree
+from tempfile import mkdtemp
+if __name__ == '__main__':
+    # run by path, only this directory is in the path, not the package
+    sys.path.insert(1, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+from plate_mapper.barseq_index import load_index
+from plate_mapper.plate_mapper import _read_barseq
+
+
+def write_template(fp, n):
+    """Write a synthetic barcode sequence template.
+
+    Parameters
+    ----------
+    fp : str
+        Output file path
+    n : int
+        Number of rows
+    """
+    with open(fp, 'w') as f:
+        f.write('BarcodeSequence\tLinkerPrimerSequence\tPrimer_Plate\t'
+                'Well_ID\n')
+        for i in range(n):
+            plate, k = divmod(i, 384)
+            f.write('%s\tGTGTGCCAGCMGCCGCGGTAA\t%d\t%s%d\n' % (
+                ''.join('ACGT'[(i >> (2 * j)) & 3] for j in range(12)),
+                plate + 1, 'ABCDEFGHIJKLMNOP'[k // 24], k % 24 + 1))
+
+
+def text(fp):
+    """Parse the text template."""
+    with open(fp, 'r') as f:
+        for row in _read_barseq(f):
+            pass
+
+
+def index(fp):
+    """Load the compiled index and read its rows."""
+    idx = load_index(fp)
+    for row in _read_barseq(idx):
+        pass
+    idx.close()
+
+
+def main(n=100000, repeat=15):
+    wkdir = mkdtemp()
+    fp = os.path.join(wkdir, 'barseq.txt')
+    write_template(fp, n)
+    load_index(fp).close()  # build the index, as the first run does
+    res = {}
+    for func in (text, index):
+        t = min(timeit.repeat(lambda: func(fp), number=1, repeat=repeat))
+        res[func.__name__] = t
+        print('%-6s %8.3f s  %6.3f us/row' % (func.__name__, t, t / n * 1e6))
+    rmtree(wkdir)
+    print('index is %.1fx as fast as text' % (res['text'] / res['index']))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Benchmark startup time of the wetlab command.
+
+Each command is run in a new process several times, and its median wall
+time is reported along with the overhead over starting a bare interpreter.
+The commands print their help, or convert the small test data files, so
+that the time is dominated by interpreter startup and imports.
+
+Usage: python benchmarks/bench_startup.py [--repeat 20] [-l 50]
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+from shutil import rmtree
+from tempfile import mkdtemp
+from statistics import median
+
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _commands(wkdir):
+    """Generate commands to time.
+
+    Parameters
+    ----------
+    wkdir : str
+        Directory to write outputs to
+
+    Returns
+    -------
+    list of tuple of (str, list of str)
+        Name and arguments of each command, the first one being a bare
+        interpreter
+    """
+    mapper = os.path.join(_root, 'plate_mapper', 'tests', 'data')
+    linker = os.path.join(_root, 'plate_linker', 'tests', 'data')
+    wetlab = [sys.executable, '-m', 'plate_mapper.cli']
+    return [
+        ('python', [sys.executable, '-c', 'pass']),
+        ('wetlab -h', wetlab + ['-h']),
+        ('wetlab map -h', wetlab + ['map', '-h']),
+        ('wetlab link -h', wetlab + ['link', '-h']),
+        ('wetlab map', wetlab + [
+            'map', '-q', '-i', os.path.join(mapper, 'plate_map.txt'),
+            '-t', os.path.join(mapper, 'barseq_temp.txt'),
+            '-o', os.path.join(wkdir, 'mapping.txt')]),
+        ('wetlab link', wetlab + [
+            'link', '-q', '-m', os.path.join(linker, 'metadata.txt'),
+            '-p', os.path.join(linker, 'primer.txt'),
+            '-o', os.path.join(wkdir, 'output.txt')])]
+
+
+def run(repeat=20):
+    """Time commands.
+
+    Parameters
+    ----------
+    repeat : int (optional)
+        Number of runs per command (default: 20)
+
+    Returns
+    -------
+    list of tuple of (str, float)
+        Name and median wall time in seconds of each command
+    """
+    wkdir = mkdtemp()
+    env = dict(os.environ, PYTHONPATH=_root)
+    try:
+        res = []
+        for name, cmd in _commands(wkdir):
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run(cmd, env=env, check=True,
+                               stdout=subprocess.DEVNULL)
+                times.append(time.perf_counter() - start)
+            res.append((name, median(times)))
+    finally:
+        rmtree(wkdir)
+    return res
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='number of runs per command (default: 20)')
+    parser.add_argument('-l', '--limit', type=float, default=None,
+                        help='maximum allowed overhead in milliseconds over '
+                             'a bare interpreter, above which a command is '
+                             'flagged')
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    base = results[0][1]
+    print('%-16s %12s %14s' % ('command', 'time (ms)', 'overhead (ms)'))
+    slow = []
+    for name, t in results:
+        overhead = (t - base) * 1000
+        print('%-16s %12.1f %14.1f' % (name, t * 1000, overhead))
+        if args.limit is not None and overhead > args.limit:
+            slow.append(name)
+    if slow:
+        print('Over limit: %s' % ', '.join(slow))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Benchmark per-row cost of writing mapping files.
+
+Compares the former writer, which joins metadata and writes once per row,
+with pre-rendered per-plate metadata written through a batch writer, on a
+synthetic template of 100,000 rows.
+
+Usage: python benchmarks/bench_writer.py [rows]
+"""
+
+import os
+import sys
+import timeit
+from os import remove
+from tempfile import mkstemp
+if __name__ == '__main__':
+    # run by path, only this directory is in the path, not the package
+    sys.path.insert(1, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+from plate_mapper.plate import Plate
+from plate_mapper.writer import BatchWriter
+
+
+def make_rows(n, nmeta=13):
+    """Generate resolved rows with per-plate metadata.
+
+    Parameters
+    ----------
+    n : int
+        Number of rows
+    nmeta : int (optional)
+        Number of metadata columns
+
+    Returns
+    -------
+    list of tuple
+        Fields, metadata and plate of each row
+    """
+    rows, plate = [], None
+    for i in range(n):
+        pid, k = divmod(i, 96)
+        if k == 0:
+            meta = ['meta%d_%d' % (pid, j) for j in range(nmeta)]
+            plate = Plate(str(pid), meta)
+        well = 'ABCDEFGH'[k // 12] + str(k % 12 + 1)
+        fields = ('sample%d' % i, 'ACGTACGTACGT', 'GTGTGCCAGCMGCCGCGGTAA',
+                  str(pid), well)
+        rows.append((fields, meta, plate))
+    return rows
+
+
+def legacy(rows, fp):
+    """Join metadata and write once per row."""
+    with open(fp, 'w') as f:
+        for fields, meta, _ in rows:
+            f.write('%s\t%s\n' % ('\t'.join(fields), '\t'.join(meta)))
+
+
+def batched(rows, fp):
+    """Use pre-rendered per-plate metadata and a batch writer."""
+    writer = BatchWriter(open(fp, 'w'))
+    writer.writelines('\t'.join(fields) + plate.suffix
+                      for fields, _, plate in rows)
+    writer.close()
+
+
+def main(n=100000, repeat=15):
+    rows = make_rows(n)
+    fd, fp = mkstemp()
+    res = {}
+    for func in (legacy, batched):
+        t = min(timeit.repeat(lambda: func(rows, fp), number=1,
+                              repeat=repeat))
+        res[func.__name__] = t
+        print('%-8s %8.3f s  %6.3f us/row' % (func.__name__, t, t / n * 1e6))
+    remove(fp)
+    print('per-row cost reduced by %.1f%%'
+          % (100 * (1 - res['batched'] / res['legacy'])))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Generate synthetic inputs for plate_mapper and plate_linker.
+
+Usage: python benchmarks/generate.py -o outdir [-n plates] [-w wells]
+"""
+
+import os
+import sys
+import random
+import argparse
+if __name__ == '__main__':
+    # run by path, only this directory is in the path, not the package
+    sys.path.insert(1, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+from plate_mapper.plate import ROWS, FORMATS
+
+
+# special sample codes used in generated plate maps
+SPECIALS = (('_', 'BLANK', 'blank', ()),
+            ('+', 'PosCtl', 'positive control', ('XY', '1/10/17')),
+            ('-', 'NegCtl', 'negative control', ('XY', '1/10/17')),
+            ('', 'Empty', 'empty well', ('NA', 'NA')))
+
+
+def _barcode(rng, k=12):
+    """Generate a random DNA barcode."""
+    return ''.join(rng.choice('ACGT') for _ in range(k))
+
+
+def generate(outdir, plates=10, wells=96, nmeta=12, empty_rate=0.05,
+             special_rate=0.05, dup_rate=0.001, seed=42):
+    """Generate a set of synthetic input files.
+
+    Parameters
+    ----------
+    outdir : str
+        Output directory
+    plates : int (optional)
+        Number of plates (default: 10)
+    wells : int (optional)
+        Number of wells per plate: 96, 384 or 1536 (default: 96)
+    nmeta : int (optional)
+        Number of metadata columns per plate (default: 12)
+    empty_rate : float (optional)
+        Fraction of empty wells (default: 0.05)
+    special_rate : float (optional)
+        Fraction of wells filled with special sample codes (default: 0.05)
+    dup_rate : float (optional)
+        Fraction of wells reusing a previous sample name (default: 0.001)
+    seed : int (optional)
+        Random seed (default: 42)
+
+    Returns
+    -------
+    dict of str
+        File type : file path, for "plate_map", "barseq", "special",
+        "names", "metadata" and "primer"
+    """
+    rng = random.Random(seed)
+    dims = {x[0]: x[1:] for x in FORMATS}
+    if wells not in dims:
+        raise ValueError('Error: unsupported plate format: %d.' % wells)
+    nrows, ncols = dims[wells]
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    fps = {x: os.path.join(outdir, '%s.tsv' % x) for x in (
+        'plate_map', 'barseq', 'special', 'names', 'metadata', 'primer')}
+    codes = [x[0] for x in SPECIALS if x[0]]
+    metacols = ['Meta%d' % i for i in range(nmeta)]
+    names = []
+    with open(fps['plate_map'], 'w') as pm, \
+            open(fps['barseq'], 'w') as bs, \
+            open(fps['metadata'], 'w') as md, \
+            open(fps['primer'], 'w') as pr:
+        bs.write('BarcodeSequence\tLinkerPrimerSequence\tPrimer_Plate\t'
+                 'Well_ID\n')
+        md.write('%s\n' % '\t'.join(['sample_name', 'Primer_Plate',
+                                     'Well_ID'] + metacols))
+        pr.write('sample_name\tBARCODE\tPRIMER\tPrimer_Plate\tWell_ID\n')
+        for p in range(1, plates + 1):
+            meta = ['%s_%d' % (x, p) for x in metacols]
+            pm.write('%s\n' % '\t'.join(
+                ['Plate#%d' % p] + [str(j) for j in range(1, ncols + 1)] +
+                ['Primer Plate #'] + metacols))
+            for i in range(nrows):
+                cells = []
+                for j in range(ncols):
+                    well = '%s%d' % (ROWS[i], j + 1)
+                    barcode = _barcode(rng)
+                    bs.write('%s\tGTGTGCCAGCMGCCGCGGTAA\t%d\t%s\n'
+                             % (barcode, p, well))
+                    pr.write('\t%s\tGTGTGCCAGCMGCCGCGGTAA\t%d\t%s\n'
+                             % (barcode, p, well))
+                    r = rng.random()
+                    if r < empty_rate:
+                        cells.append('')
+                    elif r < empty_rate + special_rate:
+                        cells.append(rng.choice(codes))
+                    elif names and r < empty_rate + special_rate + dup_rate:
+                        cells.append(rng.choice(names))
+                    else:
+                        name = '%d.S%s%d' % (p, ROWS[i], j + 1)
+                        names.append(name)
+                        cells.append(name)
+                        md.write('%s\n' % '\t'.join(
+                            [name, str(p), well] + meta))
+                row = [ROWS[i]] + cells
+                if i == 0:
+                    row += [str(p)] + meta
+                pm.write('%s\n' % '\t'.join(row))
+            pm.write('\n')
+    with open(fps['special'], 'w') as f:
+        f.write('Code\tName\tNote\tWho\tWhen\n')
+        for code, name, note, meta in SPECIALS:
+            f.write('%s\n' % '\t'.join((code, name, note) + meta))
+    # name list misses a few samples, and has a few that are not on plates
+    with open(fps['names'], 'w') as f:
+        for name in names:
+            if rng.random() > 0.001:
+                f.write('%s\n' % name)
+        for i in range(max(1, len(names) // 1000)):
+            f.write('extra%d\n' % i)
+    return fps
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--outdir', help='output directory',
+                        required=True)
+    parser.add_argument('-n', '--plates', type=int, default=10,
+                        help='number of plates (default: 10)')
+    parser.add_argument('-w', '--wells', type=int, default=96,
+                        choices=[96, 384, 1536],
+                        help='number of wells per plate (default: 96)')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='random seed (default: 42)')
+    args = parser.parse_args()
+    for key, fp in sorted(generate(args.outdir, args.plates, args.wells,
+                                   seed=args.seed).items()):
+        print('%s\t%s' % (key, fp))
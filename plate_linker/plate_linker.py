@@ -7,26 +7,765 @@
 # ----------------------------------------------------------------------------
 
 
-import re
+import os
+import sys
 import argparse
+import warnings
+from heapq import merge
+from itertools import chain, islice
+if __name__ == '__main__' and not __package__:
+    # run by path, only the directory of this script is in the path, not the
+    # repository that holds plate_mapper
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from plate_mapper.barcodes import collect_barcodes, check_barcodes
+from plate_mapper.barseq_index import BarseqIndex, load_index
+from plate_mapper.fileio import FileArg, discard, write_manifest
+from plate_mapper.plate import Plate, WELL_INDEX, normalize_well
+from plate_mapper.records import Record, Result
+from plate_mapper.stats import RunStats
+from plate_mapper.writer import BatchWriter, ShardWriter, shard_key
 
 
-def plate_linker(metadata_f, primer_f, output_f):
+# metadata file size (in bytes) above which the merge join engine is used
+_merge_threshold = 1 << 28
+
+# number of rows sorted in memory per chunk during external sort
+_chunk_size = 500000
+
+
+class _Rows(object):
+    """Re-iterable rows of a table.
+
+    Parameters
+    ----------
+    table : file object, BarseqIndex or iterable
+        Tab-delimited file whose header has been read, compiled barcode
+        sequence template index, or iterable of lines or of sequences of
+        fields
+    start : int (optional)
+        Number of leading items of an iterable to skip (default: 0)
+
+    Attributes
+    ----------
+    rewindable : bool
+        Whether the rows can be iterated over more than once
+
+    Notes
+    -----
+    A compiled template index has no sample ID column, therefore an empty
+    one is prepended to each of its rows.
+
+    Rows are yielded as new lists, so that the tables they come from are not
+    modified by joining.
+    """
+
+    def __init__(self, table, start=0):
+        self.table = table
+        self.start = start
+        if isinstance(table, BarseqIndex):
+            self.pos = None
+            self.rewindable = True
+        elif hasattr(table, 'seekable'):
+            self.pos = table.tell() if table.seekable() else None
+            self.rewindable = self.pos is not None
+        else:
+            self.pos = None
+            self.rewindable = iter(table) is not table
+
+    def __iter__(self):
+        if isinstance(self.table, BarseqIndex):
+            for barcode, primer, plate, well in self.table:
+                yield ['', barcode, primer, plate, well]
+            return
+        if hasattr(self.table, 'seekable'):
+            if self.pos is not None:
+                self.table.seek(self.pos)
+            if hasattr(self.table, 'rows'):  # memory-mapped file
+                yield from self.table.rows()
+                return
+            for line in self.table:
+                yield line.rstrip('\r\n').split('\t')
+            return
+        for x in islice(self.table, self.start, None):
+            yield _split(x)
+
+
+def _split(x):
+    """Split a line into fields, or copy a sequence of fields."""
+    if isinstance(x, str):
+        return x.rstrip('\r\n').split('\t')
+    return list(x)
+
+
+def _read_table(table):
+    """Read column headers and rows of a table.
+
+    Parameters
+    ----------
+    table : file object or iterable
+        Tab-delimited file, or iterable of lines or of sequences of fields,
+        starting with column headers
+
+    Returns
+    -------
+    list of str
+        Column headers
+    _Rows
+        Rows
+    """
+    if hasattr(table, 'readline'):
+        return table.readline().strip('\r\n').split('\t'), _Rows(table)
+    it = iter(table)
+    header = _split(next(it, ''))
+    if it is table:
+        return header, _Rows(it)
+    return header, _Rows(table, 1)
+
+
+def _read_primer(primer_f):
+    """Read column headers and rows of a primer file.
+
+    Parameters
+    ----------
+    primer_f : file object, BarseqIndex or iterable
+        Input primer file, compiled barcode sequence template index, or
+        iterable of lines or of sequences of fields
+
+    Returns
+    -------
+    list of str
+        Column headers
+    _Rows
+        Rows of sample ID, barcode, primer, primer plate ID and well ID
+
+    Notes
+    -----
+    The column headers of a compiled template index are preceded by
+    "sample_name".
+    """
+    if isinstance(primer_f, BarseqIndex):
+        return ['sample_name'] + primer_f.header, _Rows(primer_f)
+    return _read_table(primer_f)
+
+
+def _check_well(plate, well):
+    """Validate a well and generate its sort key.
+
+    Parameters
+    ----------
+    plate : str
+        Primer plate ID
+    well : str
+        Well ID
+
+    Returns
+    -------
+    tuple of (int, int, int, str, str)
+        Sort key: numeric primer plate ID, row index, column index, primer
+        plate ID and well ID without zero padding
+
+    Raises
+    ------
+    ValueError
+        If the well identifier is invalid.
+
+    Notes
+    -----
+    A valid well reads like 1.A2: primer plate ID is an integer, and well ID
+    is a well of a plate of up to 1536 wells (A1 to AF48), which is looked up
+    in a precomputed table. A zero-padded well ID, such as A02, is the same
+    well as A2 (see `normalize_well`).
+
+    The original primer plate ID is kept as a tie-breaker so that keys are
+    equal only when identifiers are identical.
+    """
+    rc = WELL_INDEX.get(well)
+    if rc is None:
+        norm = normalize_well(well)
+        rc = WELL_INDEX.get(norm)
+    else:
+        norm = well
+    if rc is None or not plate.isdecimal():
+        raise ValueError('Error: invalid well identifier: %s.%s.'
+                         % (plate, well))
+    return int(plate), rc[0], rc[1], plate, norm
+
+
+class _Unsorted(Exception):
+    """Records to merge join turn out not to be sorted by well."""
+
+
+def _in_order(records):
+    """Pass on records while checking that they are sorted by well.
+
+    Parameters
+    ----------
+    records : iterable of tuple
+        Records led by well sort key
+
+    Yields
+    ------
+    tuple
+        Records
+
+    Raises
+    ------
+    _Unsorted
+        If a record is out of order, or its well cannot be read.
+    """
+    prev = None
+    try:
+        for rec in records:
+            if prev is not None and rec[0] < prev:
+                raise _Unsorted()
+            prev = rec[0]
+            yield rec
+    except (ValueError, IndexError):
+        raise _Unsorted()
+
+
+def _external_sort(records, key, chunk_size=None):
+    """Sort records of strings using temporary files.
+
+    Parameters
+    ----------
+    records : iterable of list of str
+        Records to sort, which must not contain tabs or newlines
+    key : callable
+        Function generating sort key of a record
+    chunk_size : int (optional)
+        Number of records sorted in memory per chunk
+
+    Yields
+    ------
+    list of str
+        Records in sorted order
+
+    Notes
+    -----
+    Records are sorted in chunks, each of which is written to a temporary
+    file, and the files are then merged. A sort that fits in a single chunk
+    does not touch the disk.
+    """
+    from tempfile import TemporaryFile
+    chunk_size = chunk_size or _chunk_size
+    chunks = []
+    it = iter(records)
+    try:
+        while True:
+            chunk = sorted(islice(it, chunk_size), key=key)
+            if len(chunk) < chunk_size and not chunks:
+                for rec in chunk:
+                    yield rec
+                return
+            if chunk:
+                f = TemporaryFile('w+')
+                f.writelines('%s\n' % '\t'.join(x) for x in chunk)
+                f.seek(0)
+                chunks.append(f)
+            if len(chunk) < chunk_size:
+                break
+        del chunk
+        readers = [(line.rstrip('\n').split('\t') for line in f)
+                   for f in chunks]
+        for rec in merge(*readers, key=key):
+            yield rec
+    finally:
+        for f in chunks:
+            f.close()
+
+
+def _read_metadata(rows):
+    """Read and validate metadata rows.
+
+    Parameters
+    ----------
+    rows : iterable of list of str
+        Metadata rows
+
+    Yields
+    ------
+    tuple of (tuple, str, list of str)
+        Well sort key, sample ID and metadata
+    """
+    for l in rows:
+        sample = l[0].replace('_', '.').replace('-', '.')
+        yield _check_well(l[1], l[2]), sample, l[3:]
+
+
+def _render(meta):
+    """Render metadata as the tail of an output line."""
+    return ''.join(['\t' + x for x in meta]) + '\n'
+
+
+def _hash_join(metadata, primers, missing):
+    """Join metadata and primers using an in-memory well index.
+
+    Parameters
+    ----------
+    metadata : iterable of list of str
+        Metadata rows
+    primers : iterable of list of str
+        Primer rows
+    missing : list of str
+        Sample IDs that do not have matched primers, to be appended to once
+        all rows are joined
+
+    Yields
+    ------
+    tuple of (list of str, str)
+        Primer row with sample ID, and rendered metadata
+
+    Notes
+    -----
+    Metadata of each well are rendered once as the tail of output line when
+    the metadata table is read.
+    """
+    for _, l, suffix in _fan_out_join(_index_tables([metadata]), primers,
+                                      [missing]):
+        yield l, suffix
+
+
+def _index_tables(tables, names=None):
+    """Index metadata of one or more tables by well.
+
+    Parameters
+    ----------
+    tables : list of iterable of list of str
+        Metadata rows of each table
+    names : list of str (optional)
+        Name of each table, for error messages
+
+    Returns
+    -------
+    dict of Plate
+        Primer plate ID : plate of (table index, sample ID, rendered
+        metadata)
+
+    Raises
+    ------
+    ValueError
+        If a well is in more than one table.
+
+    Notes
+    -----
+    When a well occurs multiple times in a table, the last occurrence is
+    used, as in a single join.
+    """
+    plates = {}  # primer plate ID : plate of (table, sample ID, metadata)
+    conflicts = {}  # well : indices of tables
+    for i, rows in enumerate(tables):
+        for key, sample, meta in _read_metadata(rows):
+            plate = key[3]
+            grid = plates.get(plate)
+            if grid is None:
+                grid = plates[plate] = Plate(plate)
+            prev = grid.get(key[4])
+            if prev is not None and prev[0] != i:
+                conflicts.setdefault(key, {prev[0]}).add(i)
+            grid.set(key[1], key[2], (i, sample, _render(meta)))
+    if conflicts:
+        raise ValueError('Error: the following wells are in more than one '
+                         'metadata table: %s.' % ', '.join(
+                             '%s.%s (%s)' % (x[3], x[4], ', '.join(
+                                 names[i] for i in sorted(conflicts[x])))
+                             for x in sorted(conflicts)))
+    return plates
+
+
+def _fan_out_join(plates, primers, missing):
+    """Join indexed metadata of one or more tables and primers.
+
+    Parameters
+    ----------
+    plates : dict of Plate
+        Metadata indexed by `_index_tables`
+    primers : iterable of list of str
+        Primer rows
+    missing : list of list of str
+        Sample IDs of each table that do not have matched primers, to be
+        appended to once all rows are joined
+
+    Yields
+    ------
+    tuple of (int, list of str, str)
+        Table index, primer row with sample ID, and rendered metadata
+    """
+    used = set()  # (primer plate ID, position) of used wells
+    for l in primers:
+        key = _check_well(l[3], l[4])
+        grid = plates.get(l[3])
+        if grid is None:
+            continue
+        k = grid.position(key[4])
+        if k is not None and grid.cells[k] is not None:
+            i, l[0], suffix = grid.cells[k]
+            used.add((l[3], k))
+            yield i, l, suffix
+    for plate, grid in plates.items():
+        for k, value in enumerate(grid.cells):
+            if value is not None and (plate, k) not in used:
+                missing[value[0]].append(value[1])
+
+
+def _last_of_runs(metas):
+    """Keep the last record of each run of identical wells.
+
+    Parameters
+    ----------
+    metas : iterable of tuple
+        Metadata records sorted by well sort key
+
+    Yields
+    ------
+    tuple
+        Metadata records with unique wells
+    """
+    prev = None
+    for rec in metas:
+        if prev is not None and rec[0] != prev[0]:
+            yield prev
+        prev = rec
+    if prev is not None:
+        yield prev
+
+
+def _join(metas, prims, missing):
+    """Join metadata and primer records that are both sorted by well.
+
+    Parameters
+    ----------
+    metas : iterator of tuple of (tuple, str, list of str)
+        Well sort key, sample ID and metadata, with unique wells
+    prims : iterable of tuple of (tuple, int, list of str)
+        Well sort key, row number and primer row
+    missing : list of str
+        Sample IDs that do not have matched primers, to be appended to
+
+    Yields
+    ------
+    tuple of (int, list of str, list of str)
+        Row number of primer, primer row with sample ID, and metadata
+    """
+    meta, used = next(metas, None), False
+    for key, i, l in prims:
+        while meta is not None and meta[0] < key:
+            if not used:
+                missing.append(meta[1])
+            meta, used = next(metas, None), False
+        if meta is not None and meta[0] == key:
+            l[0] = meta[1]
+            used = True
+            yield i, l, meta[2]
+    while meta is not None:
+        if not used:
+            missing.append(meta[1])
+        meta, used = next(metas, None), False
+
+
+def _merge_join(metadata, primers, missing, chunk_size=None):
+    """Join metadata and primers by scanning both in well order.
+
+    Parameters
+    ----------
+    metadata : _Rows
+        Metadata rows
+    primers : _Rows
+        Primer rows
+    missing : list of str
+        Sample IDs that do not have matched primers, to be appended to
+    chunk_size : int (optional)
+        Number of rows sorted, or held back, in memory per chunk
+
+    Yields
+    ------
+    tuple of (list of str, str)
+        Primer row with sample ID, and rendered metadata
+
+    Notes
+    -----
+    If both tables can be read twice, they are first joined as if sorted by
+    well, in a single pass in constant memory, while their order is checked.
+    Joined rows are held back, in memory up to a chunk and then in a
+    temporary file, until both tables are found sorted. Otherwise, once a
+    well out of order (or an invalid one) is met, the tables are read again:
+    they are sorted externally, joined, and the joined rows are sorted back
+    to the order of the primer table. In either case the output and the
+    errors are identical to those of `_hash_join`.
+    """
+    if metadata.rewindable and primers.rewindable:
+        from tempfile import TemporaryFile
+        size = chunk_size or _chunk_size
+        metas = _last_of_runs(_in_order(_read_metadata(metadata)))
+        prims = _in_order((_check_well(l[3], l[4]), i, l)
+                          for i, l in enumerate(primers))
+        # joined rows are held as lines, prefixed with length of primer row
+        buf, spool = [], None
+        try:
+            try:
+                for i, l, meta in _join(metas, prims, missing):
+                    buf.append('\t'.join([str(len(l))] + l + meta))
+                    if len(buf) == size:
+                        if spool is None:
+                            spool = TemporaryFile('w+')
+                        spool.writelines('%s\n' % x for x in buf)
+                        buf = []
+            except _Unsorted:
+                del missing[:]
+            else:
+                if spool is not None:
+                    spool.seek(0)
+                    buf = chain((x[:-1] for x in spool), buf)
+                for x in buf:
+                    x = x.split('\t')
+                    n = int(x[0]) + 1
+                    yield x[1:n], _render(x[n:])
+                return
+        finally:
+            if spool is not None:
+                spool.close()
+
+    # rows are prefixed with row numbers, which keep sorting stable, so that
+    # the last occurrence of a well in metadata wins, and primer order can be
+    # restored after joining
+    def _meta_key(x):
+        return _check_well(x[2], x[3]), int(x[0])
+
+    def _prim_key(x):
+        return _check_well(x[4], x[5]), int(x[0])
+
+    # all metadata are validated and sorted before primers are read
+    metas = _external_sort(([str(i)] + l for i, l in enumerate(metadata)),
+                           _meta_key, chunk_size)
+    metas = _last_of_runs(
+        (_meta_key(x)[0], x[1].replace('_', '.').replace('-', '.'), x[4:])
+        for x in metas)
+    prims = _external_sort(([str(i)] + l for i, l in enumerate(primers)),
+                           _prim_key, chunk_size)
+    prims = ((_prim_key(x)[0], x[0], x[1:]) for x in prims)
+    # joined rows are prefixed with row number and length of primer row
+    joined = _external_sort(([i, str(len(l))] + l + meta
+                             for i, l, meta in _join(metas, prims, missing)),
+                            lambda x: int(x[0]), chunk_size)
+    for x in joined:
+        n = int(x[1]) + 2
+        yield x[2:n], _render(x[n:])
+
+
+def _choose_engine(metadata_f):
+    """Choose join engine by metadata file size.
+
+    Parameters
+    ----------
+    metadata_f : file object
+        Input metadata file
+
+    Returns
+    -------
+    str
+        "merge" if the metadata file is larger than the threshold, otherwise
+        "hash"
+    """
+    try:
+        size = os.fstat(metadata_f.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        return 'hash'
+    return 'merge' if size > _merge_threshold else 'hash'
+
+
+def _check_engine(engine, metadata_f):
+    """Validate join engine, choosing one if it is "auto".
+
+    Parameters
+    ----------
+    engine : str
+        Join engine
+    metadata_f : file object or iterable
+        Input metadata
+
+    Returns
+    -------
+    str
+        "hash" or "merge"
+
+    Raises
+    ------
+    ValueError
+        If the engine is invalid.
+    """
+    if engine == 'auto':
+        engine = _choose_engine(metadata_f)
+    if engine not in ('hash', 'merge'):
+        raise ValueError('Error: invalid join engine: %s.' % engine)
+    return engine
+
+
+def _read_tables(metadata_f, primer_f, result):
+    """Read and validate column headers of metadata and primer tables.
+
+    Parameters
+    ----------
+    metadata_f : file object or iterable
+        Input metadata
+    primer_f : file object, BarseqIndex or iterable
+        Input primers
+    result : Result
+        Result to record output column headers into
+
+    Returns
+    -------
+    tuple of (_Rows, _Rows)
+        Metadata rows and primer rows
+
+    Raises
+    ------
+    ValueError
+        If a table has a wrong number of columns.
+    """
+    metacols, metadata = _read_table(metadata_f)
+    if len(metacols) < 3:
+        raise ValueError('Error: metadata table must have at least three '
+                         'columns.')
+    primcols, primers = _read_primer(primer_f)
+    if len(primcols) != 5:
+        raise ValueError('Error: primer table must have exactly five columns.')
+    result.header = primcols + metacols[3:]
+    return metadata, primers
+
+
+def _link_rows(metadata, primers, engine, result):
+    """Join metadata and primer rows.
+
+    Parameters
+    ----------
+    metadata : _Rows
+        Metadata rows
+    primers : _Rows
+        Primer rows
+    engine : {'hash', 'merge'}
+        Join engine
+    result : Result
+        Result to record statistics and unmatched samples into
+
+    Yields
+    ------
+    tuple of (list of str, str)
+        Primer row with sample ID, and rendered metadata
+    """
+    stats = result.stats
+    missing = []
+    n = 0
+    with stats.phase('%s_join' % engine):
+        if engine == 'hash':
+            rows = _hash_join(metadata, primers, missing)
+        else:
+            rows = _merge_join(metadata, primers, missing)
+        for row in rows:
+            n += 1
+            yield row
+    stats.count('rows', n)
+    stats.count('missing', len(missing))
+    result.missing = sorted(missing)
+    if missing:
+        result.errors.append('Error: the following samples do not have '
+                             'matched primers: %s.'
+                             % ', '.join(result.missing))
+
+
+def link_plates(metadata, primers, engine='auto', result=None):
+    """Transfer sample IDs to primers by well IDs, in memory.
+
+    Parameters
+    ----------
+    metadata : iterable
+        Lines, or sequences of fields, of metadata table, starting with
+        column headers
+    primers : iterable or BarseqIndex
+        Lines, or sequences of fields, of primer table, starting with column
+        headers, or compiled barcode sequence template index
+    engine : {'auto', 'hash', 'merge'} (optional)
+        Join engine (see `plate_linker`; "auto" chooses "hash" unless the
+        metadata is a large file) (default: "auto")
+    result : Result (optional)
+        Result to record output column headers, statistics and samples
+        without matched primers into
+
+    Returns
+    -------
+    iterator of Record
+        Joined rows, in primer table order
+
+    Raises
+    ------
+    ValueError
+        If the engine or the column headers are invalid, or a well
+        identifier is invalid (when iterating).
+
+    Notes
+    -----
+    Column headers are read and validated immediately, so that
+    `result.header` is available before iterating. Inputs may be open files,
+    lists or any other iterables; they are consumed but not closed. Samples
+    without matched primers do not raise an error, but are recorded in
+    `result.missing` and `result.errors` once the iterator is exhausted.
+    """
+    if result is None:
+        result = Result()
+    engine = _check_engine(engine, metadata)
+    metadata, primers = _read_tables(metadata, primers, result)
+    return (Record(fields, suffix) for fields, suffix in
+            _link_rows(metadata, primers, engine, result))
+
+
+def plate_linker(metadata_f, primer_f, output_f, engine='auto', stats=None,
+                 barcode_dist=None, catalog_fp=None, shard_by=None):
     """Transfer sample IDs to mapping file by well IDs.
 
     Parameters
     ----------
     metadata_f : file object
         Input metadata file
-    primer_f : file object
-        Input primer file
-    output_f : file object
-        Output mapping file
+    primer_f : file object or BarseqIndex
+        Input primer file, or compiled barcode sequence template index
+    output_f : file object or ShardWriter
+        Output mapping file, or shards of it if `shard_by` is given
+    engine : {'auto', 'hash', 'merge'} (optional)
+        Join engine: "hash" indexes all metadata in memory, "merge" joins
+        tables sorted by well (sorting them on disk if they are not yet), and
+        "auto" chooses by metadata file size (default: "auto")
+    stats : RunStats (optional)
+        Statistics to record the run into, which also controls progress
+        messages (default: a new one)
+    barcode_dist : int (optional)
+        If given, check barcodes of joined rows for duplicates, and for
+        pairs within this Hamming distance, and issue a warning if any
+    catalog_fp : str (optional)
+        SQLite catalog to record rows into as they are written (see
+        `plate_mapper.catalog.Catalog`)
+    shard_by : str or int (optional)
+        Split rows into shards, each with the column headers, by
+        "primer_plate" or an output column header or number (see
+        `plate_mapper.writer.shard_key`)
+
+    Returns
+    -------
+    RunStats
+        Phase timings and counters of the run: "rows" (rows written),
+        "missing" (samples without matched primers), "shards" (shards
+        written, if sharded), and if barcodes are checked,
+        "duplicated_barcodes" and "similar_barcodes"
+
+    Raises
+    ------
+    ValueError
+        If the engine, the tables or the shard column are invalid, or some
+        samples do not have matched primers.
 
     Notes
     -----
     This function joins a metadata file and a primer file (barcode sequence
-    template file) by well, into a complete mapping file.
+    template file) by well, into a complete mapping file. It is a wrapper of
+    `link_plates` that writes rows to a file and closes all files.
 
     In the metadata file, the 1st column is the sample ID, the 2nd and 3rd
     columns are primer plate ID and well ID, and the remaining columns are
@@ -37,62 +776,295 @@ def plate_linker(metadata_f, primer_f, output_f):
 
     In the output file, columns are: sample ID, barcode, primer, primer plate
     ID, well ID, plus variable number of metadata columns.
+
+    Both join engines produce identical output: rows follow the order of the
+    primer file, and when a well occurs multiple times in the metadata file,
+    the last occurrence is used.
     """
-    # merge column headers of primer and metadata files
-    metacols = metadata_f.readline().strip('\r\n').split('\t')
-    if len(metacols) < 3:
-        raise ValueError('Error: metadata table must have at least three '
-                         'columns.')
-    primcols = primer_f.readline().strip('\r\n').split('\t')
+    result = Result(RunStats() if stats is None else stats)
+    engine = _check_engine(engine, metadata_f)
+    metadata, primers = _read_tables(metadata_f, primer_f, result)
+    if shard_by is not None:
+        key = shard_key(shard_by, result.header)
+    rows = _link_rows(metadata, primers, engine, result)
+    if barcode_dist is not None:
+        barcodes = []
+        rows = collect_barcodes(rows, barcodes)
+    catalog = None
+    if catalog_fp:
+        from plate_mapper.catalog import Catalog
+        catalog = Catalog(catalog_fp)
+        rows = catalog.collect(rows, 'plate_linker',
+                               getattr(metadata_f, 'name', None),
+                               getattr(output_f, 'name', None))
+    if shard_by is None:
+        writer = BatchWriter(output_f)
+        writer.write('%s\n' % '\t'.join(result.header))
+        lines = ('\t'.join(fields) + suffix for fields, suffix in rows)
+    else:
+        writer = output_f
+        writer.header = '%s\n' % '\t'.join(result.header)
+        lines = ((key(fields, suffix), '\t'.join(fields) + suffix)
+                 for fields, suffix in rows)
+    try:
+        writer.writelines(lines)
+        # check if all samples are included
+        if result.errors:
+            raise ValueError(result.errors[0])
+        if catalog is not None:
+            catalog.commit()
+    finally:
+        writer.flush()
+        metadata_f.close()
+        primer_f.close()
+        if catalog is not None:
+            catalog.close()
+    writer.close()
+    if shard_by is not None:
+        result.stats.count('shards', len(writer.shards))
+    if barcode_dist is not None:
+        check_barcodes(barcodes, barcode_dist, result)
+        if result.warnings:
+            warnings.warn('Warning:\n%s' % ''.join(result.warnings))
+    result.stats.log('Task completed.')
+    return result.stats
+
+
+def plate_linker_multi(metadata_fs, primer_f, output_fs, stats=None):
+    """Transfer sample IDs of multiple metadata files to one primer file.
+
+    Parameters
+    ----------
+    metadata_fs : list of file object
+        Input metadata files
+    primer_f : file object or BarseqIndex
+        Input primer file, or compiled barcode sequence template index
+    output_fs : list of file object
+        Output mapping file of each metadata file
+    stats : RunStats (optional)
+        Statistics to record the run into, which also controls progress
+        messages (default: a new one)
+
+    Returns
+    -------
+    RunStats
+        Phase timings and counters of the run: "tables" (metadata files),
+        "rows" (rows written to all files) and "missing" (samples without
+        matched primers)
+
+    Raises
+    ------
+    ValueError
+        If the numbers of metadata and output files differ, a table is
+        invalid, a well is in more than one metadata file, or some samples
+        do not have matched primers.
+
+    Notes
+    -----
+    The wells of all metadata files are indexed together, and the primer
+    file is then read once, with each joined row written to the output of
+    the metadata file it matched, so that linking many studies against one
+    primer file reads it only once. Each output is identical to that of
+    `plate_linker` with the hash join engine.
+
+    Wells in more than one metadata file are reported before any output is
+    written.
+    """
+    if len(metadata_fs) != len(output_fs):
+        raise ValueError('Error: numbers of metadata and output files '
+                         'differ.')
+    stats = RunStats() if stats is None else stats
+    names = [getattr(f, 'name', 'metadata %d' % (i + 1))
+             for i, f in enumerate(metadata_fs)]
+    headers, tables = [], []
+    for f in metadata_fs:
+        metacols, rows = _read_table(f)
+        if len(metacols) < 3:
+            raise ValueError('Error: metadata table must have at least three '
+                             'columns.')
+        headers.append(metacols[3:])
+        tables.append(rows)
+    primcols, primers = _read_primer(primer_f)
     if len(primcols) != 5:
         raise ValueError('Error: primer table must have exactly five columns.')
-    output_f.write('%s\n' % '\t'.join(primcols + metacols[3:]))
-    # read sample ID and metadata associated with well
-    p = re.compile(r'^\d+\.[A-Z]\d+$')  # well must read like 1.A2
-    well2sample, well2meta = {}, {}
-    for line in metadata_f:
-        l = line.rstrip('\r\n').split('\t')
-        sample = l[0].replace('_', '.').replace('-', '.')
-        well = '%s.%s' % (l[1], l[2])
-        if not p.search(well):
-            raise ValueError('Error: invalid well identifier: %s.' % well)
-        well2sample[well] = sample
-        well2meta[well] = l[3:]
-    metadata_f.close()
-    # read primer by well and append sample ID and metadata
-    all_wells = set(well2sample.keys())
-    used_wells = set()
-    for line in primer_f:
-        l = line.rstrip('\r\n').split('\t')
-        well = '%s.%s' % (l[3], l[4])
-        if not p.search(well):
-            raise ValueError('Error: invalid well identifier: %s.' % well)
-        if well in all_wells:
-            l[0] = well2sample[well]
-            l += well2meta[well]
-            output_f.write('%s\n' % '\t'.join(l))
-            used_wells.add(well)
+    with stats.phase('index_metadata', 'Indexing metadata'):
+        plates = _index_tables(tables, names)
+    writers = [BatchWriter(f) for f in output_fs]
+    for writer, header in zip(writers, headers):
+        writer.write('%s\n' % '\t'.join(primcols + header))
+    missing = [[] for _ in tables]
+    n = 0
+    with stats.phase('fan_out_join', 'Linking primers'):
+        for i, l, suffix in _fan_out_join(plates, primers, missing):
+            writers[i].write('\t'.join(l) + suffix)
+            n += 1
+    for f in metadata_fs:
+        f.close()
     primer_f.close()
-    # check if all samples are included
-    if all_wells > used_wells:
-        missing = sorted([well2sample[x] for x in (all_wells - used_wells)])
+    for writer in writers:
+        writer.close()
+    stats.count('tables', len(tables))
+    stats.count('rows', n)
+    stats.count('missing', sum(len(x) for x in missing))
+    if any(missing):
         raise ValueError('Error: the following samples do not have matched '
-                         'primers: %s.' % ', '.join(missing))
-    output_f.close()
-    print('Task completed.')
+                         'primers: %s.' % '; '.join(
+                             '%s: %s' % (name, ', '.join(sorted(x)))
+                             for name, x in zip(names, missing) if x))
+    stats.log('Task completed.')
+    return stats
 
 
-if __name__ == "__main__":
-    # Welcome information
-    print('Plate Linker: Transfer sample IDs to mapping file by well IDs.\n'
-          'Last updated: Jun 22, 2017.')
+def main(argv=None, prog=None):
+    """Run plate_linker from the command line.
+
+    Parameters
+    ----------
+    argv : list of str (optional)
+        Command-line arguments (default: those of the process)
+    prog : str (optional)
+        Program name shown in usage (default: that of the script)
+    """
     # Parse arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-m', '--metadata', type=argparse.FileType('r'),
-                        help='input metadata file', required=True)
-    parser.add_argument('-p', '--primer', type=argparse.FileType('r'),
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('-m', '--metadata', type=FileArg('r'), nargs='+',
+                        help='input metadata file(s)', required=True)
+    parser.add_argument('-p', '--primer', type=FileArg('r'),
                         help='input primer file', required=True)
-    parser.add_argument('-o', '--output', type=argparse.FileType('w'),
-                        help='output mapping file', required=True)
-    args = parser.parse_args()
-    plate_linker(args.metadata, args.primer, args.output)
+    parser.add_argument('-o', '--output', type=FileArg('w', atomic=True),
+                        nargs='+',
+                        help='output mapping file(s), one per metadata file, '
+                             'each replaced once complete, and only if '
+                             'changed (required unless checking)',
+                        required=False, default=None)
+    parser.add_argument('-j', '--engine', choices=['auto', 'hash', 'merge'],
+                        help='(optional) join engine (default: auto)',
+                        required=False, default='auto')
+    parser.add_argument('-x', '--index-dir',
+                        help='(optional) directory of compiled barcode '
+                             'sequence template indices, in which case the '
+                             'primer file is a barcode sequence template',
+                        required=False, default=None)
+    parser.add_argument('-b', '--barcode-dist', type=int,
+                        help='(optional) check barcodes of samples for '
+                             'duplicates and pairs within this Hamming '
+                             'distance',
+                        required=False, default=None)
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not print progress messages')
+    parser.add_argument('--stats',
+                        help='(optional) write phase timings, peak memory '
+                             'and counters to this JSON file',
+                        required=False, default=None)
+    parser.add_argument('--sheet', action='append',
+                        help='(optional) sheet of .xlsx metadata files to '
+                             'read, which may be given more than once '
+                             '(default: the first sheet)',
+                        required=False, default=None)
+    parser.add_argument('--all-sheets', action='store_true',
+                        help='read all sheets of .xlsx metadata files, '
+                             'whose first rows are column headers')
+    parser.add_argument('--catalog',
+                        help='(optional) SQLite catalog to record output '
+                             'rows into, for queries across runs',
+                        required=False, default=None)
+    parser.add_argument('--manifest',
+                        help='(optional) write SHA-256 digests of inputs '
+                             'and outputs, and whether outputs changed, to '
+                             'this JSON file',
+                        required=False, default=None)
+    parser.add_argument('--shard-by',
+                        help='(optional) split output into one file per '
+                             'primer plate ("primer_plate"), or value of the '
+                             'output column of this header or number, '
+                             'written in one pass to --shard-dir',
+                        required=False, default=None)
+    parser.add_argument('--shard-dir',
+                        help='(optional) output directory of shards, with '
+                             'an index.tsv of shards and their row counts',
+                        required=False, default=None)
+    parser.add_argument('--max-open', type=int,
+                        help='(optional) maximum number of shards open at a '
+                             'time (default: 64)',
+                        required=False, default=64)
+    parser.add_argument('--check', action='store_true',
+                        help='validate inputs and report all errors and '
+                             'warnings, without writing output')
+    parser.add_argument('--check-json',
+                        help='(optional) also write the validation report '
+                             'to this JSON file',
+                        required=False, default=None)
+    args = parser.parse_args(argv)
+    if args.sheet or args.all_sheets:
+        from plate_mapper.xlsx import select_sheets
+        try:
+            select_sheets(args.metadata, args.sheet, args.all_sheets, True)
+        except ValueError as e:
+            sys.exit(str(e))
+    if args.check:
+        from plate_mapper.validate import check_plate_linker
+        primer = args.primer
+        if args.index_dir:
+            primer.close()
+            primer = load_index(primer.name, args.index_dir)
+        report = check_plate_linker(args.metadata, primer, args.barcode_dist)
+        sys.stdout.write(report.text())
+        if args.check_json:
+            report.dump(args.check_json)
+        return 1 if report.errors else None
+    if (args.shard_by is None) != (args.shard_dir is None):
+        parser.error('--shard-by and --shard-dir must be given together')
+    if args.shard_dir:
+        if args.output is not None:
+            parser.error('-o does not apply to sharded runs')
+        if len(args.metadata) > 1:
+            parser.error('--shard-by applies to one metadata file only')
+        if args.max_open < 1:
+            parser.error('--max-open must be at least 1')
+        args.output = [ShardWriter(args.shard_dir, max_open=args.max_open)]
+    if args.output is None:
+        parser.error('the following arguments are required: -o/--output')
+    if len(args.metadata) != len(args.output):
+        parser.error('one output file is required per metadata file')
+    if len(args.metadata) > 1 and (args.engine != 'auto' or
+                                   args.barcode_dist is not None):
+        parser.error('-j and -b apply to one metadata file only')
+    if len(args.metadata) > 1 and args.catalog:
+        parser.error('--catalog applies to one metadata file only')
+    stats = RunStats(args.quiet, memory=args.stats is not None)
+    # Welcome information
+    stats.log('Plate Linker: Transfer sample IDs to mapping file by well '
+              'IDs.\nLast updated: Jun 22, 2017.')
+    primer = args.primer
+    if args.index_dir:
+        primer.close()
+        primer = load_index(primer.name, args.index_dir)
+    warnings.formatwarning = lambda msg, cat, fname, lineno, line: str(msg)
+    try:
+        if len(args.metadata) == 1 and len(args.output) == 1:
+            plate_linker(args.metadata[0], primer, args.output[0],
+                         args.engine, stats, args.barcode_dist, args.catalog,
+                         args.shard_by)
+        else:
+            plate_linker_multi(args.metadata, primer, args.output, stats)
+    except BaseException:
+        for f in args.output:
+            discard(f)
+        raise
+    finally:
+        if args.stats:
+            stats.dump(args.stats)
+    if args.manifest:
+        inputs = {'primer': args.primer}
+        if len(args.metadata) == 1:
+            inputs['metadata'] = args.metadata[0]
+        else:
+            inputs.update(('metadata_%d' % i, f)
+                          for i, f in enumerate(args.metadata, 1))
+        write_manifest(args.manifest, 'plate_linker', inputs,
+                       list(args.output[0].shards.values()) if args.shard_dir
+                       else args.output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,7 +10,13 @@ from unittest import TestCase, main
 from tempfile import mkdtemp
 from shutil import rmtree
 from os.path import join, dirname, realpath
-from plate_linker.plate_linker import plate_linker
+from unittest.mock import patch
+from warnings import catch_warnings, simplefilter
+from plate_linker.plate_linker import (plate_linker, plate_linker_multi,
+                                       link_plates)
+from plate_mapper.barseq_index import compile_index, BarseqIndex
+from plate_mapper.stats import RunStats
+from plate_mapper.records import Result
 
 
 class PlateLinkerTests(TestCase):
@@ -39,13 +45,18 @@ class PlateLinkerTests(TestCase):
         # expected output mapping file
         exp_output_fp = join(datadir, 'exp_output.txt')
         # run plate_linker
-        plate_linker(metadata_f, primer_f, output_f)
+        stats = plate_linker(metadata_f, primer_f, output_f,
+                             stats=RunStats(quiet=True))
         # check output mapping file
         with open(obs_output_fp, 'r') as f:
             obs = f.read()
         with open(exp_output_fp, 'r') as f:
             exp = f.read()
         self.assertEqual(obs, exp)
+        # check statistics
+        self.assertDictEqual(stats.counters, {'rows': obs.count('\n') - 1,
+                                              'missing': 0})
+        self.assertEqual(stats.phases[0]['name'], 'hash_join')
 
         # test error when metadata table has inadequate columns
         metadata_fp = join(self.wkdir, 'metadata.txt')
@@ -97,6 +108,32 @@ class PlateLinkerTests(TestCase):
         err = ('Error: invalid well identifier: in.val.')
         self.assertEqual(str(context.exception), err)
 
+        # test wells of a 1536-well plate
+        metadata_fp = join(self.wkdir, 'metadata.txt')
+        with open(metadata_fp, 'w') as f:
+            f.write('%s\n' % '\t'.join(('Sample', 'Plate', 'Well')))
+            f.write('%s\n' % '\t'.join(('sp001', '1', 'AF48')))
+        primer_fp = join(self.wkdir, 'primer.txt')
+        with open(primer_fp, 'w') as f:
+            f.write('%s\n' % '\t'.join(('Sample', 'Barcode', 'Primer', 'Plate',
+                                        'Well')))
+            f.write('%s\n' % '\t'.join(('', 'ATCGGCTA', 'ATCG', '1', 'AF48')))
+        plate_linker(open(metadata_fp, 'r'), open(primer_fp, 'r'),
+                     open(obs_output_fp, 'w'))
+        with open(obs_output_fp, 'r') as f:
+            obs = f.read()
+        exp = ('Sample\tBarcode\tPrimer\tPlate\tWell\n'
+               'sp001\tATCGGCTA\tATCG\t1\tAF48\n')
+        self.assertEqual(obs, exp)
+        # wells beyond 1536-well plate are invalid
+        with open(primer_fp, 'a') as f:
+            f.write('%s\n' % '\t'.join(('', 'GCTAATCG', 'ATCG', '1', 'AG1')))
+        with self.assertRaises(ValueError) as context:
+            plate_linker(open(metadata_fp, 'r'), open(primer_fp, 'r'),
+                         open(obs_output_fp, 'w'))
+        err = ('Error: invalid well identifier: 1.AG1.')
+        self.assertEqual(str(context.exception), err)
+
         # test error when some samples correspond to non-existent primers
         metadata_fp = join(self.wkdir, 'metadata.txt')
         with open(metadata_fp, 'w') as f:
@@ -114,6 +151,260 @@ class PlateLinkerTests(TestCase):
                'sp003, sp004.')
         self.assertEqual(str(context.exception), err)
 
+    def test_link_plates(self):
+        """Test link_plates."""
+        datadir = join(dirname(realpath(__file__)), 'data')
+        with open(join(datadir, 'metadata.txt'), 'r') as f:
+            metadata = f.read().splitlines()
+        with open(join(datadir, 'primer.txt'), 'r') as f:
+            # rows as parsed fields
+            primers = [x.split('\t') for x in f.read().splitlines()]
+        with open(join(datadir, 'exp_output.txt'), 'r') as f:
+            exp = f.read()
+        for engine in ('hash', 'merge'):
+            result = Result()
+            records = link_plates(metadata, primers, engine, result)
+            # header is available before iterating
+            self.assertListEqual(result.header, exp.split('\n')[0].split(
+                '\t'))
+            obs = '\t'.join(result.header) + '\n' + ''.join(
+                x.line() for x in records)
+            self.assertEqual(obs, exp)
+            self.assertListEqual(result.errors, [])
+            self.assertEqual(result.stats.counters['rows'],
+                             exp.count('\n') - 1)
+        # inputs are not modified
+        self.assertEqual(primers[1][0], '')
+        # records
+        rec = next(link_plates(iter(metadata), primers))
+        self.assertEqual(rec.sample, 'sp001')
+        self.assertEqual(rec.well, 'A1')
+        self.assertTupleEqual(rec.metadata, ('QZ', '8/15/16'))
+
+        # samples without matched primers are reported in result
+        result = Result()
+        records = list(link_plates(metadata, primers[:3], 'hash', result))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(len(result.missing), 17)
+        self.assertTrue(result.errors[0].startswith(
+            'Error: the following samples do not have matched primers: '))
+
+        # invalid header is reported immediately
+        with self.assertRaises(ValueError) as context:
+            link_plates(['a\tb'], primers)
+        err = 'Error: metadata table must have at least three columns.'
+        self.assertEqual(str(context.exception), err)
+
+    def test_plate_linker_barcode_dist(self):
+        """Test barcode check of plate_linker."""
+        datadir = join(dirname(realpath(__file__)), 'data')
+        with open(join(datadir, 'primer.txt'), 'r') as f:
+            primers = f.read().splitlines(True)
+        # give well A2 of plate 1 the barcode of well A1
+        primers[2] = primers[2].replace('TCCATACCGGAA', 'AGCCTTCGTCGC')
+        primer_fp = join(self.wkdir, 'primer.txt')
+        with open(primer_fp, 'w') as f:
+            f.write(''.join(primers))
+        with catch_warnings(record=True) as w:
+            simplefilter('always')
+            stats = plate_linker(open(join(datadir, 'metadata.txt'), 'r'),
+                                 open(primer_fp, 'r'),
+                                 open(join(self.wkdir, 'out.txt'), 'w'),
+                                 stats=RunStats(quiet=True), barcode_dist=1)
+            msg = '  Duplicated barcodes: AGCCTTCGTCGC (1.A1 1.A2).\n'
+            self.assertIn(msg, str(w[-1].message))
+        self.assertEqual(stats.counters['duplicated_barcodes'], 1)
+        self.assertEqual(stats.counters['similar_barcodes'], 0)
+
+    def test_plate_linker_engines(self):
+        """Test plate_linker with merge join engine."""
+        datadir = join(dirname(realpath(__file__)), 'data')
+        with open(join(datadir, 'exp_output.txt'), 'r') as f:
+            exp = f.read()
+        obs_output_fp = join(self.wkdir, 'obs_output.txt')
+        # sorted inputs are joined in a single pass, and joined rows beyond
+        # a chunk are held back on disk
+        metadata_f = open(join(datadir, 'metadata.txt'), 'r')
+        primer_f = open(join(datadir, 'primer.txt'), 'r')
+        with patch.object(metadata_f, 'seek', wraps=metadata_f.seek) as m, \
+                patch.object(primer_f, 'seek', wraps=primer_f.seek) as p, \
+                patch('plate_linker.plate_linker._chunk_size', 4):
+            plate_linker(metadata_f, primer_f, open(obs_output_fp, 'w'),
+                         engine='merge')
+            self.assertEqual(m.call_count, 1)
+            self.assertEqual(p.call_count, 1)
+        with open(obs_output_fp, 'r') as f:
+            obs = f.read()
+        self.assertEqual(obs, exp)
+
+        # unsorted inputs are sorted on disk in chunks, and output follows
+        # the order of the primer file
+        metadata_fp = join(self.wkdir, 'metadata.txt')
+        with open(join(datadir, 'metadata.txt'), 'r') as f, \
+                open(metadata_fp, 'w') as g:
+            lines = f.readlines()
+            g.writelines([lines[0]] + lines[:0:-1])
+        primer_fp = join(self.wkdir, 'primer.txt')
+        with open(join(datadir, 'primer.txt'), 'r') as f, \
+                open(primer_fp, 'w') as g:
+            lines = f.readlines()
+            g.writelines([lines[0]] + lines[:0:-1])
+        exp_lines = exp.splitlines(True)
+        exp = ''.join([exp_lines[0]] + exp_lines[:0:-1])
+        with patch('plate_linker.plate_linker._chunk_size', 4):
+            plate_linker(open(metadata_fp, 'r'), open(primer_fp, 'r'),
+                         open(obs_output_fp, 'w'), engine='merge')
+        with open(obs_output_fp, 'r') as f:
+            obs = f.read()
+        self.assertEqual(obs, exp)
+
+        # inputs found out of order late in the join are read again
+        with open(join(datadir, 'metadata.txt'), 'r') as f, \
+                open(metadata_fp, 'w') as g:
+            lines = f.readlines()
+            g.writelines(lines[:-2] + lines[:-3:-1])
+        for engine in ('hash', 'merge'):
+            plate_linker(open(metadata_fp, 'r'),
+                         open(join(datadir, 'primer.txt'), 'r'),
+                         open(obs_output_fp, 'w'), engine=engine)
+            with open(obs_output_fp, 'r') as f:
+                obs = f.read()
+            if engine == 'hash':
+                exp = obs
+        self.assertEqual(obs, exp)
+
+        # missing primers are reported as in hash join
+        with open(metadata_fp, 'w') as f:
+            f.write('%s\n' % '\t'.join(('Sample', 'Plate', 'Well')))
+            f.write('%s\n' % '\t'.join(('sp004', '5', 'A1')))
+            f.write('%s\n' % '\t'.join(('sp003', '1', 'F4')))
+            f.write('%s\n' % '\t'.join(('sp001', '1', 'A1')))
+        with self.assertRaises(ValueError) as context:
+            plate_linker(open(metadata_fp, 'r'),
+                         open(join(datadir, 'primer.txt'), 'r'),
+                         open(obs_output_fp, 'w'), engine='merge')
+        err = ('Error: the following samples do not have matched primers: '
+               'sp003, sp004.')
+        self.assertEqual(str(context.exception), err)
+
+        # test error when engine is invalid
+        with self.assertRaises(ValueError) as context:
+            plate_linker(None, None, None, engine='nested')
+        err = 'Error: invalid join engine: nested.'
+        self.assertEqual(str(context.exception), err)
+
+    def test_plate_linker_padded_wells(self):
+        """Test plate_linker with zero-padded well IDs."""
+        metadata_fp = join(self.wkdir, 'metadata.txt')
+        with open(metadata_fp, 'w') as f:
+            f.write('Sample\tPlate\tWell\tNote\n'
+                    'sp1\t1\tA01\tx\nsp2\t1\tA2\ty\nsp3\t1\tB10\tz\n')
+        primer_fp = join(self.wkdir, 'primer.txt')
+        with open(primer_fp, 'w') as f:
+            f.write('Sample\tBarcode\tPrimer\tPlate\tWell\n'
+                    '\tAAAA\tATCG\t1\tA1\n\tCCCC\tATCG\t1\tA02\n'
+                    '\tGGGG\tATCG\t1\tB10\n\tTTTT\tATCG\t1\tC1\n')
+        exp = ('Sample\tBarcode\tPrimer\tPlate\tWell\tNote\n'
+               'sp1\tAAAA\tATCG\t1\tA1\tx\nsp2\tCCCC\tATCG\t1\tA02\ty\n'
+               'sp3\tGGGG\tATCG\t1\tB10\tz\n')
+        output_fp = join(self.wkdir, 'output.txt')
+        # A01 is well A1, and wells of primers are written as they are
+        for engine in ('hash', 'merge'):
+            plate_linker(open(metadata_fp, 'r'), open(primer_fp, 'r'),
+                         open(output_fp, 'w'), engine, RunStats(quiet=True))
+            with open(output_fp, 'r') as f:
+                self.assertEqual(f.read(), exp)
+        with open(metadata_fp, 'a') as f:
+            f.write('sp4\t1\tA00\tw\n')
+        with self.assertRaisesRegex(ValueError, 'invalid well identifier: '
+                                                '1.A00'):
+            plate_linker(open(metadata_fp, 'r'), open(primer_fp, 'r'),
+                         open(output_fp, 'w'), 'hash', RunStats(quiet=True))
+
+    def test_plate_linker_multi(self):
+        """Test plate_linker_multi."""
+        datadir = join(dirname(realpath(__file__)), 'data')
+        with open(join(datadir, 'metadata.txt'), 'r') as f:
+            lines = f.readlines()
+        with open(join(datadir, 'exp_output.txt'), 'r') as f:
+            exp_lines = f.readlines()
+        # split metadata into two studies by primer plate
+        metadata_fps, output_fps = [], []
+        for plate in ('1', '3'):
+            fp = join(self.wkdir, 'metadata_%s.txt' % plate)
+            with open(fp, 'w') as f:
+                f.writelines([lines[0]] + [x for x in lines[1:]
+                                           if x.split('\t')[1] == plate])
+            metadata_fps.append(fp)
+            output_fps.append(join(self.wkdir, 'output_%s.txt' % plate))
+        stats = plate_linker_multi([open(x, 'r') for x in metadata_fps],
+                                   open(join(datadir, 'primer.txt'), 'r'),
+                                   [open(x, 'w') for x in output_fps],
+                                   stats=RunStats(quiet=True))
+        for plate, fp in zip(('1', '3'), output_fps):
+            with open(fp, 'r') as f:
+                obs = f.read()
+            exp = ''.join([exp_lines[0]] + [x for x in exp_lines[1:]
+                                            if x.split('\t')[3] == plate])
+            self.assertEqual(obs, exp)
+        self.assertDictEqual(stats.counters, {'tables': 2,
+                                              'rows': len(exp_lines) - 1,
+                                              'missing': 0})
+        self.assertListEqual([x['name'] for x in stats.phases],
+                             ['index_metadata', 'fan_out_join'])
+
+        # test error when a well is in more than one table
+        with open(metadata_fps[1], 'a') as f:
+            f.write('%s\n' % '\t'.join(('sp099', '1', 'A2', 'QZ', '')))
+        with self.assertRaises(ValueError) as context:
+            plate_linker_multi([open(x, 'r') for x in metadata_fps],
+                               open(join(datadir, 'primer.txt'), 'r'),
+                               [open(x, 'w') for x in output_fps],
+                               stats=RunStats(quiet=True))
+        err = ('Error: the following wells are in more than one metadata '
+               'table: 1.A2 (%s).' % ', '.join(metadata_fps))
+        self.assertEqual(str(context.exception), err)
+
+        # test error when samples do not have matched primers
+        with open(metadata_fps[1], 'w') as f:
+            f.write(lines[0])
+            f.write('%s\n' % '\t'.join(('sp099', '5', 'A1', 'QZ', '')))
+        with self.assertRaises(ValueError) as context:
+            plate_linker_multi([open(x, 'r') for x in metadata_fps],
+                               open(join(datadir, 'primer.txt'), 'r'),
+                               [open(x, 'w') for x in output_fps],
+                               stats=RunStats(quiet=True))
+        err = ('Error: the following samples do not have matched primers: '
+               '%s: sp099.' % metadata_fps[1])
+        self.assertEqual(str(context.exception), err)
+
+        # test error when numbers of files differ
+        with self.assertRaises(ValueError) as context:
+            plate_linker_multi([None, None], None, [None])
+        err = 'Error: numbers of metadata and output files differ.'
+        self.assertEqual(str(context.exception), err)
+
+    def test_plate_linker_w_index(self):
+        """Test plate_linker with compiled barcode sequence template."""
+        datadir = join(dirname(realpath(__file__)), 'data')
+        # template equivalent to primer file, without sample ID column
+        barseq_fp = join(self.wkdir, 'barseq.txt')
+        with open(join(datadir, 'primer.txt'), 'r') as f, \
+                open(barseq_fp, 'w') as g:
+            for line in f:
+                g.write(line.split('\t', 1)[1])
+        index_fp = join(self.wkdir, 'barseq.bsi')
+        compile_index(open(barseq_fp, 'r'), index_fp)
+        metadata_f = open(join(datadir, 'metadata.txt'), 'r')
+        obs_output_fp = join(self.wkdir, 'obs_output.txt')
+        plate_linker(metadata_f, BarseqIndex(index_fp),
+                     open(obs_output_fp, 'w'))
+        with open(obs_output_fp, 'r') as f:
+            obs = f.read()
+        with open(join(datadir, 'exp_output.txt'), 'r') as f:
+            exp = f.read()
+        self.assertEqual(obs, exp)
+
 
 if __name__ == '__main__':
     main()
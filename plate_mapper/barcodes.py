@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import json
+import argparse
+from operator import ne
+from itertools import combinations
+from plate_mapper.fileio import FileArg
+
+
+def hamming(a, b):
+    """Calculate Hamming distance between two strings of equal length.
+
+    Parameters
+    ----------
+    a : str
+        First string
+    b : str
+        Second string
+
+    Returns
+    -------
+    int
+        Number of positions at which the strings differ
+    """
+    return sum(map(ne, a, b))
+
+
+def _segments(n, k):
+    """Split a length into k + 1 nearly equal segments.
+
+    Parameters
+    ----------
+    n : int
+        Length
+    k : int
+        Maximum Hamming distance
+
+    Returns
+    -------
+    list of tuple of (int, int)
+        Start and end of each segment
+    """
+    bounds = [i * n // (k + 1) for i in range(k + 2)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def find_collisions(barcodes, k=1):
+    """Find duplicated and similar barcodes.
+
+    Parameters
+    ----------
+    barcodes : iterable of tuple of (str, str)
+        Barcode and a label of where it is used, such as a well
+    k : int (optional)
+        Maximum Hamming distance of pairs to report (default: 1)
+
+    Returns
+    -------
+    dict of list of str
+        Barcode : labels, for barcodes used more than once
+    list of tuple of (str, str, int)
+        Pairs of distinct barcodes within Hamming distance k, and their
+        distance, sorted
+
+    Notes
+    -----
+    Only barcodes of equal length are compared. By the pigeonhole principle,
+    if two barcodes split into k + 1 segments differ at no more than k
+    positions, they are identical in at least one segment. Barcodes are
+    therefore indexed by each of their segments, and only barcodes sharing a
+    segment are compared, instead of all pairs.
+    """
+    uses = {}  # barcode : labels
+    for barcode, label in barcodes:
+        uses.setdefault(barcode, []).append(label)
+    duplicates = {x: v for x, v in uses.items() if len(v) > 1}
+    pairs = {}  # (barcode, barcode) : distance
+    if k > 0:
+        buckets = {}  # (length, segment number, segment) : barcodes
+        for barcode in uses:
+            n = len(barcode)
+            for i, (start, end) in enumerate(_segments(n, k)):
+                buckets.setdefault((n, i, barcode[start:end]), []).append(
+                    barcode)
+        for bucket in buckets.values():
+            for a, b in combinations(bucket, 2):
+                if a > b:
+                    a, b = b, a
+                if (a, b) not in pairs:
+                    d = hamming(a, b)
+                    if d <= k:
+                        pairs[(a, b)] = d
+    return duplicates, sorted((a, b, d) for (a, b), d in pairs.items())
+
+
+def collect_barcodes(rows, barcodes):
+    """Collect barcodes assigned to samples while passing rows through.
+
+    Parameters
+    ----------
+    rows : iterable of tuple of (sequence of str, str)
+        Fields and rendered metadata of mapping rows
+    barcodes : list
+        List to append (barcode, well) of each row with a sample ID to
+
+    Yields
+    ------
+    tuple of (sequence of str, str)
+        The same rows
+    """
+    for row in rows:
+        fields = row[0]
+        if fields[0]:
+            barcodes.append((fields[1], '%s.%s' % (fields[3], fields[4])))
+        yield row
+
+
+def check_barcodes(barcodes, k, result):
+    """Check barcodes assigned to samples for collisions.
+
+    Parameters
+    ----------
+    barcodes : list of tuple of (str, str)
+        Barcode and well
+    k : int
+        Maximum Hamming distance of barcodes to report as similar
+    result : Result
+        Result to record collisions, their counts and the warning message
+        into
+    """
+    from plate_mapper.plate_mapper import _print_list
+    stats = result.stats
+    with stats.phase('check_barcodes', 'Checking barcodes'):
+        result.duplicates, result.similar = find_collisions(barcodes, k)
+    stats.count('duplicated_barcodes', len(result.duplicates))
+    stats.count('similar_barcodes', len(result.similar))
+    warning = ''
+    if result.duplicates:
+        warning += '  Duplicated barcodes: %s.\n' % _print_list(
+            ['%s (%s)' % (x, ' '.join(result.duplicates[x]))
+             for x in sorted(result.duplicates)])
+    if result.similar:
+        warning += '  Similar barcodes: %s.\n' % _print_list(
+            ['%s/%s' % (a, b) for a, b, d in result.similar])
+    if warning:
+        stats.warnings.append(warning)
+
+
+def _read_barcodes(input_f, column=1, header=True):
+    """Read barcodes from a column of a tab-delimited file.
+
+    Parameters
+    ----------
+    input_f : file object
+        Input file, such as a barcode sequence template or a mapping file
+    column : int (optional)
+        Column number of barcodes, starting from 1 (default: 1)
+    header : bool (optional)
+        Whether the first line is a header (default: true)
+
+    Yields
+    ------
+    tuple of (str, str)
+        Barcode and line number
+    """
+    for i, line in enumerate(input_f, 1):
+        if header and i == 1:
+            continue
+        l = line.rstrip('\r\n').split('\t')
+        if len(l) >= column and l[column - 1]:
+            yield l[column - 1], 'line %d' % i
+
+
+def write_collisions(duplicates, pairs, report_fp):
+    """Write barcode collisions to a JSON file.
+
+    Parameters
+    ----------
+    duplicates : dict of list of str
+        Duplicated barcodes returned by `find_collisions`
+    pairs : list of tuple of (str, str, int)
+        Similar barcodes returned by `find_collisions`
+    report_fp : str
+        Output report file path
+    """
+    report = {'duplicates': duplicates,
+              'pairs': [{'barcodes': [a, b], 'distance': d}
+                        for a, b, d in pairs]}
+    with open(report_fp, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def main(argv=None, prog=None):
+    """Run the barcode check from the command line.
+
+    Parameters
+    ----------
+    argv : list of str (optional)
+        Command-line arguments (default: those of the process)
+    prog : str (optional)
+        Program name shown in usage (default: that of the script)
+    """
+    # Welcome information
+    print('Barcode Check: Find duplicated and similar barcodes.')
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('-i', '--input', type=FileArg('r'),
+                        help='barcode sequence template or mapping file',
+                        required=True)
+    parser.add_argument('-c', '--column', type=int, default=1,
+                        help='column number of barcodes (default: 1)')
+    parser.add_argument('--no-header', action='store_true',
+                        help='first line is not a header')
+    parser.add_argument('-d', '--distance', type=int, default=1,
+                        help='maximum Hamming distance of barcodes to report '
+                             '(default: 1)')
+    parser.add_argument('-o', '--output',
+                        help='(optional) JSON report file',
+                        required=False, default=None)
+    args = parser.parse_args(argv)
+    duplicates, pairs = find_collisions(
+        _read_barcodes(args.input, args.column, not args.no_header),
+        args.distance)
+    args.input.close()
+    for x in sorted(duplicates):
+        print('Duplicated: %s (%s)' % (x, ', '.join(duplicates[x])))
+    for a, b, d in pairs:
+        print('Similar: %s %s (distance %d)' % (a, b, d))
+    print('%d duplicated barcodes, %d pairs within distance %d.'
+          % (len(duplicates), len(pairs), args.distance))
+    if args.output:
+        write_collisions(duplicates, pairs, args.output)
+    if duplicates or pairs:
+        parser.exit(1)
+
+
+if __name__ == "__main__":
+    main()
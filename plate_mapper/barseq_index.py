@@ -0,0 +1,333 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import os
+import sys
+import mmap
+import struct
+from array import array
+from plate_mapper.fileio import AtomicFile, open_file, _mkstemp
+
+
+# file layout: header, segments, segment table
+#   header: magic, version, SHA-256 of template, number of records, number of
+#           segments, offset of segment table
+#   segments: template header columns, then for each block of up to `_BLOCK`
+#             records, two segments per column (barcode, primer, primer plate
+#             and well): its distinct values, as UTF-8 encoded text joined by
+#             tabs, and the index of the value of each record into them, as
+#             unsigned 16-bit little-endian integers, which are left out if
+#             all values of the column in the block are distinct
+#   segment table: unsigned 64-bit little-endian integers marking the end of
+#                  each segment
+_MAGIC = b'WLBI'
+_VERSION = 2
+_HEADER = struct.Struct('<4sH32sIIQ')
+_BLOCK = 65536  # so that value indices fit in 16 bits
+_SUFFIX = '.bsi'
+_STAMP = '.stamp'
+_NATIVE = sys.byteorder == 'little'
+
+
+def _hash_file(fp, size=1 << 20):
+    """Calculate SHA-256 digest of a file.
+
+    Parameters
+    ----------
+    fp : str
+        File path
+    size : int (optional)
+        Chunk size in bytes (default: 1 MiB)
+
+    Returns
+    -------
+    bytes
+        SHA-256 digest
+    """
+    import hashlib
+    h = hashlib.sha256()
+    with open(fp, 'rb') as f:
+        for chunk in iter(lambda: f.read(size), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def _write_block(f, rows, ends):
+    """Write a block of records, column by column.
+
+    Parameters
+    ----------
+    f : file object
+        Index file, opened in binary mode
+    rows : list of list of str
+        Records
+    ends : list of int
+        Ends of segments, to be appended to
+    """
+    for col in zip(*rows):
+        values = {}
+        codes = array('H', [values.setdefault(x, len(values)) for x in col])
+        f.write('\t'.join(values).encode('utf-8'))
+        ends.append(f.tell())
+        if len(values) < len(codes):
+            if not _NATIVE:
+                codes.byteswap()
+            f.write(codes.tobytes())
+        ends.append(f.tell())
+
+
+def compile_index(barseq_f, index_fp, digest=b'\0' * 32):
+    """Compile a barcode sequence template file into a binary index.
+
+    Parameters
+    ----------
+    barseq_f : file object
+        Barcode sequence template file
+    index_fp : str
+        Output index file path
+    digest : bytes (optional)
+        SHA-256 digest of the template file, stored for validation
+
+    Raises
+    ------
+    ValueError
+        If a template row does not have exactly four columns.
+
+    Notes
+    -----
+    The index is written to a temporary file in the same directory and then
+    renamed into place, so that concurrent readers never see a partial index.
+    Records are written in blocks as they are read, so that a template of any
+    size is compiled in bounded memory.
+    """
+    tmp_fp = _mkstemp(index_fp)
+    try:
+        with barseq_f, open(tmp_fp, 'wb') as f:
+            f.write(b'\0' * _HEADER.size)
+            header = barseq_f.readline().rstrip('\r\n')
+            f.write(header.encode('utf-8'))
+            ends = [f.tell()]
+            rows, n = [], 0
+            for line in barseq_f:
+                line = line.rstrip()
+                if not line:
+                    continue
+                l = line.split('\t')
+                if len(l) != 4:
+                    raise ValueError('Error: invalid template row: %s.'
+                                     % line)
+                rows.append(l)
+                if len(rows) == _BLOCK:
+                    _write_block(f, rows, ends)
+                    n += len(rows)
+                    rows = []
+            if rows:
+                _write_block(f, rows, ends)
+                n += len(rows)
+            f.write(struct.pack('<%dQ' % len(ends), *ends))
+            f.seek(0)
+            f.write(_HEADER.pack(_MAGIC, _VERSION, digest, n, len(ends),
+                                 ends[-1]))
+    except BaseException:
+        os.remove(tmp_fp)
+        raise
+    os.replace(tmp_fp, index_fp)
+
+
+class BarseqIndex(object):
+    """Memory-mapped compiled barcode sequence template.
+
+    Parameters
+    ----------
+    index_fp : str
+        Index file path
+
+    Attributes
+    ----------
+    header : list of str
+        Column headers of the template file
+    digest : bytes
+        SHA-256 digest of the template file
+
+    Raises
+    ------
+    ValueError
+        If the file is not an index of this version.
+
+    Notes
+    -----
+    Iterating over the index yields (barcode, primer, primer plate ID,
+    well ID) tuples in template order, so it can be used wherever the rows of
+    a template file are expected. The distinct values of each column of a
+    block are decoded and split in one call, and records refer to them, so
+    that only as many strings are made as there are distinct values, and
+    reading the index costs less than parsing the template.
+    """
+
+    def __init__(self, index_fp):
+        with open(index_fp, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.digest, self._n, nsegs, table = \
+                _HEADER.unpack_from(self._mm)
+            if magic != _MAGIC or version != _VERSION or nsegs % 8 != 1:
+                raise ValueError()
+            ends = struct.unpack_from('<%dQ' % nsegs, self._mm, table)
+        except (struct.error, ValueError):
+            self._mm.close()
+            raise ValueError('Error: invalid index file: %s.' % index_fp)
+        self._segs = list(zip((_HEADER.size,) + ends[:-1], ends))
+        self.header = self._values(0)
+
+    def _values(self, i):
+        """Decode and split the values of the i-th segment."""
+        start, end = self._segs[i]
+        return self._mm[start:end].decode('utf-8').split('\t')
+
+    def _column(self, i):
+        """Read the values of a column of a block, from its i-th segment."""
+        values = self._values(i)
+        start, end = self._segs[i + 1]
+        if start == end:  # all distinct
+            return values
+        codes = array('H')
+        codes.frombytes(self._mm[start:end])
+        if not _NATIVE:
+            codes.byteswap()
+        return map(values.__getitem__, codes)
+
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        for i in range(1, len(self._segs), 8):
+            yield from zip(*[self._column(j) for j in range(i, i + 8, 2)])
+
+    def close(self):
+        """Release the memory map."""
+        self._mm.close()
+
+
+def _stamp_fp(barseq_fp, index_dir):
+    """Get the path of the stamp file of a template file.
+
+    Parameters
+    ----------
+    barseq_fp : str
+        Barcode sequence template file path
+    index_dir : str
+        Directory of index files
+
+    Returns
+    -------
+    str
+        Stamp file path: a hidden file in the index directory, named after
+        the template file and a digest of its absolute path
+    """
+    import hashlib
+    barseq_fp = os.path.abspath(barseq_fp)
+    key = hashlib.sha256(barseq_fp.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(index_dir, '.%s.%s%s' % (
+        os.path.basename(barseq_fp), key, _STAMP))
+
+
+def _read_stamp(stamp_fp, st):
+    """Read the template digest recorded in a stamp file.
+
+    Parameters
+    ----------
+    stamp_fp : str
+        Stamp file path
+    st : os.stat_result
+        Current status of the template file
+
+    Returns
+    -------
+    bytes or None
+        SHA-256 digest of the template, or None if the stamp is missing or
+        invalid, or the size or modification time of the template differs
+    """
+    try:
+        with open(stamp_fp, 'r') as f:
+            size, mtime, digest = f.read().split()
+        if (int(size), int(mtime)) == (st.st_size, st.st_mtime_ns) and \
+                len(digest) == 64:
+            return bytes.fromhex(digest)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _write_stamp(stamp_fp, st, digest):
+    """Record the digest of a template file in a stamp file.
+
+    Parameters
+    ----------
+    stamp_fp : str
+        Stamp file path
+    st : os.stat_result
+        Status of the template file when it was hashed
+    digest : bytes
+        SHA-256 digest of the template
+    """
+    with AtomicFile(stamp_fp) as f:
+        f.write('%d\t%d\t%s\n' % (st.st_size, st.st_mtime_ns, digest.hex()))
+
+
+def load_index(barseq_fp, index_dir=None):
+    """Load the compiled index of a template file, building it if needed.
+
+    Parameters
+    ----------
+    barseq_fp : str
+        Barcode sequence template file path
+    index_dir : str (optional)
+        Directory of index files (default: same directory as template)
+
+    Returns
+    -------
+    BarseqIndex
+        Compiled index
+
+    Notes
+    -----
+    Index files are named after the SHA-256 digest of the template content,
+    therefore any change to the template leads to a new index. An index that
+    cannot be read, or whose recorded digest does not match, is rebuilt.
+
+    The digest is recorded in a stamp file along with the size and
+    modification time of the template, so that the template is only hashed
+    again once either of them changes.
+    """
+    st = os.stat(barseq_fp)
+    if index_dir is None:
+        index_dir = os.path.dirname(os.path.abspath(barseq_fp))
+    elif not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+    stamp_fp = _stamp_fp(barseq_fp, index_dir)
+    digest = _read_stamp(stamp_fp, st)
+    stamped = digest is not None
+    if not stamped:
+        digest = _hash_file(barseq_fp)
+    index_fp = os.path.join(index_dir, digest.hex() + _SUFFIX)
+    if os.path.isfile(index_fp):
+        try:
+            index = BarseqIndex(index_fp)
+        except ValueError:
+            pass
+        else:
+            if index.digest == digest:
+                if not stamped:
+                    _write_stamp(stamp_fp, st, digest)
+                return index
+            index.close()
+    compile_index(open_file(barseq_fp), index_fp, digest)
+    if not stamped:
+        _write_stamp(stamp_fp, st, digest)
+    return BarseqIndex(index_fp)
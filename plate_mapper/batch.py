@@ -0,0 +1,289 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import os
+import argparse
+from collections import Counter
+from multiprocessing import Pool
+from plate_mapper.fileio import FileArg, open_file, split_ext
+from plate_mapper.plate_mapper import (_read_plate_map, _read_special,
+                                       _read_barseq, _resolve, _format_row,
+                                       _check_repeated, _warn_list)
+from plate_mapper.stats import RunStats
+
+
+# barcode sequence template rows, special sample definitions and whether to
+# keep empty lines, shared by all plate maps in a batch
+_shared = None
+
+
+def _init_worker(shared):
+    """Store shared inputs in a worker process.
+
+    Parameters
+    ----------
+    shared : tuple
+        Template rows, special sample definitions and empty flag
+    """
+    global _shared
+    _shared = shared
+
+
+def _convert(input_fp):
+    """Convert one plate map file using the shared inputs.
+
+    Parameters
+    ----------
+    input_fp : str
+        Input plate map file path
+
+    Returns
+    -------
+    tuple of (str, list of str, str, str, dict of int)
+        Input file path, output lines, warning message, error message and
+        counters (see `plate_mapper`)
+    """
+    barseqs, specs, empty = _shared
+    try:
+        with open_file(input_fp) as f:
+            plates = _read_plate_map(f)
+        counts = Counter()
+        tally = {}
+        lines = [_format_row(fields, suffix) for fields, suffix in
+                 _resolve(barseqs, plates, specs, counts, empty, tally)]
+    except (ValueError, OSError) as e:
+        return input_fp, [], '', str(e), {}
+    except Exception as e:
+        # any failure of one plate map is reported, not raised in the pool
+        return input_fp, [], '', 'Error: %s: %s.' % (type(e).__name__, e), {}
+    repeated = _check_repeated(counts)
+    tally.update(plates=len(plates), repeated=len(repeated),
+                 wells=sum(len(x.cells) - x.cells.count(None)
+                           for x in plates.values()))
+    return input_fp, lines, _warn_list('Repeated', repeated), '', tally
+
+
+def _list_inputs(inputs):
+    """Expand directories into the plate map files they contain.
+
+    Parameters
+    ----------
+    inputs : list of str
+        Plate map file paths and/or directories
+
+    Returns
+    -------
+    list of str
+        Plate map file paths
+
+    Notes
+    -----
+    Files in a directory are sorted by name, and hidden files are skipped.
+    Explicitly listed files are kept in the given order.
+    """
+    res = []
+    for fp in inputs:
+        if os.path.isdir(fp):
+            res.extend(os.path.join(fp, x) for x in sorted(os.listdir(fp))
+                       if not x.startswith('.') and
+                       os.path.isfile(os.path.join(fp, x)))
+        else:
+            res.append(fp)
+    return res
+
+
+def _output_fp(input_fp, output_dir):
+    """Generate output mapping file path for a plate map file.
+
+    A compressed plate map file gets an output file compressed the same way.
+    """
+    root, ext = split_ext(os.path.basename(input_fp))
+    stem = os.path.splitext(root)[0]
+    return os.path.join(output_dir, '%s_mapping.txt%s' % (stem, ext))
+
+
+def plate_mapper_batch(inputs, barseq_f, output_dir=None, merged_f=None,
+                       special_f=None, empty=False, processes=None,
+                       stats=None):
+    """Convert multiple plate map files into mapping files in parallel.
+
+    Parameters
+    ----------
+    inputs : list of str
+        Input plate map file paths and/or directories containing them
+    barseq_f : file object or BarseqIndex
+        Barcode sequence template file, or its compiled index
+    output_dir : str (optional)
+        Directory to write one mapping file per plate map
+    merged_f : file object (optional)
+        Output mapping file merged from all plate maps
+    special_f : file object (optional)
+        Special sample definition file
+    empty : bool (optional)
+        Whether to keep empty lines in mapping file (default: false)
+    processes : int (optional)
+        Number of worker processes (default: number of CPUs)
+    stats : RunStats (optional)
+        Statistics to record the run into, which also controls progress
+        messages; counters are summed over converted plate maps
+
+    Returns
+    -------
+    dict of str
+        Input file path : error message, for plate maps that failed
+
+    Raises
+    ------
+    ValueError
+        If neither output directory nor merged output file is specified.
+
+    Notes
+    -----
+    The barcode sequence template and the special sample definitions are
+    read only once and shared by all worker processes. Outputs are written in
+    the order of the inputs regardless of which worker finishes first. A plate
+    map that fails to convert is reported and skipped, without affecting the
+    rest of the batch. So is a plate map whose output file in the output
+    directory would be that of an earlier one, such as a/p1.txt and b/p1.txt,
+    or p1.txt and p1.tsv.
+    """
+    if output_dir is None and merged_f is None:
+        raise ValueError('Error: either output directory or merged output '
+                         'file must be specified.')
+    if stats is None:
+        stats = RunStats()
+    input_fps = _list_inputs(inputs)
+
+    # Read shared inputs
+    with stats.phase('read_barseq', 'Reading barcode sequence template file'):
+        barseqs = list(_read_barseq(barseq_f))
+        barseq_f.close()
+    specs = {}
+    if special_f:
+        with stats.phase('read_special',
+                         'Reading special sample definitions'):
+            specs = _read_special(special_f)
+            special_f.close()
+    shared = (barseqs, specs, empty)
+
+    # Skip plate maps whose output files collide with earlier ones
+    errors = {}
+    todo = input_fps
+    if output_dir is not None:
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        owners = {}  # output file path : input file path
+        todo = []
+        for input_fp in input_fps:
+            output_fp = _output_fp(input_fp, output_dir)
+            if output_fp in owners:
+                errors[input_fp] = ('Error: output file %s is also that of '
+                                    '%s.' % (output_fp, owners[output_fp]))
+                stats.log('  %s: %s' % (input_fp, errors[input_fp]))
+            else:
+                owners[output_fp] = input_fp
+                todo.append(input_fp)
+
+    # Convert plate maps in parallel, and collect results in input order
+    stats.log('Converting %d plate map files...' % len(input_fps))
+    if processes == 1:
+        _init_worker(shared)
+        results = map(_convert, todo)
+        pool = None
+    else:
+        pool = Pool(processes, _init_worker, (shared,))
+        results = pool.imap(_convert, todo)
+    try:
+        with stats.phase('convert'):
+            for input_fp, lines, warning, error, tally in results:
+                if error:
+                    errors[input_fp] = error
+                    stats.log('  %s: %s' % (input_fp, error))
+                    continue
+                for key, n in tally.items():
+                    stats.count(key, n)
+                if output_dir is not None:
+                    with open_file(_output_fp(input_fp, output_dir),
+                                   'w') as f:
+                        f.writelines(lines)
+                if merged_f is not None:
+                    merged_f.writelines(lines)
+                if warning:
+                    stats.warnings.append(warning)
+                    stats.log('  %s: Warning:\n%s'
+                              % (input_fp, warning.rstrip()))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if merged_f is not None:
+        merged_f.close()
+    stats.count('files', len(input_fps) - len(errors))
+    stats.count('failed', len(errors))
+    stats.log('  Done. %d of %d plate map files converted.'
+              % (len(input_fps) - len(errors), len(input_fps)))
+    return errors
+
+
+def main(argv=None, prog=None):
+    """Run plate_mapper_batch from the command line.
+
+    Parameters
+    ----------
+    argv : list of str (optional)
+        Command-line arguments (default: those of the process)
+    prog : str (optional)
+        Program name shown in usage (default: that of the script)
+    """
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('-i', '--input', nargs='+',
+                        help='input plate map files or directories',
+                        required=True)
+    parser.add_argument('-t', '--barseq', type=FileArg('r'),
+                        help='barcode sequence template file', required=True)
+    parser.add_argument('-d', '--outdir',
+                        help='output directory of mapping files',
+                        required=False, default=None)
+    parser.add_argument('-o', '--output', type=FileArg('w'),
+                        help='merged output mapping file',
+                        required=False, default=None)
+    parser.add_argument('-s', '--special', type=FileArg('r'),
+                        help='(optional) special sample definition file',
+                        required=False, default=None)
+    parser.add_argument('-e', '--empty', action='store_true',
+                        help='keep empty lines in mapping file')
+    parser.add_argument('-p', '--processes', type=int,
+                        help='(optional) number of worker processes',
+                        required=False, default=None)
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not print progress messages')
+    parser.add_argument('--stats',
+                        help='(optional) write phase timings, peak memory '
+                             'and counters to this JSON file',
+                        required=False, default=None)
+    args = parser.parse_args(argv)
+    if args.outdir is None and args.output is None:
+        parser.error('at least one of -d/--outdir and -o/--output is '
+                     'required')
+    stats = RunStats(args.quiet, memory=args.stats is not None)
+    # Welcome information
+    stats.log('Plate Mapper (batch mode): Convert multiple plate map files '
+              'into mapping files.')
+    errors = plate_mapper_batch(args.input, args.barseq, args.outdir,
+                                args.output, args.special, args.empty,
+                                args.processes, stats)
+    if args.stats:
+        stats.dump(args.stats)
+    if errors:
+        parser.exit(1)
+
+
+if __name__ == "__main__":
+    main()
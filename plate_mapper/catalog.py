@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from plate_mapper.fileio import open_file
+from plate_mapper.plate import normalize_well
+
+
+# version of the database layout; databases of other versions are rejected
+_SCHEMA_VERSION = 1
+
+# number of rows inserted at a time
+_BATCH_SIZE = 10000
+
+_SCHEMA = """
+CREATE TABLE runs (
+    id INTEGER PRIMARY KEY,
+    tool TEXT,
+    source TEXT,
+    output TEXT,
+    created REAL,
+    rows INTEGER);
+CREATE TABLE samples (
+    run INTEGER NOT NULL,
+    sample TEXT NOT NULL,
+    barcode TEXT,
+    primer TEXT,
+    primer_plate TEXT,
+    well TEXT,
+    plate_id TEXT,
+    metadata TEXT);
+CREATE INDEX runs_output ON runs (output);
+CREATE INDEX samples_sample ON samples (sample, run);
+CREATE INDEX samples_barcode ON samples (barcode);
+CREATE INDEX samples_well ON samples (primer_plate, well);
+CREATE INDEX samples_run ON samples (run);
+"""
+
+# columns of query results
+COLUMNS = ('run', 'tool', 'output', 'sample', 'barcode', 'primer',
+           'primer_plate', 'well', 'plate_id', 'metadata')
+
+_SELECT = ('SELECT s.run, r.tool, r.output, s.sample, s.barcode, s.primer, '
+           's.primer_plate, s.well, s.plate_id, s.metadata FROM samples s '
+           'JOIN runs r ON r.id = s.run')
+
+
+def _normalize(sample):
+    """Write a sample ID as the tools write it in mapping files."""
+    return sample.replace('_', '.').replace('-', '.')
+
+
+class Catalog(object):
+    """SQLite database of the rows of mapping files of many runs.
+
+    Parameters
+    ----------
+    db_fp : str
+        Database file path, created if missing
+
+    Raises
+    ------
+    ValueError
+        If the file is not a catalog of this version.
+
+    Notes
+    -----
+    Each row with a sample ID is recorded with its barcode, primer, primer
+    plate ID, well ID, plate ID (of the plate map, if known) and metadata,
+    and with the run it came from: tool, input and output file paths, time
+    and number of rows. Rows are indexed by sample ID, by barcode, and by
+    primer plate and well, so that lookups take milliseconds with millions
+    of rows.
+
+    Rows of a run are inserted in batches within one transaction, which is
+    only committed by `commit` once the run succeeded, so that a failed run
+    leaves nothing behind. Recording an output file again replaces its rows.
+    """
+
+    def __init__(self, db_fp):
+        self.db_fp = db_fp
+        self._db = sqlite3.connect(db_fp)
+        try:
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+            tables = self._db.execute(
+                'SELECT COUNT(*) FROM sqlite_master').fetchone()[0]
+        except sqlite3.DatabaseError:
+            self._db.close()
+            raise ValueError('Error: %s is not a catalog.' % db_fp)
+        if version == 0 and tables == 0:
+            self._db.executescript(_SCHEMA)
+            self._db.execute('PRAGMA user_version = %d' % _SCHEMA_VERSION)
+        elif version != _SCHEMA_VERSION:
+            self._db.close()
+            raise ValueError('Error: %s is not a catalog of version %d.'
+                             % (db_fp, _SCHEMA_VERSION))
+
+    def commit(self):
+        """Commit recorded runs."""
+        self._db.commit()
+
+    def close(self):
+        """Close the database, discarding rows of uncommitted runs."""
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def collect(self, rows, tool, source=None, output=None, plate_ids=None):
+        """Record mapping rows while passing them through.
+
+        Parameters
+        ----------
+        rows : iterable of tuple of (sequence of str, str)
+            Fields and rendered metadata of mapping rows
+        tool : str
+            Tool that generated the rows
+        source : str (optional)
+            Input file path
+        output : str (optional)
+            Output file path; rows previously recorded for it are replaced
+        plate_ids : dict of str (optional)
+            Primer plate ID : plate ID of the plate map; it may be filled
+            while rows are generated, as it is only read when they are
+
+        Yields
+        ------
+        tuple of (sequence of str, str)
+            The same rows
+
+        Notes
+        -----
+        The run is not committed (see `commit`).
+        """
+        db = self._db
+        if output is not None and output != '-':
+            output = os.path.abspath(output)
+            db.execute('DELETE FROM samples WHERE run IN (SELECT id FROM '
+                       'runs WHERE output = ?)', (output,))
+            db.execute('DELETE FROM runs WHERE output = ?', (output,))
+        if source is not None and source != '-':
+            source = os.path.abspath(source)
+        run = db.execute('INSERT INTO runs (tool, source, output, created) '
+                         'VALUES (?, ?, ?, ?)',
+                         (tool, source, output, time.time())).lastrowid
+        if plate_ids is None:
+            plate_ids = {}
+        insert = 'INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+        batch = []
+        n = 0
+        for row in rows:
+            fields, suffix = row
+            if fields[0]:
+                batch.append((run, fields[0], fields[1], fields[2],
+                              fields[3], fields[4],
+                              plate_ids.get(fields[3]),
+                              suffix[1:].rstrip('\r\n')))
+                if len(batch) == _BATCH_SIZE:
+                    db.executemany(insert, batch)
+                    n += len(batch)
+                    batch = []
+            yield row
+        db.executemany(insert, batch)
+        n += len(batch)
+        db.execute('UPDATE runs SET rows = ? WHERE id = ?', (n, run))
+
+    def add(self, rows, tool, source=None, output=None, plate_ids=None):
+        """Record mapping rows and commit them (see `collect`).
+
+        Returns
+        -------
+        int
+            Number of rows recorded
+        """
+        n = 0
+        for fields, _ in self.collect(rows, tool, source, output, plate_ids):
+            if fields[0]:
+                n += 1
+        self.commit()
+        return n
+
+    def add_file(self, fp):
+        """Record an existing mapping file.
+
+        Parameters
+        ----------
+        fp : str
+            Mapping file path, with or without column headers
+
+        Returns
+        -------
+        int
+            Number of rows recorded
+
+        Notes
+        -----
+        Column headers are recognized by the 5th column not being a well ID.
+        The tool and plate IDs are unknown.
+        """
+        with open_file(fp) as f:
+            return self.add(_read_mapping(f), None, None, fp)
+
+    def _query(self, where, args):
+        """Select rows with run information."""
+        cur = self._db.execute('%s WHERE %s ORDER BY s.run, s.rowid'
+                               % (_SELECT, where), args)
+        return [dict(zip(COLUMNS, x)) for x in cur]
+
+    def by_sample(self, sample):
+        """Find rows of a sample ID, in which "_" and "-" are read as "."."""
+        return self._query('s.sample = ?', (_normalize(sample),))
+
+    def by_barcode(self, barcode):
+        """Find rows of a barcode."""
+        return self._query('s.barcode = ?', (barcode,))
+
+    def by_well(self, plate, well):
+        """Find rows of a well by primer plate ID and well ID."""
+        return self._query('s.primer_plate = ? AND s.well = ?',
+                           (plate, well))
+
+    def duplicates(self):
+        """Find samples recorded in more than one run.
+
+        Returns
+        -------
+        list of tuple of (str, int)
+            Sample ID and number of runs, sorted by sample ID
+        """
+        return self._db.execute(
+            'SELECT sample, COUNT(DISTINCT run) AS n FROM samples GROUP BY '
+            'sample HAVING n > 1 ORDER BY sample').fetchall()
+
+    def runs(self):
+        """List recorded runs.
+
+        Returns
+        -------
+        list of dict
+            ID, tool, input and output file paths, time and number of rows
+            of each run
+        """
+        cur = self._db.execute('SELECT id, tool, source, output, created, '
+                               'rows FROM runs ORDER BY id')
+        return [dict(zip(('id', 'tool', 'source', 'output', 'created',
+                          'rows'), x)) for x in cur]
+
+
+def _read_mapping(f):
+    """Read rows of a mapping file.
+
+    Parameters
+    ----------
+    f : iterable of str
+        Lines of mapping file
+
+    Yields
+    ------
+    tuple of (list of str, str)
+        First five fields, and the remaining ones rendered as the tail of an
+        output line
+    """
+    for i, line in enumerate(f):
+        l = line.rstrip('\r\n').split('\t', 5)
+        if len(l) < 5 or i == 0 and normalize_well(l[4]) is None:
+            continue
+        yield l[:5], '\t' + l[5] + '\n' if len(l) > 5 else '\n'
+
+
+def main(argv=None, prog=None):
+    """Run catalog commands from the command line.
+
+    Parameters
+    ----------
+    argv : list of str (optional)
+        Command-line arguments (default: those of the process)
+    prog : str (optional)
+        Program name shown in usage (default: that of the script)
+
+    Returns
+    -------
+    int or None
+        1 if a query found nothing
+    """
+    parser = argparse.ArgumentParser(
+        prog=prog, description='Record mapping files in a catalog, and find '
+        'samples, barcodes and wells across runs.')
+    parser.add_argument('-d', '--db', help='catalog database file',
+                        required=True)
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+    cmd = commands.add_parser('add', help='record mapping files')
+    cmd.add_argument('files', nargs='+', help='mapping files')
+    cmd = commands.add_parser('sample', help='find rows of samples')
+    cmd.add_argument('samples', nargs='+', help='sample IDs')
+    cmd = commands.add_parser('barcode', help='find rows of barcodes')
+    cmd.add_argument('barcodes', nargs='+', help='barcode sequences')
+    cmd = commands.add_parser('well', help='find rows of a well')
+    cmd.add_argument('plate', help='primer plate ID')
+    cmd.add_argument('well', help='well ID')
+    commands.add_parser('duplicates',
+                        help='list samples recorded in more than one run')
+    commands.add_parser('runs', help='list recorded runs')
+    args = parser.parse_args(argv)
+    try:
+        catalog = Catalog(args.db)
+    except ValueError as e:
+        sys.exit(str(e))
+    with catalog:
+        if args.command == 'add':
+            for fp in args.files:
+                print('Recorded %d rows of %s.' % (catalog.add_file(fp), fp))
+            return
+        if args.command == 'runs':
+            res = [(x['id'], x['tool'] or '', x['source'] or '', x['output']
+                    or '', time.strftime('%Y-%m-%d %H:%M:%S',
+                                         time.localtime(x['created'])),
+                    x['rows']) for x in catalog.runs()]
+            header = ('run', 'tool', 'source', 'output', 'created', 'rows')
+        elif args.command == 'duplicates':
+            res = catalog.duplicates()
+            header = ('sample', 'runs')
+        else:
+            if args.command == 'sample':
+                res = [x for y in args.samples for x in catalog.by_sample(y)]
+            elif args.command == 'barcode':
+                res = [x for y in args.barcodes
+                       for x in catalog.by_barcode(y)]
+            else:
+                res = catalog.by_well(args.plate, args.well)
+            res = [tuple('' if x[y] is None else x[y] for y in COLUMNS)
+                   for x in res]
+            header = COLUMNS
+    sys.stdout.write('%s\n' % '\t'.join(header))
+    sys.stdout.writelines('%s\n' % '\t'.join(str(x) for x in row)
+                          for row in res)
+    if not res:
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
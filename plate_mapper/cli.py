@@ -0,0 +1,77 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Command-line entry point of all tools: wetlab <command> [options].
+
+Only this module is imported at startup. The module of a command is
+imported when the command runs, and parses its own arguments, so that
+starting a command costs no more than importing its module.
+"""
+
+import sys
+from importlib import import_module
+
+
+# command : (module, description)
+_COMMANDS = {
+    'map': ('plate_mapper.plate_mapper',
+            'convert a plate map file into a mapping file'),
+    'link': ('plate_linker.plate_linker',
+             'transfer sample IDs to mapping file by well IDs'),
+    'batch': ('plate_mapper.batch',
+              'convert multiple plate map files in parallel'),
+    'barcodes': ('plate_mapper.barcodes',
+                 'find duplicated and similar barcodes'),
+    'watch': ('plate_mapper.watch',
+              'convert plate maps and metadata tables as they change'),
+    'serve': ('plate_mapper.service',
+              'serve conversions over a local socket'),
+    'catalog': ('plate_mapper.catalog',
+                'record mapping files and find samples across runs')}
+
+
+def _usage():
+    """Generate usage message."""
+    lines = ['usage: wetlab <command> [options]', '', 'commands:']
+    lines.extend('  %-10s%s' % (x, y[1]) for x, y in _COMMANDS.items())
+    lines.extend(['', 'Run "wetlab <command> -h" for options of a command.'])
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+    """Run a command.
+
+    Parameters
+    ----------
+    argv : list of str (optional)
+        Command and its arguments (default: those of the process)
+
+    Returns
+    -------
+    int or None
+        Exit status, if not zero
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        sys.stderr.write(_usage())
+        return 2
+    cmd = argv[0]
+    if cmd in ('-h', '--help'):
+        sys.stdout.write(_usage())
+        return
+    if cmd not in _COMMANDS:
+        sys.stderr.write('%swetlab: error: invalid command: %s\n'
+                         % (_usage(), cmd))
+        return 2
+    module = import_module(_COMMANDS[cmd][0])
+    return module.main(argv[1:], 'wetlab %s' % cmd)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
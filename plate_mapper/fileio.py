@@ -0,0 +1,564 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import io
+import os
+import sys
+import argparse
+from itertools import islice
+from importlib import import_module
+
+
+# compression formats: name : (file name extensions, magic bytes, module);
+# modules are imported when a file of the format is opened
+_FORMATS = {'gzip': (('.gz', '.gzip'), b'\x1f\x8b', 'gzip'),
+            'bzip2': (('.bz2',), b'BZh', 'bz2'),
+            'xz': (('.xz', '.lzma'), b'\xfd7zXZ\x00', 'lzma')}
+
+# file name extensions of Excel workbooks, which are read with
+# plate_mapper.xlsx
+_XLSX_EXTENSIONS = ('.xlsx', '.xlsm')
+
+# uncompressed input files of at least this size (in bytes) are memory-mapped
+_mmap_threshold = 1 << 24
+
+# size of blocks (in bytes) decoded at a time from a memory-mapped file
+_BLOCK_SIZE = 1 << 20
+
+
+def compression(fp, mode='r'):
+    """Detect compression format of a file.
+
+    Parameters
+    ----------
+    fp : str
+        File path
+    mode : str (optional)
+        "r" to detect by magic bytes, falling back to extension, or "w" or
+        "a" to detect by extension only (default: "r")
+
+    Returns
+    -------
+    str or None
+        "gzip", "bzip2" or "xz", or None if uncompressed
+    """
+    if mode == 'r':
+        try:
+            with open(fp, 'rb') as f:
+                magic = f.read(6)
+        except OSError:
+            magic = b''
+        for name, (_, x, _) in _FORMATS.items():
+            if magic.startswith(x):
+                return name
+        if magic:
+            return None
+    ext = os.path.splitext(fp)[1].lower()
+    for name, (exts, _, _) in _FORMATS.items():
+        if ext in exts:
+            return name
+    return None
+
+
+def split_ext(fp):
+    """Split the compression extension off a file path.
+
+    Parameters
+    ----------
+    fp : str
+        File path
+
+    Returns
+    -------
+    tuple of (str, str)
+        File path without compression extension, and the extension, which
+        is empty if there is none
+    """
+    root, ext = os.path.splitext(fp)
+    for exts, _, _ in _FORMATS.values():
+        if ext.lower() in exts:
+            return root, ext
+    return fp, ''
+
+
+def open_file(fp, mode='r', encoding=None, mmap_threshold=None):
+    """Open a text file, transparently handling compression.
+
+    Parameters
+    ----------
+    fp : str
+        File path, or "-" for standard input or output
+    mode : str (optional)
+        "r", "w" or "a" (default: "r")
+    encoding : str (optional)
+        Text encoding (default: that of the locale)
+    mmap_threshold : int (optional)
+        Minimum size in bytes of an uncompressed input file to be
+        memory-mapped (default: 16 MiB)
+
+    Returns
+    -------
+    file object
+        Text file object, a `MappedFile` for a large uncompressed input file,
+        or an `XlsxFile` for an input workbook
+
+    Raises
+    ------
+    ValueError
+        If mode is invalid, or an input workbook is not one.
+
+    Notes
+    -----
+    Gzip, bzip2 and xz files are read and written as streams, without
+    decompressing them to disk. Input files are recognized by their magic
+    bytes, so extensions do not matter, and output files by extension.
+
+    Input files with an .xlsx or .xlsm extension are read as Excel
+    workbooks, one tab-delimited line per row of their first sheet (see
+    `XlsxFile`).
+    """
+    if mode not in ('r', 'w', 'a'):
+        raise ValueError('Error: invalid file mode: %s.' % mode)
+    if fp == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    if mode == 'r' and os.path.splitext(fp)[1].lower() in _XLSX_EXTENSIONS:
+        return import_module('plate_mapper.xlsx').XlsxFile(fp, encoding)
+    fmt = compression(fp, mode)
+    if fmt is not None:
+        opener = import_module(_FORMATS[fmt][2]).open
+        return _CompressedFile(opener(fp, mode + 'b'), fp, encoding)
+    if mode == 'r':
+        if mmap_threshold is None:
+            mmap_threshold = _mmap_threshold
+        try:
+            size = os.path.getsize(fp)
+        except OSError:
+            size = 0
+        if size and size >= mmap_threshold:
+            f = MappedFile(fp, encoding)
+            if f.mapped:
+                return f
+            f.close()
+    return open(fp, mode, encoding=encoding)
+
+
+class _CompressedFile(io.TextIOWrapper):
+    """Text stream of a compressed file, which keeps its path as name."""
+
+    def __init__(self, buffer, name, encoding=None):
+        super(_CompressedFile, self).__init__(buffer, encoding=encoding)
+        self._name = name
+
+    @property
+    def name(self):
+        return self._name
+
+
+def content_digest(fp, size=1 << 20):
+    """Calculate SHA-256 digest of the content of a file.
+
+    Parameters
+    ----------
+    fp : str
+        File path
+    size : int (optional)
+        Chunk size in bytes (default: 1 MiB)
+
+    Returns
+    -------
+    str or None
+        Hex digest of the uncompressed content, or None if the file does not
+        exist
+
+    Notes
+    -----
+    Compressed files are digested after decompression, as their compressed
+    bytes differ between writes of the same content (e.g., by time stamps).
+    """
+    import hashlib
+    h = hashlib.sha256()
+    fmt = compression(fp)
+    try:
+        if fmt is None:
+            f = open(fp, 'rb')
+        else:
+            f = import_module(_FORMATS[fmt][2]).open(fp, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        for chunk in iter(lambda: f.read(size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _mkstemp(fp):
+    """Create an empty hidden temporary file to be moved to a file path.
+
+    Parameters
+    ----------
+    fp : str
+        File path
+
+    Returns
+    -------
+    str
+        Temporary file path, in the same directory and with the same
+        compression extension
+    """
+    from tempfile import mkstemp
+    dirname, basename = os.path.split(os.path.abspath(fp))
+    fd, tmp_fp = mkstemp(prefix='.%s.' % basename, suffix=split_ext(fp)[1],
+                         dir=dirname)
+    os.close(fd)
+    # mkstemp creates files readable by owner only
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_fp, 0o666 & ~umask)
+    return tmp_fp
+
+
+class AtomicFile(object):
+    """Output text file that only appears once it is completely written.
+
+    Parameters
+    ----------
+    fp : str
+        File path; compressed by extension as in `open_file`
+    encoding : str (optional)
+        Text encoding (default: that of the locale)
+    skip_unchanged : bool (optional)
+        Whether to leave the file untouched if its content would not change
+        (default: false)
+
+    Attributes
+    ----------
+    digest : str or None
+        SHA-256 hex digest of the content, once closed
+    changed : bool or None
+        Whether the file was replaced, once closed
+
+    Notes
+    -----
+    Lines are written to a hidden temporary file in the same directory,
+    which replaces the file when closed, so that readers never see a
+    partial file. If an exception leaves the context of a `with` statement,
+    the temporary file is removed instead, and the file is not touched.
+
+    The content is digested as it is written (see `content_digest`), so that
+    an unchanged file can be left as it is, without a pass over the new
+    content.
+    """
+
+    def __init__(self, fp, encoding=None, skip_unchanged=False):
+        import hashlib
+        self.name = fp
+        self.encoding = encoding
+        self.skip_unchanged = skip_unchanged
+        self.digest = None
+        self.changed = None
+        self._hash = hashlib.sha256()
+        self._f = None
+        self._done = False
+
+    def _open(self):
+        """Create the temporary file, which is done when first written, so
+        that a file that is never written leaves nothing behind."""
+        self._tmp_fp = _mkstemp(self.name)
+        self._f = open_file(self._tmp_fp, 'w', self.encoding)
+
+    @property
+    def closed(self):
+        return self._done
+
+    def write(self, s):
+        if self._f is None:
+            self._open()
+        self._hash.update(s.encode(self._f.encoding))
+        return self._f.write(s)
+
+    def writelines(self, lines):
+        it = iter(lines)
+        while True:
+            chunk = ''.join(islice(it, 4096))
+            if not chunk:
+                break
+            self.write(chunk)
+
+    def flush(self):
+        if self._f is not None:
+            self._f.flush()
+
+    def close(self):
+        """Finish writing, and move the file into place, unless unchanged."""
+        if self._done:
+            return
+        if self._f is None:
+            self._open()
+        self._done = True
+        self._f.close()
+        self.digest = self._hash.hexdigest()
+        self.changed = not (self.skip_unchanged and
+                            content_digest(self.name) == self.digest)
+        if self.changed:
+            os.replace(self._tmp_fp, self.name)
+        else:
+            os.remove(self._tmp_fp)
+
+    def discard(self):
+        """Stop writing, and remove the temporary file."""
+        if self._done:
+            return
+        self._done = True
+        if self._f is not None:
+            self._f.close()
+            os.remove(self._tmp_fp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class FileArg(object):
+    """Command-line argument type of a file, as in `argparse.FileType`.
+
+    Parameters
+    ----------
+    mode : str (optional)
+        "r", "w" or "a" (default: "r")
+    atomic : bool (optional)
+        Whether to write an output file atomically, leaving it untouched if
+        its content would not change (see `AtomicFile`) (default: false)
+
+    Notes
+    -----
+    Files are opened with `open_file`, so compressed files can be given.
+    """
+
+    def __init__(self, mode='r', atomic=False):
+        self.mode = mode
+        self.atomic = atomic
+
+    def __call__(self, fp):
+        try:
+            if self.atomic and self.mode == 'w' and fp != '-':
+                dirname = os.path.dirname(os.path.abspath(fp))
+                if not os.access(dirname, os.W_OK):
+                    raise OSError('cannot write to directory %s' % dirname)
+                return AtomicFile(fp, skip_unchanged=True)
+            return open_file(fp, self.mode)
+        except OSError as e:
+            raise argparse.ArgumentTypeError(
+                "can't open '%s': %s" % (fp, e))
+        except ValueError as e:  # e.g., an invalid workbook
+            raise argparse.ArgumentTypeError(
+                "can't read '%s': %s" % (fp, str(e).replace(
+                    'Error: ', '', 1).rstrip('.')))
+
+    def __repr__(self):
+        return 'FileArg(%r)' % self.mode
+
+
+def discard(f):
+    """Remove an output file that was not completely written, if it is an
+    `AtomicFile` or `ShardWriter`, leaving the file(s) it would have
+    replaced untouched."""
+    if hasattr(f, 'discard'):
+        f.discard()
+
+
+def write_manifest(fp, tool, inputs, outputs):
+    """Record digests of the inputs and outputs of a run.
+
+    Parameters
+    ----------
+    fp : str
+        Manifest file path (JSON)
+    tool : str
+        Tool of the run
+    inputs : dict of file object
+        Role of input (e.g., "metadata") : input file, or None if not given
+    outputs : list of file object
+        Output files, closed
+
+    Notes
+    -----
+    Inputs are digested when the manifest is written, and outputs as they
+    were written (see `AtomicFile`); files without a path, such as standard
+    input and output, have a null digest. Outputs that were left untouched
+    as their content did not change have "changed" false, and if all did,
+    so does the manifest, so that a pipeline tells whether a run was a
+    no-op by reading one field.
+    """
+    import json
+    ins = {}
+    for role, f in inputs.items():
+        if f is None:
+            continue
+        path = getattr(f, 'name', None)
+        if not isinstance(path, str) or path.startswith('<'):
+            path = None  # standard input
+        ins[role] = {'path': path,
+                     'sha256': path and content_digest(path)}
+    outs = []
+    for f in outputs:
+        path = getattr(f, 'name', None)
+        if not isinstance(path, str) or path.startswith('<'):
+            path = None
+        changed = getattr(f, 'changed', True)
+        outs.append({'path': path, 'sha256': getattr(f, 'digest', None),
+                     'changed': changed is not False})
+    manifest = {'tool': tool, 'inputs': ins, 'outputs': outs,
+                'changed': any(x['changed'] for x in outs)}
+    with AtomicFile(fp) as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+class MappedFile(object):
+    """Read-only text file read through a memory-mapped buffer.
+
+    Parameters
+    ----------
+    fp : str
+        File path
+    encoding : str (optional)
+        Text encoding (default: that of the locale)
+
+    Attributes
+    ----------
+    name : str
+        File path
+    mapped : bool
+        Whether the file is memory-mapped; if not, it cannot be read with
+        this class, and should be opened as usual
+
+    Notes
+    -----
+    The file is decoded in large blocks ending at line breaks, rather than
+    read line by line through a buffered stream. Files with carriage
+    returns are not mapped, as lines would have to be translated as in
+    universal newlines mode.
+
+    Positions given by `tell` and accepted by `seek` are byte offsets.
+    """
+
+    def __init__(self, fp, encoding=None):
+        import mmap
+        import locale
+        self.name = fp
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self._f = open(fp, 'rb')
+        self._mm = None
+        self._pos = 0
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # e.g., empty file
+            pass
+        else:
+            if self._mm.find(b'\r') != -1:
+                self._mm.close()
+                self._mm = None
+        self.mapped = self._mm is not None
+
+    @property
+    def closed(self):
+        return self._f.closed
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self._pos
+        elif whence == 2:
+            pos += len(self._mm)
+        self._pos = min(max(pos, 0), len(self._mm))
+        return self._pos
+
+    def readline(self):
+        """Read a line, including its line break."""
+        mm = self._mm
+        end = mm.find(b'\n', self._pos)
+        end = len(mm) if end == -1 else end + 1
+        line = mm[self._pos:end].decode(self.encoding)
+        self._pos = end
+        return line
+
+    def read(self):
+        """Read the rest of the file."""
+        data = self._mm[self._pos:].decode(self.encoding)
+        self._pos = len(self._mm)
+        return data
+
+    def _blocks(self):
+        """Decode the rest of the file in blocks ending at line breaks."""
+        mm, size = self._mm, len(self._mm)
+        while self._pos < size:
+            end = mm.find(b'\n', min(self._pos + _BLOCK_SIZE, size) - 1)
+            end = size if end == -1 else end + 1
+            block = mm[self._pos:end].decode(self.encoding)
+            self._pos = end
+            yield block
+
+    def __iter__(self):
+        for block in self._blocks():
+            yield from io.StringIO(block)
+
+    def rows(self, sep='\t'):
+        """Split the rest of the file into fields.
+
+        Parameters
+        ----------
+        sep : str (optional)
+            Field delimiter (default: tab)
+
+        Yields
+        ------
+        list of str
+            Fields of each line, without line break
+
+        Notes
+        -----
+        Each block is split into lines and then into fields, so that lines
+        are neither copied with their line breaks nor stripped of them one
+        by one.
+        """
+        for block in self._blocks():
+            lines = block.split('\n')
+            if block.endswith('\n'):
+                lines.pop()
+            for line in lines:
+                yield line.split(sep)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
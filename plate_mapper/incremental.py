@@ -0,0 +1,291 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import os
+import json
+import warnings
+import hashlib
+from collections import Counter
+from plate_mapper.barcodes import collect_barcodes, check_barcodes
+from plate_mapper.fileio import _mkstemp
+from plate_mapper.plate_mapper import (_read_plate_map, _read_special,
+                                       _read_barseq, _resolve, _format_row,
+                                       _report)
+from plate_mapper.records import Result
+from plate_mapper.stats import RunStats
+from plate_mapper.suggest import write_report
+from plate_mapper.writer import BatchWriter, render_suffix
+
+
+# version of the cache file layout; caches of other versions are discarded
+_CACHE_VERSION = 1
+
+
+def _digest(*parts):
+    """Calculate SHA-256 hex digest of strings."""
+    h = hashlib.sha256()
+    for x in parts:
+        h.update(x.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _load_cache(cache_fp):
+    """Load a fragment cache, or an empty one if missing or invalid.
+
+    Parameters
+    ----------
+    cache_fp : str
+        Cache file path
+
+    Returns
+    -------
+    dict
+        {'version': version, 'plates': {primer plate ID: cache entry}}
+    """
+    empty = {'version': _CACHE_VERSION, 'plates': {}}
+    try:
+        with open(cache_fp, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return empty
+    if not isinstance(cache, dict) or \
+            cache.get('version') != _CACHE_VERSION:
+        return empty
+    return cache
+
+
+def _save_cache(cache, cache_fp):
+    """Write a fragment cache atomically.
+
+    Parameters
+    ----------
+    cache : dict
+        Cache returned by `_load_cache` and updated
+    cache_fp : str
+        Cache file path
+    """
+    dirname = os.path.dirname(os.path.abspath(cache_fp))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    tmp_fp = _mkstemp(cache_fp)
+    try:
+        with open(tmp_fp, 'w') as f:
+            json.dump(cache, f)
+    except BaseException:
+        os.remove(tmp_fp)
+        raise
+    os.replace(tmp_fp, cache_fp)
+
+
+def _fingerprint(grid, rows, env):
+    """Fingerprint a plate and everything its output depends on.
+
+    Parameters
+    ----------
+    grid : Plate
+        Plate of sample IDs
+    rows : list of list of str
+        Template rows of the primer plate
+    env : str
+        Digest of special sample definitions and options
+
+    Returns
+    -------
+    str
+        SHA-256 hex digest
+    """
+    return _digest(env, grid.plate_id, str(grid.cols), grid.suffix,
+                   '\t'.join(x or '' for x in grid.cells),
+                   *('\t'.join(x) for x in rows))
+
+
+def _render_plate(plate_id, grid, rows, specs, empty):
+    """Render the output fragment of one plate.
+
+    Parameters
+    ----------
+    plate_id : str
+        Primer plate ID
+    grid : Plate
+        Plate of sample IDs
+    rows : list of list of str
+        Template rows of the primer plate, in template order
+    specs : dict of dict
+        Special sample definitions
+    empty : bool
+        Whether to keep empty lines
+
+    Returns
+    -------
+    dict
+        Cache entry: {'lines': output line of each template row, or empty
+        string if the row is not written, 'counts': occurrences of normal
+        sample names, 'tally': special samples substituted and empty wells,
+        'wells': number of wells filled}
+    """
+    counts, tally = Counter(), {}
+    lines = [_format_row(fields, suffix) if empty or fields[0] else ''
+             for fields, suffix in _resolve(rows, {plate_id: grid}, specs,
+                                            counts, True, tally)]
+    del tally['rows']  # rows are counted as they are written
+    return {'lines': lines, 'counts': dict(counts), 'tally': tally,
+            'wells': len(grid.cells) - grid.cells.count(None)}
+
+
+def _assemble(barseqs, frags, empty):
+    """Reassemble plate fragments in template order.
+
+    Parameters
+    ----------
+    barseqs : list of list of str
+        Barcode sequence template rows
+    frags : dict of list of str
+        Primer plate ID : output line of each template row of the plate
+    empty : bool
+        Whether to keep empty lines of template rows of unmapped plates
+
+    Yields
+    ------
+    str
+        Output lines
+    """
+    its = {k: iter(v) for k, v in frags.items()}
+    no_suffix = render_suffix(())
+    for barcode, primer, plate, well in barseqs:
+        it = its.get(plate)
+        if it is not None:
+            line = next(it)
+            if line:
+                yield line
+        elif empty:
+            yield _format_row(('', barcode, primer, plate, well), no_suffix)
+
+
+def plate_mapper_incremental(input_f, barseq_f, output_f, cache_fp,
+                             names_f=None, special_f=None, empty=False,
+                             stats=None, report_fp=None, barcode_dist=None):
+    """Convert a plate map file into a mapping file, reusing cached plates.
+
+    Parameters
+    ----------
+    input_f : file object
+        Input plate map file
+    barseq_f : file object or BarseqIndex
+        Barcode sequence template file, or its compiled index
+    output_f : file object
+        Output mapping file
+    cache_fp : str
+        Cache file path, created if missing
+    names_f : file object (optional)
+        Sample name list file
+    special_f : file object (optional)
+        Special sample definition file
+    empty : bool (optional)
+        Whether to keep empty lines in mapping file (default: false)
+    stats : RunStats (optional)
+        Statistics to record the run into (default: a new one)
+    report_fp : str (optional)
+        JSON report file of sample name checks (see `plate_mapper`)
+    barcode_dist : int (optional)
+        Maximum Hamming distance of barcode check (see `plate_mapper`)
+
+    Returns
+    -------
+    RunStats
+        Phase timings, counters and warnings of the run; in addition to the
+        counters of `plate_mapper`, "reused" and "regenerated" are numbers of
+        plates taken from the cache and rendered anew
+
+    Notes
+    -----
+    The plate map is parsed into plates as usual, which is cheap compared to
+    resolving and rendering. Each plate is fingerprinted by its wells, plate
+    ID and metadata, the template rows of its primer plate, the special
+    sample definitions and the empty flag. The output lines of plates whose
+    fingerprint is unchanged are taken from the cache, and only the others
+    are rendered. Lines are then reassembled in template order, so the
+    output is identical to that of `plate_mapper`.
+
+    Occurrences of sample names are cached per plate, and summed over all
+    plates, so that repeated and name list checks cover the whole plate map.
+    """
+    if stats is None:
+        stats = RunStats()
+    cache = _load_cache(cache_fp)
+
+    # Read inputs
+    with stats.phase('read_plate_map', 'Reading input plate map file'):
+        plates = _read_plate_map(input_f)
+    specs = {}
+    if special_f:
+        with stats.phase('read_special',
+                         'Reading special sample definitions'):
+            specs = _read_special(special_f)
+    with stats.phase('read_barseq', 'Reading barcode sequence template file'):
+        barseqs = list(_read_barseq(barseq_f))
+        by_plate = {}
+        for row in barseqs:
+            barcode, primer, plate, well = row
+            by_plate.setdefault(plate, []).append(row)
+    env = _digest(json.dumps(specs, sort_keys=True), str(bool(empty)),
+                  json.dumps(getattr(specs, 'patterns', []), sort_keys=True))
+
+    # Render plates whose fingerprint changed
+    entries = {}
+    with stats.phase('render_plates', 'Rendering changed plates'):
+        for plate_id, grid in plates.items():
+            rows = by_plate.get(plate_id, [])
+            fp = _fingerprint(grid, rows, env)
+            entry = cache['plates'].get(plate_id)
+            if entry is not None and entry.get('fingerprint') == fp:
+                stats.count('reused')
+            else:
+                entry = _render_plate(plate_id, grid, rows, specs, empty)
+                entry['fingerprint'] = fp
+                stats.count('regenerated')
+            entries[plate_id] = entry
+
+    # Reassemble output mapping file
+    counts = Counter()
+    result = Result(stats)
+    with stats.phase('write_mapping', 'Writing output mapping file'):
+        lines = _assemble(barseqs, {k: v['lines'] for k, v in
+                                    entries.items()}, empty)
+        if barcode_dist is not None:
+            barcodes = []
+            lines = (x for _, x in collect_barcodes(
+                ((x.split('\t', 5), x) for x in lines), barcodes))
+        writer = BatchWriter(output_f)
+        writer.writelines(lines)
+        writer.close()
+    stats.count('plates', len(entries))
+    for entry in entries.values():
+        counts.update(entry['counts'])
+        stats.count('wells', entry['wells'])
+        for key, n in entry['tally'].items():
+            stats.count(key, n)
+    stats.count('rows', writer.lines)
+
+    # Keep entries of current plates only
+    _save_cache({'version': _CACHE_VERSION, 'plates': entries}, cache_fp)
+
+    _report(counts, names_f, result)
+    if barcode_dist is not None:
+        check_barcodes(barcodes, barcode_dist, result)
+    for f in (input_f, barseq_f, names_f, special_f):
+        if f:
+            f.close()
+    if report_fp:
+        with stats.phase('write_report', 'Writing sample name report'):
+            write_report(result, report_fp)
+    if result.warnings:
+        warnings.warn('Warning:\n%s' % ''.join(result.warnings))
+    stats.log('Task completed.')
+    return stats
@@ -0,0 +1,214 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+from plate_mapper.writer import render_suffix
+
+
+# supported plate formats: (number of wells, rows, columns)
+FORMATS = ((96, 8, 12), (384, 16, 24), (1536, 32, 48))
+
+
+def _row_name(i):
+    """Convert a row index into a row header.
+
+    Parameters
+    ----------
+    i : int
+        Row index (0-based)
+
+    Returns
+    -------
+    str
+        Row header: A, B, ..., Z, AA, AB, ...
+    """
+    name = ''
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        name = chr(65 + r) + name
+    return name
+
+
+# row headers of the largest plate format
+ROWS = [_row_name(i) for i in range(FORMATS[-1][1])]
+
+# well ID : (row index, column index), of the largest plate format
+WELL_INDEX = {'%s%d' % (row, j + 1): (i, j) for i, row in enumerate(ROWS)
+              for j in range(FORMATS[-1][2])}
+
+# number of columns : well ID : position in plate of that format
+_positions = {cols: {'%s%d' % (ROWS[i], j + 1): i * cols + j
+                     for i in range(rows) for j in range(cols)}
+              for _, rows, cols in FORMATS}
+
+
+def normalize_well(well):
+    """Write a well ID without zero padding.
+
+    Parameters
+    ----------
+    well : str
+        Well ID, such as A2, or A02 with a zero-padded column number
+
+    Returns
+    -------
+    str or None
+        Well ID as in `WELL_INDEX`, such as A2, or None if it is not one of
+        a plate of the largest format
+    """
+    if well in WELL_INDEX:
+        return well
+    row = well.rstrip('0123456789')
+    if row == well:
+        return None
+    well = '%s%d' % (row, int(well[len(row):]))
+    return well if well in WELL_INDEX else None
+
+
+def plate_format(rows, cols):
+    """Find the smallest plate format that fits given numbers of wells.
+
+    Parameters
+    ----------
+    rows : int
+        Number of rows
+    cols : int
+        Number of columns
+
+    Returns
+    -------
+    tuple of (int, int, int)
+        Number of wells, rows and columns of the plate format
+
+    Raises
+    ------
+    ValueError
+        If the plate is larger than all supported formats.
+    """
+    for fmt in FORMATS:
+        if rows <= fmt[1] and cols <= fmt[2]:
+            return fmt
+    raise ValueError('Error: plate exceeds the largest supported format '
+                     '(%d wells).' % FORMATS[-1][0])
+
+
+class Plate(object):
+    """A plate of wells, stored in a fixed-size array.
+
+    Parameters
+    ----------
+    plate_id : str (optional)
+        Plate ID
+    metadata : sequence of str (optional)
+        Metadata shared by all wells of the plate
+    rows : int (optional)
+        Number of rows expected
+    cols : int (optional)
+        Number of columns expected
+
+    Attributes
+    ----------
+    suffix : str
+        Metadata rendered once as the tail of an output line
+    wells : int
+        Number of wells of the plate format (96, 384 or 1536)
+    cells : list
+        Content of each well, in row-major order, or None if empty
+
+    Notes
+    -----
+    The plate starts with the smallest format that fits the expected size,
+    and is promoted to a larger format when a well beyond it is filled.
+    Well IDs are resolved to positions in the array via precomputed tables,
+    shared by all plates of the same format.
+    """
+
+    __slots__ = ('plate_id', 'metadata', 'suffix', 'wells', 'rows', 'cols',
+                 'cells', '_positions')
+
+    def __init__(self, plate_id='', metadata=(), rows=0, cols=0):
+        self.plate_id = plate_id
+        self.metadata = tuple(metadata)
+        self.suffix = render_suffix(self.metadata)
+        self.wells, self.rows, self.cols = plate_format(rows, cols)
+        self.cells = [None] * self.wells
+        self._positions = _positions[self.cols]
+
+    def _promote(self, rows, cols):
+        """Move wells into a larger plate format."""
+        old, old_cols = self.cells, self.cols
+        self.wells, self.rows, self.cols = plate_format(
+            max(rows, self.rows), max(cols, self.cols))
+        self.cells = [None] * self.wells
+        self._positions = _positions[self.cols]
+        for k, value in enumerate(old):
+            if value is not None:
+                i, j = divmod(k, old_cols)
+                self.cells[i * self.cols + j] = value
+
+    def set(self, i, j, value):
+        """Fill a well by row and column indices.
+
+        Parameters
+        ----------
+        i : int
+            Row index (0-based)
+        j : int
+            Column index (0-based)
+        value : object
+            Content of the well
+        """
+        if i >= self.rows or j >= self.cols:
+            self._promote(i + 1, j + 1)
+        self.cells[i * self.cols + j] = value
+
+    def position(self, well):
+        """Find position of a well in the array.
+
+        Parameters
+        ----------
+        well : str
+            Well ID
+
+        Returns
+        -------
+        int or None
+            Position, or None if the well ID is not within the plate format
+        """
+        return self._positions.get(well)
+
+    def get(self, well):
+        """Get content of a well.
+
+        Parameters
+        ----------
+        well : str
+            Well ID
+
+        Returns
+        -------
+        object
+            Content of the well, or None if empty or not within the plate
+            format
+        """
+        k = self._positions.get(well)
+        return None if k is None else self.cells[k]
+
+    def items(self):
+        """Iterate over filled wells in row-major order.
+
+        Yields
+        ------
+        tuple of (str, object)
+            Well ID and content
+        """
+        for k, value in enumerate(self.cells):
+            if value is not None:
+                i, j = divmod(k, self.cols)
+                yield '%s%d' % (ROWS[i], j + 1), value
@@ -7,10 +7,26 @@
 # ----------------------------------------------------------------------------
 
 
+import os
 import re
+import sys
 import argparse
 import warnings
+from sys import intern
 from collections import Counter
+if __name__ == '__main__' and not __package__:
+    # run by path, the directory of this script comes first in the path, where
+    # this module would shadow the package of the same name
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from plate_mapper.barcodes import collect_barcodes, check_barcodes
+from plate_mapper.barseq_index import BarseqIndex, load_index
+from plate_mapper.fileio import FileArg, discard, write_manifest
+from plate_mapper.plate import Plate, ROWS, plate_format
+from plate_mapper.records import Record, Result
+from plate_mapper.special import SpecialSamples
+from plate_mapper.stats import RunStats
+from plate_mapper.writer import (BatchWriter, ShardWriter, render_suffix,
+                                 shard_key)
 
 
 def _print_list(l):
@@ -39,34 +55,39 @@ def _print_list(l):
         return(', '.join(l))
 
 
-def plate_mapper(input_f, barseq_f, output_f, names_f=None, special_f=None,
-                 empty=False):
-    """Convert a plate map file into a mapping file.
+def _read_plate_map(input_f):
+    """Read a plate map file into a compact per-plate lookup.
 
     Parameters
     ----------
-    input_f : file object
-        Input plate map file
-    barseq_f : file object
-        Barcode sequence template file
-    output_f : file object
-        Output mapping file
-    names_f : file object (optional)
-        Sample name list file
-    special_f : file object (optional)
-        Special sample definition file
-    empty : bool (optional)
-        Whether to keep empty lines in mapping file (default: false)
+    input_f : iterable of str
+        Lines of input plate map file
+
+    Returns
+    -------
+    dict of Plate
+        Primer plate ID : plate of sample IDs
+
+    Raises
+    ------
+    ValueError
+        If column headers are not incremental integers, row headers are not
+        letters in alphabetical order, the first row of a plate has no
+        primer plate ID, or a plate is larger than 1536 wells.
+
+    Notes
+    -----
+    Row headers go A, B, ..., Z, AA, AB, ..., as in spreadsheets. The plate
+    format (96, 384 or 1536 wells) is detected from the number of columns in
+    the header row, and from the number of rows as they are read.
+
+    Sample IDs are interned, so that repeated names share one string.
     """
-    # Read input plate map file
     cols = 0  # number of columns of current plate
-    letter = ''  # current row header (a letter)
+    row = None  # current row index, or None before first plate
     plate_id = ''  # plate ID
-    primer_plate_id = ''  # primer plate ID
-    plates = {}  # plates (primer plate ID : well ID : sample ID)
-    metadata = {}  # metadata
-    primer2plate = {}  # primer plate ID => plate ID
-    print('Reading input plate map file...')
+    grid = None  # current plate
+    plates = {}  # primer plate ID : plate
     for line in input_f:
         l = line.rstrip().split('\t')
         if l == ['']:  # skip empty lines
@@ -82,147 +103,656 @@ def plate_mapper(input_f, barseq_f, output_f, names_f=None, special_f=None,
             m = re.search(r'(\d+)$', l[0])
             if m:
                 plate_id = m.group(1)
-            letter = 'A'
+            # detect plate format by number of columns
+            plate_format(0, cols)
+            row = 0
         else:  # plate body
-            if letter != l[0]:
+            if row is None or (row < len(ROWS) and ROWS[row] != l[0]):
                 raise ValueError('Error: row headers are not letters in '
                                  'alphabetical order.')
-            if letter == 'A':  # first row
-                primer_plate_id = l[cols+1]
-                primer2plate[primer_plate_id] = plate_id
-                plates[primer_plate_id] = {}
+            if row == len(ROWS):
+                plate_format(row + 1, cols)  # raise error
+            if row == 0:  # first row
+                if len(l) <= cols + 1:
+                    raise ValueError('Error: first row of plate has no '
+                                     'primer plate ID.')
                 # reading metadata, which are in the columns after the plate
-                metadata[primer_plate_id] = l[cols+2:]
-            letter = chr(ord(letter) + 1)
+                grid = Plate(plate_id, l[cols+2:], cols=cols)
+                plates[l[cols+1]] = grid
             # only read non-empty cells in column number range
-            plates[primer_plate_id].update({'%s%d' % (l[0], i): l[i]
-                                            for i in range(1, cols+1)
-                                            if i < len(l) and l[i]})
-    input_f.close()
-    print('  Done.')
-
-    # Read barcode sequence template file
-    barseqs = []
-    print('Reading barcode sequence template file...')
-    next(barseq_f)  # skip header line
-    for line in barseq_f:
+            for i in range(1, min(cols+1, len(l))):
+                if l[i]:
+                    grid.set(row, i - 1, intern(l[i]))
+            row += 1
+    return plates
+
+
+def _read_special(special_f):
+    """Read a special sample definition file.
+
+    Parameters
+    ----------
+    special_f : iterable of str
+        Lines of special sample definition file, starting with a header
+
+    Returns
+    -------
+    SpecialSamples
+        Code : {'name': name, 'note': description, 'metadatum': metadata,
+        'suffix': metadata rendered as the tail of an output line}, with
+        prefix, glob and regular expression codes compiled apart
+
+    Raises
+    ------
+    ValueError
+        If a definition is invalid, duplicated or has no name, or a pattern
+        code is invalid.
+
+    Notes
+    -----
+    Codes are exact sample names, or patterns written as "prefix:...",
+    "glob:..." or "re:...", which are resolved by the precedence described
+    in `SpecialSamples`.
+    """
+    specs = SpecialSamples()
+    codes = set()
+    special_f = iter(special_f)
+    next(special_f)  # skip header line
+    for line in special_f:
         line = line.rstrip()
-        if line:
-            barseqs.append(line.split('\t'))
-    barseq_f.close()
-    print('  Done.')
+        l = line.split('\t')
+        # a valid definition must have code, name and description, while
+        # metadatum is optional
+        if len(l) < 3:
+            raise ValueError('Error: invalid definition: %s.' % line)
+        if l[0] in codes:
+            raise ValueError('Error: Code %s has duplicates.' % repr(l[0]))
+        if not l[1]:
+            raise ValueError('Error: Code %s has no name.' % repr(l[0]))
+        codes.add(l[0])
+        specs.add(l[0], {'name': l[1], 'note': l[2], 'metadatum': l[3:],
+                         'suffix': render_suffix(l[3:])})
+    specs.compile()
+    return specs
 
-    # Read special sample definitions
-    specs = {}
-    if special_f:
-        print('Reading special sample definitions...')
-        next(special_f)  # skip header line
-        for line in special_f:
+
+def _read_barseq(barseq_f):
+    """Read a barcode sequence template file row by row.
+
+    Parameters
+    ----------
+    barseq_f : iterable of str, or BarseqIndex
+        Lines of barcode sequence template file, starting with a header, or
+        its compiled index
+
+    Yields
+    ------
+    list of str
+        Barcode, primer, primer plate ID and well ID
+    """
+    if isinstance(barseq_f, BarseqIndex):
+        yield from barseq_f
+    else:
+        barseq_f = iter(barseq_f)
+        next(barseq_f)  # skip header line
+        for line in barseq_f:
             line = line.rstrip()
-            l = line.split('\t')
-            # a valid definition must have code, name and description, while
-            # metadatum is optional
-            if len(l) < 3:
-                raise ValueError('Error: invalid definition: %s.' % line)
-            if l[0] in specs:
-                raise ValueError('Error: Code %s has duplicates.' % repr(l[0]))
-            if not l[1]:
-                raise ValueError('Error: Code %s has no name.' % repr(l[0]))
-            specs[l[0]] = {'name': l[1], 'note': l[2], 'metadatum': l[3:]}
-        special_f.close()
-        print('  Done.')
-
-    # Write output sequencing run file
-    samples = []
-    print('Writing output mapping file...')
-    for barcode, primer, plate, well in barseqs:
-        # [ barcode sequence, linker primer sequence, primer plate #, well ID ]
-        sample, metadatum = '', []
-        if plate in plates:
-            pid = primer2plate[plate]
-            if well in plates[plate]:
-                sample, metadatum = plates[plate][well], metadata[plate]
-                if specs and sample in specs:
-                    # replace with special sample definition
-                    if specs[sample]['metadatum']:
-                        # replace metadatum if available
-                        metadatum = specs[sample]['metadatum']
-                    sample = '%s%s.%s' % (specs[sample]['name'], pid, well)
+            if line:
+                yield line.split('\t')
+
+
+def _resolve(barseqs, plates, specs, counts, empty=False, tally=None):
+    """Resolve barcode sequence template rows into mapping rows one by one.
+
+    Parameters
+    ----------
+    barseqs : iterable of list of str
+        Barcode sequence template rows
+    plates : dict of Plate
+        Plates returned by `_read_plate_map`
+    specs : dict of dict or SpecialSamples
+        Special sample definitions returned by `_read_special`
+    counts : Counter
+        Occurrences of normal sample names, updated as rows are resolved
+    empty : bool (optional)
+        Whether to yield rows of empty wells (default: false)
+    tally : dict of int (optional)
+        Numbers of special samples substituted ("specials"), of empty wells
+        of mapped plates ("empty") and of rows yielded ("rows"), updated when
+        resolving stops
+
+    Yields
+    ------
+    tuple of (str, str)
+        Sample ID, barcode, primer, primer plate ID and well ID, and metadata
+        rendered as the tail of output line
+
+    Notes
+    -----
+    Metadata are rendered once per plate and once per special sample
+    definition, rather than once per row.
+    """
+    no_suffix = render_suffix(())
+    # exact codes are looked up as keys, and pattern codes only if any
+    matches = specs.matches if getattr(specs, 'patterns', None) else None
+    nspecial = nempty = nrows = 0
+    try:
+        for barcode, primer, plate, well in barseqs:
+            # [ barcode sequence, linker primer sequence, primer plate #,
+            #   well ID ]
+            sample, suffix = '', no_suffix
+            grid = plates.get(plate)
+            if grid is not None:
+                pid = grid.plate_id
+                sample = grid.get(well)
+                if sample is not None:
+                    suffix = grid.suffix
+                    if sample in specs:
+                        spec = specs[sample]
+                    elif matches is not None:
+                        spec = matches[sample]
+                    else:
+                        spec = None
+                    if spec is not None:
+                        # replace with special sample definition
+                        if spec['metadatum']:
+                            # replace metadatum if available
+                            suffix = spec['suffix']
+                        sample = '%s%s.%s' % (spec['name'], pid, well)
+                        nspecial += 1
+                    else:
+                        # normal sample name
+                        counts[sample] += 1
+                elif '' in specs:
+                    # empty well (if defined as a special sample)
+                    suffix = specs['']['suffix']
+                    sample = '%s%s.%s' % (specs['']['name'], pid, well)
+                    nempty += 1
                 else:
-                    # normal sample name
-                    samples.append(sample)
-            elif '' in specs:
-                # empty well (if defined as a special sample)
-                metadatum = specs['']['metadatum']
-                sample = '%s%s.%s' % (specs['']['name'], pid, well)
-        if sample or empty:
-            # replace underscore and dash with dot in sample name
-            sample_dot = sample.replace('_', '.').replace('-', '.')
-            output_f.write('%s\t%s\n' % (
-                '\t'.join((sample_dot, barcode, primer, plate, well)),
-                '\t'.join(metadatum)))
-    output_f.close()
-    print('  Done.')
+                    sample = ''
+                    nempty += 1
+            if sample or empty:
+                # replace underscore and dash with dot in sample name
+                sample = sample.replace('_', '.').replace('-', '.')
+                nrows += 1
+                yield (sample, barcode, primer, plate, well), suffix
+    finally:
+        if tally is not None:
+            tally['specials'] = tally.get('specials', 0) + nspecial
+            tally['empty'] = tally.get('empty', 0) + nempty
+            tally['rows'] = tally.get('rows', 0) + nrows
+
+
+def _format_row(fields, suffix):
+    """Format a resolved mapping row as an output line.
+
+    Parameters
+    ----------
+    fields : tuple of str
+        Sample ID, barcode, primer, primer plate ID and well ID
+    suffix : str
+        Rendered metadata
+
+    Returns
+    -------
+    str
+        Tab-delimited line
+    """
+    return '\t'.join(fields) + suffix
+
+
+def _check_repeated(counts):
+    """Find repeated sample names.
+
+    Parameters
+    ----------
+    counts : Counter
+        Occurrences of normal sample names
+
+    Returns
+    -------
+    list of str
+        Sorted sample names that occur more than once
+    """
+    return sorted(name for name, count in counts.items() if count > 1)
+
+
+def _check_names(counts, names_f):
+    """Find samples not matching a name list.
+
+    Parameters
+    ----------
+    counts : Counter
+        Occurrences of normal sample names
+    names_f : iterable of str
+        Lines of sample name list file
+
+    Returns
+    -------
+    tuple of (list of str, list of str)
+        Sorted sample names in plate map but not in name list (novel), and
+        in name list but not in plate map (missing); both are empty if the
+        name list is empty
+    """
+    names = set()
+    for line in names_f:
+        l = line.rstrip().split('\t')
+        if l[0]:  # skip empty names
+            names.add(l[0])  # keep first field as name
+    if not names:
+        return [], []
+    novel = sorted(x for x in counts if x not in names)
+    missing = sorted(x for x in names if x not in counts)
+    return novel, missing
+
+
+def _warn_list(label, l):
+    """Generate a line of warning message for a list of sample names.
+
+    Parameters
+    ----------
+    label : str
+        Kind of samples, such as "Repeated"
+    l : list of str
+        Sample names
+
+    Returns
+    -------
+    str
+        Warning message, or empty string if the list is empty
+    """
+    if l:
+        return '  %s samples: %s.\n' % (label, _print_list(l))
+    return ''
 
+
+def _report(counts, names_f, result):
+    """Check sample names of a run.
+
+    Parameters
+    ----------
+    counts : Counter
+        Occurrences of normal sample names
+    names_f : iterable of str, or None
+        Lines of sample name list file
+    result : Result
+        Result to record repeated, novel and missing names, their counts and
+        the warning message into
+    """
+    stats = result.stats
     # Check for repeated sample names
-    warning = ''
-    samples = Counter(samples)
-    repeated = [name for name, count in samples.items() if count > 1]
-    if repeated:
-        warning += ('  Repeated samples: %s.\n'
-                    % _print_list(sorted(repeated)))
+    result.repeated = _check_repeated(counts)
+    stats.count('repeated', len(result.repeated))
+    warning = _warn_list('Repeated', result.repeated)
 
     # Validate sample names
     if names_f:
-        print('Validating sample names...')
-        names = set()
-        for line in names_f:
-            l = line.rstrip().split('\t')
-            if l[0]:  # skip empty names
-                names.add(l[0])  # keep first field as name
-        names_f.close()
-        if names:
-            sample_set = set(samples)
-            # samples in plate map but not in name list
-            novel = sample_set - names
-            # samples in name list but not in plate map
-            missing = names - sample_set
-            if novel:
-                warning += ('  Novel samples: %s.\n'
-                            % _print_list(sorted(novel)))
-            if missing:
-                warning += ('  Missing samples: %s.\n'
-                            % _print_list(sorted(missing)))
-        print('  Done.')
+        with stats.phase('validate_names', 'Validating sample names'):
+            result.novel, result.missing = _check_names(counts, names_f)
+        stats.count('novel', len(result.novel))
+        stats.count('missing', len(result.missing))
+        warning += _warn_list('Novel', result.novel)
+        warning += _warn_list('Missing', result.missing)
 
-    # Display warning message
     if warning:
-        warnings.formatwarning = lambda msg, cat, fname, lineno, line: str(msg)
-        warnings.warn('Warning:\n%s' % warning)
+        stats.warnings.append(warning)
 
-    print('Task completed.')
 
+def _map_rows(plate_map, barseq, special=None, names=None, empty=False,
+              result=None, barseqs=None, specs=None):
+    """Resolve mapping rows; see `map_plates`.
 
-if __name__ == "__main__":
-    # Welcome information
-    print('Plate Mapper: Convert a plate map file into a mapping file.\n'
-          'Last updated: Jun 22, 2017.')
+    Parameters
+    ----------
+    barseqs : list of list of str (optional)
+        Template rows already read by `_read_barseq`, in place of barseq
+    specs : dict of dict (optional)
+        Special sample definitions already read by `_read_special`, in place
+        of special
+
+    Yields
+    ------
+    tuple of (tuple of str, str)
+        Fields and rendered metadata of each row, as yielded by `_resolve`
+    """
+    if result is None:
+        result = Result()
+    stats = result.stats
+
+    # Read plate map
+    with stats.phase('read_plate_map', 'Reading input plate map file'):
+        plates = _read_plate_map(plate_map)
+    result.plate_ids.update((k, v.plate_id) for k, v in plates.items())
+    stats.count('plates', len(plates))
+    stats.count('wells', sum(len(x.cells) - x.cells.count(None)
+                             for x in plates.values()))
+
+    # Read special sample definitions
+    if specs is None:
+        specs = {}
+    if special:
+        with stats.phase('read_special',
+                         'Reading special sample definitions'):
+            specs = _read_special(special)
+
+    # Stream barcode sequence template rows
+    counts = Counter()  # occurrences of normal sample names
+    tally = {}
+    with stats.phase('resolve', 'Resolving samples'):
+        if barseqs is None:
+            barseqs = _read_barseq(barseq)
+        for row in _resolve(barseqs, plates, specs, counts, empty, tally):
+            yield row
+    for key in ('specials', 'empty', 'rows'):
+        stats.count(key, tally[key])
+
+    _report(counts, names, result)
+
+
+def map_plates(plate_map, barseq, special=None, names=None, empty=False,
+               result=None):
+    """Map samples in plate maps to barcodes, in memory.
+
+    Parameters
+    ----------
+    plate_map : iterable of str
+        Lines of plate map
+    barseq : iterable of str, or BarseqIndex
+        Lines of barcode sequence template, starting with a header, or its
+        compiled index
+    special : iterable of str (optional)
+        Lines of special sample definitions, starting with a header
+    names : iterable of str (optional)
+        Lines of sample name list
+    empty : bool (optional)
+        Whether to yield rows of empty wells (default: false)
+    result : Result (optional)
+        Result to record output header, statistics, warnings and sample name
+        checks into
+
+    Yields
+    ------
+    Record
+        Mapping rows, in template order
+
+    Raises
+    ------
+    ValueError
+        If an input is invalid.
+
+    Notes
+    -----
+    Inputs may be open files, lists of lines or any other iterables; they
+    are consumed but not closed. Rows are resolved one at a time as they are
+    requested, and the result is complete once all of them have been.
+    """
+    for fields, suffix in _map_rows(plate_map, barseq, special, names, empty,
+                                    result):
+        yield Record(fields, suffix)
+
+
+def plate_mapper(input_f, barseq_f, output_f, names_f=None, special_f=None,
+                 empty=False, stats=None, report_fp=None, barcode_dist=None,
+                 catalog_fp=None, shard_by=None):
+    """Convert a plate map file into a mapping file.
+
+    Parameters
+    ----------
+    input_f : file object
+        Input plate map file
+    barseq_f : file object or BarseqIndex
+        Barcode sequence template file, or its compiled index
+    output_f : file object or ShardWriter
+        Output mapping file, or shards of it if `shard_by` is given
+    names_f : file object (optional)
+        Sample name list file
+    special_f : file object (optional)
+        Special sample definition file
+    empty : bool (optional)
+        Whether to keep empty lines in mapping file (default: false)
+    stats : RunStats (optional)
+        Statistics to record the run into, which also controls progress
+        messages (default: a new one)
+    report_fp : str (optional)
+        JSON report file of repeated, novel and missing sample names, with
+        suggested corrections of novel names (see `write_report`)
+    barcode_dist : int (optional)
+        If given, check barcodes assigned to samples for duplicates, and for
+        pairs within this Hamming distance (see `find_collisions`)
+    catalog_fp : str (optional)
+        SQLite catalog to record rows into as they are written (see
+        `Catalog`)
+    shard_by : str or int (optional)
+        Split rows into shards by "primer_plate", "plate_id" or the output
+        column of this number (see `shard_key`)
+
+    Returns
+    -------
+    RunStats
+        Phase timings, counters and warnings of the run
+
+    Notes
+    -----
+    This is a wrapper of `map_plates` that writes rows to a file, closes all
+    files, and issues a warning when sample names need attention.
+
+    The plate map and the special sample definitions are read into memory,
+    whereas the barcode sequence template is streamed: each row is resolved
+    and written as soon as it is read, so that memory usage does not grow
+    with the size of the template.
+
+    Counters are "plates" (plates parsed), "wells" (wells filled in plate
+    map), "specials" (special samples substituted), "empty" (empty wells of
+    mapped plates), "rows" (rows written), "shards" (shards written, if
+    sharded), and "repeated", "novel" and "missing" (numbers of such sample
+    names).
+    """
+    result = Result(RunStats() if stats is None else stats)
+    if shard_by is not None:
+        key = shard_key(shard_by, plate_ids=result.plate_ids)
+    rows = _map_rows(input_f, barseq_f, special_f, names_f, empty, result)
+    if barcode_dist is not None:
+        barcodes = []
+        rows = collect_barcodes(rows, barcodes)
+    catalog = None
+    if catalog_fp:
+        from plate_mapper.catalog import Catalog
+        catalog = Catalog(catalog_fp)
+        rows = catalog.collect(rows, 'plate_mapper',
+                               getattr(input_f, 'name', None),
+                               getattr(output_f, 'name', None),
+                               result.plate_ids)
+    if shard_by is None:
+        writer = BatchWriter(output_f)
+        lines = ('\t'.join(fields) + suffix for fields, suffix in rows)
+    else:
+        writer = output_f
+        lines = ((key(fields, suffix), '\t'.join(fields) + suffix)
+                 for fields, suffix in rows)
+    try:
+        writer.writelines(lines)
+        if catalog is not None:
+            catalog.commit()
+    finally:
+        if catalog is not None:
+            catalog.close()
+    writer.close()
+    if shard_by is not None:
+        result.stats.count('shards', len(writer.shards))
+    if barcode_dist is not None:
+        check_barcodes(barcodes, barcode_dist, result)
+    for f in (input_f, barseq_f, names_f, special_f):
+        if f:
+            f.close()
+
+    # Write sample name report
+    if report_fp:
+        with result.stats.phase('write_report', 'Writing sample name report'):
+            from plate_mapper.suggest import write_report
+            write_report(result, report_fp)
+
+    # Display warning message
+    if result.warnings:
+        warnings.warn('Warning:\n%s' % ''.join(result.warnings))
+
+    result.stats.log('Task completed.')
+    return result.stats
+
+
+def main(argv=None, prog=None):
+    """Run plate_mapper from the command line.
+
+    Parameters
+    ----------
+    argv : list of str (optional)
+        Command-line arguments (default: those of the process)
+    prog : str (optional)
+        Program name shown in usage (default: that of the script)
+    """
     # Parse arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-i', '--input', type=argparse.FileType('r'),
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('-i', '--input', type=FileArg('r'),
                         help='input plate map file', required=True)
-    parser.add_argument('-t', '--barseq', type=argparse.FileType('r'),
+    parser.add_argument('-t', '--barseq', type=FileArg('r'),
                         help='barcode sequence template file', required=True)
-    parser.add_argument('-o', '--output', type=argparse.FileType('w'),
-                        help='output mapping file', required=True)
-    parser.add_argument('-n', '--names', type=argparse.FileType('r'),
+    parser.add_argument('-o', '--output', type=FileArg('w', atomic=True),
+                        help='output mapping file, which is replaced once '
+                             'complete, and only if changed (required '
+                             'unless checking)',
+                        required=False, default=None)
+    parser.add_argument('-n', '--names', type=FileArg('r'),
                         help='(optional) sample name list file',
                         required=False, default=None)
-    parser.add_argument('-s', '--special', type=argparse.FileType('r'),
-                        help='(optional) special sample definition file',
+    parser.add_argument('-s', '--special', type=FileArg('r'),
+                        help='(optional) special sample definition file, '
+                             'whose codes may be patterns: prefix:BLANK, '
+                             'glob:BLANK*, re:BLANK\\d+',
                         required=False, default=None)
     parser.add_argument('-e', '--empty', action='store_true',
                         help='keep empty lines in mapping file')
-    args = parser.parse_args()
-    plate_mapper(args.input, args.barseq, args.output, args.names,
-                 args.special, args.empty)
+    parser.add_argument('-x', '--index-dir',
+                        help='(optional) directory of compiled barcode '
+                             'sequence template indices',
+                        required=False, default=None)
+    parser.add_argument('-r', '--report',
+                        help='(optional) JSON report of sample name checks, '
+                             'with suggested corrections of novel names',
+                        required=False, default=None)
+    parser.add_argument('-b', '--barcode-dist', type=int,
+                        help='(optional) check barcodes of samples for '
+                             'duplicates and pairs within this Hamming '
+                             'distance',
+                        required=False, default=None)
+    parser.add_argument('-c', '--cache',
+                        help='(optional) cache file of rendered plates, to '
+                             'only convert plates changed since last run',
+                        required=False, default=None)
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not print progress messages')
+    parser.add_argument('--stats',
+                        help='(optional) write phase timings, peak memory '
+                             'and counters to this JSON file',
+                        required=False, default=None)
+    parser.add_argument('--sheet', action='append',
+                        help='(optional) sheet of an .xlsx plate map to '
+                             'read, which may be given more than once '
+                             '(default: the first sheet)',
+                        required=False, default=None)
+    parser.add_argument('--all-sheets', action='store_true',
+                        help='read all sheets of an .xlsx plate map')
+    parser.add_argument('--catalog',
+                        help='(optional) SQLite catalog to record output '
+                             'rows into, for queries across runs',
+                        required=False, default=None)
+    parser.add_argument('--manifest',
+                        help='(optional) write SHA-256 digests of inputs '
+                             'and output, and whether the output changed, '
+                             'to this JSON file',
+                        required=False, default=None)
+    parser.add_argument('--shard-by',
+                        help='(optional) split output into one file per '
+                             'primer plate ("primer_plate"), plate of the '
+                             'plate map ("plate_id"), or value of the '
+                             'output column of this number, written in one '
+                             'pass to --shard-dir',
+                        required=False, default=None)
+    parser.add_argument('--shard-dir',
+                        help='(optional) output directory of shards, with '
+                             'an index.tsv of shards and their row counts',
+                        required=False, default=None)
+    parser.add_argument('--max-open', type=int,
+                        help='(optional) maximum number of shards open at a '
+                             'time (default: 64)',
+                        required=False, default=64)
+    parser.add_argument('--check', action='store_true',
+                        help='validate inputs and report all errors and '
+                             'warnings, without writing output')
+    parser.add_argument('--check-json',
+                        help='(optional) also write the validation report '
+                             'to this JSON file',
+                        required=False, default=None)
+    args = parser.parse_args(argv)
+    if (args.shard_by is None) != (args.shard_dir is None):
+        parser.error('--shard-by and --shard-dir must be given together')
+    if args.shard_dir and args.output is not None:
+        parser.error('-o does not apply to sharded runs')
+    if args.output is None and not args.check and not args.shard_dir:
+        parser.error('the following arguments are required: -o/--output')
+    if args.cache and args.catalog:
+        parser.error('--catalog does not apply to cached runs')
+    if args.cache and args.shard_dir:
+        parser.error('--shard-by does not apply to cached runs')
+    if args.max_open < 1:
+        parser.error('--max-open must be at least 1')
+    if args.sheet or args.all_sheets:
+        from plate_mapper.xlsx import select_sheets
+        try:
+            select_sheets([args.input], args.sheet, args.all_sheets)
+        except ValueError as e:
+            sys.exit(str(e))
+    stats = RunStats(args.quiet, memory=args.stats is not None)
+    # Welcome information
+    stats.log('Plate Mapper: Convert a plate map file into a mapping file.\n'
+              'Last updated: Jun 22, 2017.')
+    barseq = args.barseq
+    if args.index_dir:
+        barseq.close()
+        barseq = load_index(barseq.name, args.index_dir)
+    if args.check:
+        from plate_mapper.validate import check_plate_mapper
+        report = check_plate_mapper(args.input, barseq, args.names,
+                                    args.special, args.barcode_dist)
+        sys.stdout.write(report.text())
+        if args.check_json:
+            report.dump(args.check_json)
+        return 1 if report.errors else None
+    warnings.formatwarning = lambda msg, cat, fname, lineno, line: str(msg)
+    if args.shard_dir:
+        args.output = ShardWriter(args.shard_dir, max_open=args.max_open)
+    try:
+        if args.cache:
+            from plate_mapper.incremental import plate_mapper_incremental
+            plate_mapper_incremental(args.input, barseq, args.output,
+                                     args.cache, args.names, args.special,
+                                     args.empty, stats, args.report,
+                                     args.barcode_dist)
+        else:
+            plate_mapper(args.input, barseq, args.output, args.names,
+                         args.special, args.empty, stats, args.report,
+                         args.barcode_dist, args.catalog,
+                         args.shard_by)
+    except BaseException:
+        discard(args.output)
+        raise
+    if args.manifest:
+        write_manifest(args.manifest, 'plate_mapper',
+                       {'input': args.input, 'barseq': args.barseq,
+                        'names': args.names, 'special': args.special},
+                       list(args.output.shards.values()) if args.shard_dir
+                       else [args.output])
+    if args.stats:
+        stats.dump(args.stats)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
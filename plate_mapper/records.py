@@ -0,0 +1,152 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+from plate_mapper.stats import RunStats
+
+
+class Record(object):
+    """A row of a mapping file.
+
+    Parameters
+    ----------
+    fields : sequence of str
+        Sample ID, barcode, primer, primer plate ID and well ID, possibly
+        followed by more primer table columns
+    suffix : str
+        Remaining columns rendered as the tail of an output line, starting
+        with a tab (unless there is none) and ending with a newline
+
+    Notes
+    -----
+    Metadata are kept in the rendered form shared by all rows of a plate,
+    and only split into columns when asked for, so that creating a record
+    copies nothing.
+    """
+
+    __slots__ = ('fields', 'suffix')
+
+    def __init__(self, fields, suffix='\n'):
+        self.fields = fields
+        self.suffix = suffix
+
+    @property
+    def sample(self):
+        """Sample ID."""
+        return self.fields[0]
+
+    @property
+    def barcode(self):
+        """Barcode sequence."""
+        return self.fields[1]
+
+    @property
+    def primer(self):
+        """Linker primer sequence."""
+        return self.fields[2]
+
+    @property
+    def plate(self):
+        """Primer plate ID."""
+        return self.fields[3]
+
+    @property
+    def well(self):
+        """Well ID."""
+        return self.fields[4]
+
+    @property
+    def metadata(self):
+        """Columns after the fields, as a tuple of str.
+
+        A suffix of no columns, or of a single empty one, as rendered for
+        plates without metadata, has no metadata.
+        """
+        if self.suffix == '\n' or self.suffix == '\t\n':
+            return ()
+        return tuple(self.suffix[1:-1].split('\t'))
+
+    def columns(self):
+        """Get all columns.
+
+        Returns
+        -------
+        tuple of str
+            Fields followed by metadata
+        """
+        return tuple(self.fields) + self.metadata
+
+    def line(self):
+        """Render as an output line.
+
+        Returns
+        -------
+        str
+            Tab-delimited line, including newline
+        """
+        return '\t'.join(self.fields) + self.suffix
+
+    def __eq__(self, other):
+        return isinstance(other, Record) and self.line() == other.line()
+
+    def __repr__(self):
+        return 'Record(%r, %r)' % (tuple(self.fields), self.suffix)
+
+
+class Result(object):
+    """Outcome of a run, besides its records.
+
+    Parameters
+    ----------
+    stats : RunStats (optional)
+        Statistics to record the run into (default: a new, quiet one)
+
+    Attributes
+    ----------
+    stats : RunStats
+        Phase timings and counters
+    header : list of str
+        Column headers of the output, if it has any
+    repeated : list of str
+        Sample names that occur more than once
+    novel : list of str
+        Sample names not in the name list
+    missing : list of str
+        Sample names in the name list (plate_mapper), or in the metadata
+        (plate_linker), that are not in the output
+    duplicates : dict of list of str
+        Barcode : wells, for barcodes assigned to more than one sample
+    similar : list of tuple of (str, str, int)
+        Pairs of barcodes assigned to samples that are within the checked
+        Hamming distance, and their distance
+    errors : list of str
+        Error messages of problems that did not stop the run
+    plate_ids : dict of str
+        Primer plate ID : plate ID of the plate map (plate_mapper)
+
+    Notes
+    -----
+    The result is filled as records are consumed, and is complete once the
+    iterator is exhausted.
+    """
+
+    def __init__(self, stats=None):
+        self.stats = RunStats(quiet=True) if stats is None else stats
+        self.header = []
+        self.repeated = []
+        self.novel = []
+        self.missing = []
+        self.duplicates = {}
+        self.similar = []
+        self.errors = []
+        self.plate_ids = {}
+
+    @property
+    def warnings(self):
+        """Warning messages."""
+        return self.stats.warnings
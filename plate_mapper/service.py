@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import os
+import json
+import socket
+import asyncio
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from plate_mapper.barcodes import collect_barcodes, check_barcodes
+from plate_mapper.barseq_index import _hash_file
+from plate_mapper.fileio import open_file, AtomicFile
+from plate_mapper.plate_mapper import _map_rows, _read_barseq, _read_special
+from plate_mapper.records import Result
+from plate_mapper.writer import BatchWriter
+from plate_linker.plate_linker import link_plates
+
+
+def describe_error(e):
+    """Write an exception as an error message.
+
+    Parameters
+    ----------
+    e : Exception
+        Exception
+
+    Returns
+    -------
+    str
+        Message of an expected error, such as invalid input, or the type
+        and message of any other
+    """
+    if isinstance(e, (ValueError, OSError)):
+        return str(e)
+    return 'Error: %s: %s.' % (type(e).__name__, e)
+
+
+class LRUCache(object):
+    """Thread-safe cache that evicts the least recently used items.
+
+    Parameters
+    ----------
+    maxsize : int (optional)
+        Maximum number of items (default: 16)
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups answered from the cache
+    misses : int
+        Number of lookups that loaded the item
+    """
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, load):
+        """Get an item, loading it if it is not cached.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of item
+        load : callable
+            Function that returns the item, called without the lock held
+
+        Returns
+        -------
+        object
+            Item
+        bool
+            Whether it was cached
+        """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key], True
+            self.misses += 1
+        value = load()
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value, False
+
+
+class ConversionService(object):
+    """Conversions that share parsed inputs across requests.
+
+    Parameters
+    ----------
+    cache_size : int (optional)
+        Maximum number of parsed files kept in memory (default: 16)
+
+    Attributes
+    ----------
+    cache : LRUCache
+        Parsed barcode sequence templates, special sample definitions and
+        primer files, keyed by kind and SHA-256 digest of file content
+
+    Notes
+    -----
+    A request is a dictionary of file paths and options, named as the
+    command-line arguments of the tools:
+
+        {"tool": "plate_mapper", "input": ..., "barseq": ...,
+         "output": ..., "names": ..., "special": ..., "empty": false,
+         "barcode_dist": null}
+        {"tool": "plate_linker", "metadata": ..., "primer": ...,
+         "output": ..., "engine": "auto", "barcode_dist": null}
+
+    If "output" is omitted, the output is returned in the response as
+    "mapping"; otherwise, it is written atomically (see `AtomicFile`).
+
+    A file is hashed whenever its size or modification time changes, and
+    only parsed when its digest is not cached, so repeated requests only
+    read their plate maps or metadata.
+
+    Requests are not authenticated, and name any files to read and write,
+    which are accessed with the privileges of the service. Hence whoever
+    can connect to the service can read and overwrite what the service can,
+    and the service must only be reachable by trusted users: it listens on
+    a Unix socket, whose access is that of the socket file and its
+    directory, or on a loopback address, which any local user can connect
+    to (see `start_server`).
+    """
+
+    def __init__(self, cache_size=16):
+        self.cache = LRUCache(cache_size)
+        self._digests = {}  # file path : (mtime, size, digest)
+        self._lock = threading.Lock()
+
+    def _digest(self, fp):
+        """Get SHA-256 digest of a file, rehashing only if it changed."""
+        st = os.stat(fp)
+        with self._lock:
+            rec = self._digests.get(fp)
+        if rec is not None and rec[:2] == (st.st_mtime_ns, st.st_size):
+            return rec[2]
+        digest = _hash_file(fp)
+        with self._lock:
+            self._digests[fp] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def _load(self, kind, fp, parse, hits):
+        """Get a parsed file from cache, or parse and cache it."""
+        def load():
+            with open_file(fp) as f:
+                return parse(f)
+        value, cached = self.cache.get((kind, self._digest(fp)), load)
+        hits[kind] = cached
+        return value
+
+    def handle(self, request):
+        """Process a request.
+
+        Parameters
+        ----------
+        request : dict
+            Request (see class notes)
+
+        Returns
+        -------
+        dict
+            Response: {"ok": true, "counters": ..., "warnings": ...,
+            "cached": {kind: whether parsed file was cached}, and
+            "mapping" if no output file was given}, or {"ok": false,
+            "error": error message}
+
+        Notes
+        -----
+        Any error of a request is answered with a response, so that it
+        neither stops the service nor leaves the client without a response.
+        """
+        try:
+            tool = request.get('tool')
+            if tool == 'plate_mapper':
+                return self._plate_mapper(request)
+            elif tool == 'plate_linker':
+                return self._plate_linker(request)
+            raise ValueError('Error: invalid tool: %s.' % tool)
+        except KeyError as e:
+            return {'ok': False, 'error': 'Error: missing request field: %s.'
+                    % e.args[0]}
+        except Exception as e:
+            return {'ok': False, 'error': describe_error(e)}
+
+    def _plate_mapper(self, request):
+        hits = {}
+        barseqs = self._load('barseq', request['barseq'],
+                             lambda f: list(_read_barseq(f)), hits)
+        specs = None
+        if request.get('special'):
+            specs = self._load('special', request['special'], _read_special,
+                               hits)
+        result = Result()
+        names_f = open_file(request['names']) if request.get('names') \
+            else None
+        try:
+            with open_file(request['input']) as input_f:
+                rows = _map_rows(input_f, None, names=names_f,
+                                 empty=request.get('empty', False),
+                                 result=result, barseqs=barseqs, specs=specs)
+                return self._write(request, rows, result, hits)
+        finally:
+            if names_f:
+                names_f.close()
+
+    def _plate_linker(self, request):
+        hits = {}
+        primers = self._load('primer', request['primer'], lambda f: [
+            x.rstrip('\r\n').split('\t') for x in f], hits)
+        result = Result()
+        with open_file(request['metadata']) as metadata_f:
+            rows = ((x.fields, x.suffix) for x in link_plates(
+                metadata_f, primers, request.get('engine', 'auto'), result))
+            return self._write(request, rows, result, hits,
+                               '%s\n' % '\t'.join(result.header))
+
+    def _write(self, request, rows, result, hits, header=''):
+        """Write or render output rows, and build the response.
+
+        Errors recorded in the result once all rows are generated, such as
+        samples without matched primers, are raised, and an output file is
+        then left as it was.
+        """
+        dist = request.get('barcode_dist')
+        if dist is not None:
+            barcodes = []
+            rows = collect_barcodes(rows, barcodes)
+        lines = ('\t'.join(fields) + suffix for fields, suffix in rows)
+        res = {'ok': True, 'cached': hits}
+        if request.get('output'):
+            with AtomicFile(request['output']) as f:
+                writer = BatchWriter(f)
+                if header:
+                    writer.write(header)
+                writer.writelines(lines)
+                if result.errors:
+                    raise ValueError(result.errors[0])
+                writer.close()
+        else:
+            res['mapping'] = header + ''.join(lines)
+            if result.errors:
+                raise ValueError(result.errors[0])
+        if dist is not None:
+            check_barcodes(barcodes, dist, result)
+        res['counters'] = result.stats.counters
+        res['warnings'] = result.warnings
+        return res
+
+
+async def _serve_client(service, executor, reader, writer):
+    """Answer newline-delimited JSON requests of a connection."""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError
+            except ValueError:
+                response = {'ok': False, 'error': 'Error: invalid request.'}
+            else:
+                response = await loop.run_in_executor(
+                    executor, service.handle, request)
+            writer.write(json.dumps(response).encode('utf-8') + b'\n')
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+def _is_loopback(host):
+    """Check whether a host address is a loopback address."""
+    import ipaddress
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+async def start_server(service, path=None, host='127.0.0.1', port=0,
+                       workers=None):
+    """Start serving conversion requests.
+
+    Parameters
+    ----------
+    service : ConversionService
+        Service to process requests
+    path : str (optional)
+        Unix socket path; if omitted, listen on a TCP port instead
+    host : str (optional)
+        Loopback address of TCP server (default: 127.0.0.1)
+    port : int (optional)
+        TCP port, or 0 to pick a free one (default: 0)
+    workers : int (optional)
+        Maximum number of concurrent conversions (default: chosen by
+        `ThreadPoolExecutor`)
+
+    Returns
+    -------
+    asyncio.AbstractServer
+        Server, which is already accepting connections
+
+    Raises
+    ------
+    ValueError
+        If the host address is not a loopback address.
+
+    Notes
+    -----
+    As requests read and write files without authentication (see
+    `ConversionService`), the service does not listen on addresses reachable
+    from other hosts.
+
+    Each connection may send any number of requests, one JSON object per
+    line, and receives one JSON response per line, in order. Conversions
+    run in a thread pool, so that requests of different connections are
+    served concurrently.
+    """
+    if path is None and not _is_loopback(host):
+        raise ValueError('Error: the service only listens on a loopback '
+                         'address, not %s.' % host)
+    executor = ThreadPoolExecutor(workers)
+
+    def client(reader, writer):
+        return _serve_client(service, executor, reader, writer)
+    if path is not None:
+        return await asyncio.start_unix_server(client, path)
+    return await asyncio.start_server(client, host, port)
+
+
+def send_request(request, path=None, host='127.0.0.1', port=None,
+                 timeout=None):
+    """Send a request to a conversion service and wait for its response.
+
+    Parameters
+    ----------
+    request : dict
+        Request (see `ConversionService`)
+    path : str (optional)
+        Unix socket path of service
+    host : str (optional)
+        Host address of service (default: 127.0.0.1)
+    port : int (optional)
+        TCP port of service, if it is not given a Unix socket path
+    timeout : float (optional)
+        Timeout in seconds (default: none)
+
+    Returns
+    -------
+    dict
+        Response
+    """
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = path
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = (host, port)
+    with sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+async def _main(args):
+    service = ConversionService(args.cache_size)
+    server = await start_server(service, args.socket, port=args.port,
+                                workers=args.workers)
+    address = args.socket or '%s:%d' % server.sockets[0].getsockname()[:2]
+    print('Serving on %s.' % address)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None, prog=None):
+    """Run the conversion service from the command line.
+
+    Parameters
+    ----------
+    argv : list of str (optional)
+        Command-line arguments (default: those of the process)
+    prog : str (optional)
+        Program name shown in usage (default: that of the script)
+    """
+    # Welcome information
+    print('Wetlab Assistant Service: Convert plate maps and link plates on '
+          'request, keeping parsed templates in memory.')
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('-s', '--socket',
+                        help='Unix socket path to listen on',
+                        required=False, default=None)
+    parser.add_argument('-p', '--port', type=int, default=8765,
+                        help='TCP port to listen on at 127.0.0.1, if no '
+                             'socket is given (default: 8765)')
+    parser.add_argument('-c', '--cache-size', type=int, default=16,
+                        help='maximum number of parsed files to keep '
+                             '(default: 16)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='maximum number of concurrent conversions')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
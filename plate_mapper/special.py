@@ -0,0 +1,177 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import re
+from fnmatch import translate
+
+
+# code prefixes of pattern definitions
+PATTERN_TYPES = ('prefix:', 'glob:', 're:')
+
+
+class SpecialSamples(dict):
+    """Special sample definitions, by exact code and by pattern.
+
+    Exact codes are the keys of the dictionary itself. Pattern codes are
+    written as "prefix:BLANK" (sample names starting with "BLANK"),
+    "glob:BLANK*.?" (shell-style wildcards) or "re:BLANK\\d+" (regular
+    expression), and are kept apart from exact codes.
+
+    Attributes
+    ----------
+    patterns : list of tuple of (str, dict)
+        Pattern code and definition, in file order
+    matches : dict of dict
+        Sample name : definition found by pattern codes, filled when a name
+        is first looked up; looking up other names gives None
+
+    Notes
+    -----
+    A sample name is resolved by precedence:
+
+    1. an exact code, by dictionary lookup, as without patterns;
+    2. the longest matching prefix code, by walking a trie of prefixes;
+    3. the first matching glob or regular expression code in file order, by
+       one regular expression that is the alternation of all of them.
+
+    Glob and regular expression codes must match the whole sample name. As
+    they are combined into one expression, their groups are renumbered, so
+    backreferences must refer to groups by name.
+
+    Patterns are compiled once, and the definition found for a name is
+    remembered, so that each distinct special name in a plate map is matched
+    once however many wells and patterns there are. Names that are not exact
+    codes may be looked up in `matches` directly, which then costs a
+    dictionary lookup.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SpecialSamples, self).__init__(*args, **kwargs)
+        self.patterns = []
+        self._trie = {}
+        self._alternatives = []  # regex and definition of glob and re codes
+        self._regex = None  # alternation of them, compiled when needed
+        self.matches = _Matches(self._find)
+
+    def add(self, code, spec):
+        """Add a definition.
+
+        Parameters
+        ----------
+        code : str
+            Exact or pattern code
+        spec : dict
+            Definition
+
+        Raises
+        ------
+        ValueError
+            If the pattern is empty or not a valid regular expression.
+        """
+        for kind in PATTERN_TYPES:
+            if code.startswith(kind):
+                break
+        else:
+            self[code] = spec
+            return
+        pattern = code[len(kind):]
+        if not pattern:
+            raise ValueError('Error: Code %s has an empty pattern.'
+                             % repr(code))
+        if kind == 'prefix:':
+            node = self._trie
+            for c in pattern:
+                node = node.setdefault(c, {})
+            node[None] = spec
+        else:
+            if kind == 'glob:':
+                pattern = translate(pattern)
+            # each alternative is a named group, which tells which matched
+            pattern = '(?P<_%d>%s)' % (len(self._alternatives), pattern)
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError('Error: Code %s is not a valid pattern: %s.'
+                                 % (repr(code), e))
+            self._alternatives.append((pattern, spec))
+            self._regex = None
+        self.patterns.append((code, spec))
+        self.matches.clear()
+
+    def compile(self):
+        """Compile glob and regular expression codes into one expression.
+
+        Raises
+        ------
+        ValueError
+            If the codes cannot be combined, such as when they define groups
+            of the same name.
+        """
+        if self._regex is None and self._alternatives:
+            try:
+                self._regex = re.compile('|'.join(
+                    x for x, _ in self._alternatives))
+            except re.error as e:
+                raise ValueError('Error: Pattern codes cannot be combined: '
+                                 '%s.' % e)
+
+    def match(self, sample):
+        """Find the definition of a sample name.
+
+        Parameters
+        ----------
+        sample : str
+            Sample name
+
+        Returns
+        -------
+        dict or None
+            Definition, or None if the name is a normal sample
+        """
+        spec = self.get(sample)
+        if spec is None and self.patterns:
+            spec = self.matches[sample]
+        return spec
+
+    def _find(self, sample):
+        """Find the definition of a sample name by pattern."""
+        spec = None
+        node = self._trie
+        for c in sample:
+            node = node.get(c)
+            if node is None:
+                break
+            spec = node.get(None, spec)
+        if spec is None and self._alternatives:
+            self.compile()
+            m = self._regex.fullmatch(sample)
+            if m is not None:
+                spec = self._alternatives[int(m.lastgroup[1:])][1]
+        return spec
+
+
+class _Matches(dict):
+    """Definitions found by pattern, by sample name, found on first lookup.
+
+    Parameters
+    ----------
+    find : callable
+        Function that finds the definition of a sample name, or None
+    """
+
+    def __init__(self, find):
+        super(_Matches, self).__init__()
+        self.find = find
+
+    def __missing__(self, sample):
+        # only special names are kept, as normal names are mostly unique
+        spec = self.find(sample)
+        if spec is not None:
+            self[sample] = spec
+        return spec
@@ -0,0 +1,128 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import time
+from contextlib import contextmanager
+
+
+class RunStats(object):
+    """Progress messages, phase timings and counters of a run.
+
+    Parameters
+    ----------
+    quiet : bool (optional)
+        Whether to suppress progress messages (default: false)
+    memory : bool (optional)
+        Whether to record peak memory of each phase (default: false)
+
+    Attributes
+    ----------
+    phases : list of dict
+        Name, wall time (in seconds) and, if recorded, peak memory (in bytes)
+        of each phase, in order
+    counters : dict of int
+        Named counts, such as plates parsed or rows written
+    warnings : list of str
+        Warning messages
+
+    Notes
+    -----
+    Phases are timed at their boundaries, and counters are updated once per
+    phase rather than once per row, so collecting statistics adds no
+    per-row cost. Peak memory is measured with `tracemalloc`, which does slow
+    down a run, therefore it is only recorded when requested.
+    """
+
+    def __init__(self, quiet=False, memory=False):
+        self.quiet = quiet
+        self.memory = memory
+        self.phases = []
+        self.counters = {}
+        self.warnings = []
+
+    def log(self, msg):
+        """Print a progress message unless quiet.
+
+        Parameters
+        ----------
+        msg : str
+            Message
+        """
+        if not self.quiet:
+            print(msg)
+
+    @contextmanager
+    def phase(self, name, msg=None):
+        """Time a phase of the run.
+
+        Parameters
+        ----------
+        name : str
+            Phase name
+        msg : str (optional)
+            Progress message printed before the phase, followed by "Done."
+            after it
+        """
+        if msg:
+            self.log('%s...' % msg)
+        started = False
+        if self.memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started = True
+            elif hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            rec = {'name': name, 'time': time.perf_counter() - start}
+            if self.memory:
+                rec['peak'] = tracemalloc.get_traced_memory()[1]
+                if started:
+                    tracemalloc.stop()
+            self.phases.append(rec)
+        if msg:
+            self.log('  Done.')
+
+    def count(self, name, n=1):
+        """Increase a counter.
+
+        Parameters
+        ----------
+        name : str
+            Counter name
+        n : int (optional)
+            Increment (default: 1)
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        """Export statistics as a dictionary.
+
+        Returns
+        -------
+        dict
+            Phases, counters and warnings
+        """
+        return {'phases': self.phases, 'counters': self.counters,
+                'warnings': self.warnings}
+
+    def dump(self, fp):
+        """Write statistics to a JSON file.
+
+        Parameters
+        ----------
+        fp : str
+            Output file path
+        """
+        import json
+        with open(fp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
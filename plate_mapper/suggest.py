@@ -0,0 +1,198 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import json
+
+
+def edit_distance(a, b, k=None):
+    """Calculate Levenshtein distance between two strings.
+
+    Parameters
+    ----------
+    a : str
+        First string
+    b : str
+        Second string
+    k : int (optional)
+        Maximum distance of interest; computation stops early once it is
+        exceeded
+
+    Returns
+    -------
+    int
+        Minimum number of single-character insertions, deletions and
+        substitutions that turn one string into the other, or k + 1 if that
+        is greater than k
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if k is not None and len(a) - len(b) > k:
+        return k + 1
+    if not b:
+        return len(a)
+    prev = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        cur = [i]
+        for j, y in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1,
+                           prev[j - 1] + (x != y)))
+        if k is not None and min(cur) > k:
+            return k + 1
+        prev = cur
+    if k is not None and prev[-1] > k:
+        return k + 1
+    return prev[-1]
+
+
+def _deletions(word, k):
+    """Generate variants of a string with up to k characters deleted.
+
+    Parameters
+    ----------
+    word : str
+        Input string
+    k : int
+        Maximum number of deletions
+
+    Returns
+    -------
+    set of str
+        Variants, including the string itself
+    """
+    res = {word}
+    level = {word}
+    for _ in range(k):
+        level = {x[:i] + x[i + 1:] for x in level for i in range(len(x))}
+        res |= level
+    return res
+
+
+class NameIndex(object):
+    """Index of strings for approximate lookup by edit distance.
+
+    Parameters
+    ----------
+    words : iterable of str
+        Strings to index
+    k : int (optional)
+        Maximum edit distance of lookups (default: 2)
+
+    Notes
+    -----
+    This is a symmetric deletion index: every variant of each string with
+    up to k characters deleted is mapped to the string. Two strings within
+    edit distance k share at least one such variant, therefore a lookup only
+    generates the deletion variants of the query, and verifies the few
+    strings they map to, rather than comparing the query with all strings.
+
+    Index size grows with the number of variants per string, which is about
+    (length choose k); this suits sample names and small k.
+    """
+
+    def __init__(self, words, k=2):
+        self.k = k
+        self.index = {}  # deletion variant : strings
+        for word in set(words):
+            for x in _deletions(word, k):
+                self.index.setdefault(x, []).append(word)
+
+    def search(self, word, k=None):
+        """Find strings within an edit distance of a query.
+
+        Parameters
+        ----------
+        word : str
+            Query string
+        k : int (optional)
+            Maximum edit distance, no greater than that of the index
+            (default: that of the index)
+
+        Returns
+        -------
+        list of tuple of (int, str)
+            Distance and string, sorted
+        """
+        k = self.k if k is None else min(k, self.k)
+        cands = set()
+        for x in _deletions(word, k):
+            cands.update(self.index.get(x, ()))
+        res = []
+        for x in cands:
+            d = edit_distance(word, x, k)
+            if d <= k:
+                res.append((d, x))
+        return sorted(res)
+
+
+def suggest_names(novel, missing, max_dist=2, limit=3):
+    """Suggest intended names for novel sample names.
+
+    Parameters
+    ----------
+    novel : iterable of str
+        Sample names in plate map but not in name list
+    missing : iterable of str
+        Sample names in name list but not in plate map
+    max_dist : int (optional)
+        Maximum edit distance of a suggestion (default: 2)
+    limit : int (optional)
+        Maximum number of suggestions per name (default: 3)
+
+    Returns
+    -------
+    dict of list of tuple of (str, int)
+        Novel name : missing names and their edit distances, closest first;
+        novel names without suggestions are omitted
+
+    Notes
+    -----
+    Missing names are indexed by their deletion variants (see `NameIndex`),
+    which is then searched with each novel name, so that not all pairs of
+    names are compared.
+    """
+    index = NameIndex(missing, max_dist)
+    res = {}
+    for name in novel:
+        hits = index.search(name)
+        if hits:
+            res[name] = [(x, d) for d, x in hits[:limit]]
+    return res
+
+
+def write_report(result, report_fp, max_dist=2, limit=3):
+    """Write sample name checks of a run to a JSON file.
+
+    Parameters
+    ----------
+    result : Result
+        Result of a run
+    report_fp : str
+        Output report file path
+    max_dist : int (optional)
+        Maximum edit distance of a suggestion (default: 2)
+    limit : int (optional)
+        Maximum number of suggestions per name (default: 3)
+
+    Notes
+    -----
+    The report has the complete lists of repeated, novel and missing names,
+    and for each novel name, the missing names it is likely a typo of:
+
+        {"repeated": [...], "novel": [...], "missing": [...],
+         "suggestions": {"novel name": [{"name": "missing name",
+                                         "distance": 1}, ...], ...}}
+    """
+    suggestions = suggest_names(result.novel, result.missing, max_dist,
+                                limit)
+    report = {'repeated': result.repeated, 'novel': result.novel,
+              'missing': result.missing,
+              'suggestions': {k: [{'name': x, 'distance': d} for x, d in v]
+                              for k, v in suggestions.items()}}
+    with open(report_fp, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
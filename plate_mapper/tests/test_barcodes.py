@@ -0,0 +1,162 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import json
+from unittest import TestCase, main
+from tempfile import mkdtemp
+from shutil import rmtree
+from os.path import join
+from itertools import combinations
+from warnings import catch_warnings, simplefilter
+from plate_mapper.plate_mapper import plate_mapper
+from plate_mapper.stats import RunStats
+from plate_mapper.records import Result
+from plate_mapper.barcodes import (hamming, find_collisions, write_collisions,
+                                   collect_barcodes, check_barcodes,
+                                   _segments, _read_barcodes)
+
+
+class BarcodesTests(TestCase):
+    """Tests for barcodes.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def test_hamming(self):
+        """Test hamming."""
+        self.assertEqual(hamming('', ''), 0)
+        self.assertEqual(hamming('ACGT', 'ACGT'), 0)
+        self.assertEqual(hamming('ACGT', 'ACGA'), 1)
+        self.assertEqual(hamming('ACGT', 'TGCA'), 4)
+
+    def test__segments(self):
+        """Test _segments."""
+        self.assertListEqual(_segments(12, 1), [(0, 6), (6, 12)])
+        self.assertListEqual(_segments(12, 2), [(0, 4), (4, 8), (8, 12)])
+        self.assertListEqual(_segments(5, 2), [(0, 1), (1, 3), (3, 5)])
+        self.assertListEqual(_segments(1, 2), [(0, 0), (0, 0), (0, 1)])
+
+    def test_find_collisions(self):
+        """Test find_collisions."""
+        barcodes = [('AAAAAAAA', '1.A1'), ('AAAAAAAT', '1.A2'),
+                    ('AAAATTTT', '1.A3'), ('AAAAAAAA', '1.A4'),
+                    ('TAAAAAAT', '1.A5'), ('AAAAAAA', '1.A6')]
+        dup, pairs = find_collisions(barcodes)
+        self.assertDictEqual(dup, {'AAAAAAAA': ['1.A1', '1.A4']})
+        exp = [('AAAAAAAA', 'AAAAAAAT', 1), ('AAAAAAAT', 'TAAAAAAT', 1)]
+        self.assertListEqual(pairs, exp)
+        _, pairs = find_collisions(barcodes, 2)
+        exp = [('AAAAAAAA', 'AAAAAAAT', 1), ('AAAAAAAA', 'TAAAAAAT', 2),
+               ('AAAAAAAT', 'TAAAAAAT', 1)]
+        self.assertListEqual(pairs, exp)
+        # duplicates only
+        dup, pairs = find_collisions(barcodes, 0)
+        self.assertEqual(len(dup), 1)
+        self.assertListEqual(pairs, [])
+        self.assertTupleEqual(find_collisions([]), ({}, []))
+
+    def test_check_barcodes(self):
+        """Test collect_barcodes and check_barcodes."""
+        rows = [(('sp001', 'AAAAAAAA', 'GT', '1', 'A1'), '\n'),
+                (('', 'AAAAAAAT', 'GT', '1', 'A2'), '\n'),
+                (('sp003', 'AAAAAAAA', 'GT', '1', 'A3'), '\n'),
+                (('sp004', 'AAAAAAAT', 'GT', '1', 'A4'), '\n')]
+        barcodes = []
+        # rows pass through, and barcodes of empty wells are left out
+        self.assertListEqual(list(collect_barcodes(rows, barcodes)), rows)
+        self.assertListEqual(barcodes, [('AAAAAAAA', '1.A1'),
+                                        ('AAAAAAAA', '1.A3'),
+                                        ('AAAAAAAT', '1.A4')])
+        result = Result()
+        check_barcodes(barcodes, 1, result)
+        self.assertDictEqual(result.duplicates,
+                             {'AAAAAAAA': ['1.A1', '1.A3']})
+        self.assertListEqual(result.similar, [('AAAAAAAA', 'AAAAAAAT', 1)])
+        self.assertEqual(result.stats.counters['duplicated_barcodes'], 1)
+        self.assertEqual(result.stats.counters['similar_barcodes'], 1)
+        self.assertListEqual(result.warnings, [
+            '  Duplicated barcodes: AAAAAAAA (1.A1 1.A3).\n'
+            '  Similar barcodes: AAAAAAAA/AAAAAAAT.\n'])
+
+    def test_find_collisions_exhaustive(self):
+        """Test find_collisions against comparing all pairs."""
+        barcodes = ['%s%s' % (x, y) for x in ('AC', 'AG', 'TC', 'TT')
+                    for y in ('GGA', 'GGT', 'CGA', 'ATA', 'GG')]
+        for k in range(4):
+            obs = find_collisions([(x, '') for x in barcodes], k)[1]
+            exp = sorted((a, b, hamming(a, b)) for a, b in
+                         combinations(sorted(barcodes), 2)
+                         if len(a) == len(b) and 0 < hamming(a, b) <= k)
+            self.assertListEqual(obs, exp)
+
+    def test__read_barcodes(self):
+        """Test _read_barcodes."""
+        lines = ['#SampleID\tBarcodeSequence\n', 's1\tACGT\n', 's2\t\n',
+                 's3\n', 's4\tACGA\r\n']
+        obs = list(_read_barcodes(lines, 2))
+        self.assertListEqual(obs, [('ACGT', 'line 2'), ('ACGA', 'line 5')])
+        obs = list(_read_barcodes(['ACGT\tx\n'], header=False))
+        self.assertListEqual(obs, [('ACGT', 'line 1')])
+
+    def test_write_collisions(self):
+        """Test write_collisions."""
+        report_fp = join(self.wkdir, 'report.json')
+        write_collisions(*find_collisions(
+            [('ACGT', 'a'), ('ACGT', 'b'), ('ACGA', 'c')]), report_fp)
+        with open(report_fp, 'r') as f:
+            obs = json.load(f)
+        exp = {'duplicates': {'ACGT': ['a', 'b']},
+               'pairs': [{'barcodes': ['ACGA', 'ACGT'], 'distance': 1}]}
+        self.assertDictEqual(obs, exp)
+
+    def test_plate_mapper_barcode_dist(self):
+        """Test barcode check of plate_mapper."""
+        barseq_fp = join(self.wkdir, 'barseq.txt')
+        with open(barseq_fp, 'w') as f:
+            f.write('BarcodeSequence\tLinkerPrimerSequence\tPrimer_Plate\t'
+                    'Well_ID\n'
+                    'AAAAAAAA\tATCG\t1\tA1\n'
+                    'AAAAAAAT\tATCG\t1\tA2\n'
+                    'CCCCCCCC\tATCG\t1\tA3\n'
+                    'AAAAAAAA\tATCG\t1\tB1\n'
+                    'AAAATTTT\tATCG\t1\tB2\n'
+                    'AAAAAAAT\tATCG\t1\tB3\n')
+        input_fp = join(self.wkdir, 'plate_map.txt')
+        with open(input_fp, 'w') as f:
+            # well B3 is empty, so its barcode is not checked
+            f.write('Plate#1\t1\t2\t3\t#\n'
+                    'A\ts1\ts2\ts3\t1\n'
+                    'B\ts4\ts5\t\n')
+        with catch_warnings(record=True) as w:
+            simplefilter('always')
+            obs = plate_mapper(open(input_fp, 'r'), open(barseq_fp, 'r'),
+                               open(join(self.wkdir, 'out.txt'), 'w'),
+                               stats=RunStats(quiet=True), barcode_dist=1)
+            msg = ('  Duplicated barcodes: AAAAAAAA (1.A1 1.B1).\n'
+                   '  Similar barcodes: AAAAAAAA/AAAAAAAT.\n')
+            self.assertIn(msg, str(w[-1].message))
+        self.assertEqual(obs.counters['duplicated_barcodes'], 1)
+        self.assertEqual(obs.counters['similar_barcodes'], 1)
+        self.assertIn('check_barcodes', [x['name'] for x in obs.phases])
+        # check is off by default
+        with catch_warnings(record=True) as w:
+            simplefilter('always')
+            obs = plate_mapper(open(input_fp, 'r'), open(barseq_fp, 'r'),
+                               open(join(self.wkdir, 'out.txt'), 'w'),
+                               stats=RunStats(quiet=True))
+            self.assertEqual(len(w), 0)
+        self.assertNotIn('duplicated_barcodes', obs.counters)
+
+
+if __name__ == '__main__':
+    main()
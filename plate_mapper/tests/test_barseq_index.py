@@ -0,0 +1,136 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+from unittest import TestCase, main
+from unittest.mock import patch
+from tempfile import mkdtemp
+from shutil import rmtree, copyfile
+from os import listdir
+from os.path import join, dirname, realpath
+from plate_mapper.barseq_index import (compile_index, load_index,
+                                       BarseqIndex, _hash_file)
+from plate_mapper.plate_mapper import plate_mapper
+
+
+class BarseqIndexTests(TestCase):
+    """Tests for barseq_index.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+        self.datadir = join(dirname(realpath(__file__)), 'data')
+        self.barseq_fp = join(self.datadir, 'barseq_temp.txt')
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def test_compile_index(self):
+        """Test compile_index."""
+        index_fp = join(self.wkdir, 'barseq.bsi')
+        compile_index(open(self.barseq_fp, 'r'), index_fp)
+        index = BarseqIndex(index_fp)
+        with open(self.barseq_fp, 'r') as f:
+            exp = [line.rstrip().split('\t') for line in f]
+        self.assertEqual(index.header, exp[0])
+        self.assertEqual(len(index), len(exp) - 1)
+        self.assertListEqual([list(x) for x in index], exp[1:])
+        index.close()
+
+        # records span blocks
+        with patch('plate_mapper.barseq_index._BLOCK', 2):
+            compile_index(open(self.barseq_fp, 'r'), index_fp)
+        index = BarseqIndex(index_fp)
+        self.assertEqual(index.header, exp[0])
+        self.assertListEqual([list(x) for x in index], exp[1:])
+        index.close()
+
+        # test error when a template row is invalid
+        barseq_fp = join(self.wkdir, 'barseq.txt')
+        with open(barseq_fp, 'w') as f:
+            f.write('Barcode\tPrimer\tPlate\tWell\nAGCT\tATCG\t1\n')
+        with self.assertRaises(ValueError) as context:
+            compile_index(open(barseq_fp, 'r'), index_fp)
+        err = 'Error: invalid template row: AGCT\tATCG\t1.'
+        self.assertEqual(str(context.exception), err)
+        # and the partial index is removed
+        self.assertListEqual(sorted(listdir(self.wkdir)),
+                             ['barseq.bsi', 'barseq.txt'])
+
+        # test error when index file is invalid
+        with open(index_fp, 'wb') as f:
+            f.write(b'not an index')
+        with self.assertRaises(ValueError):
+            BarseqIndex(index_fp)
+
+    def _indexes(self, index_dir):
+        return sorted(x for x in listdir(index_dir) if x.endswith('.bsi'))
+
+    def test_load_index(self):
+        """Test load_index."""
+        # index is built once and then reused
+        index_dir = join(self.wkdir, 'index')
+        index = load_index(self.barseq_fp, index_dir)
+        obs = self._indexes(index_dir)
+        self.assertEqual(len(obs), 1)
+        self.assertEqual(obs[0], '%s.bsi' % index.digest.hex())
+        index.close()
+        # template is not hashed again until its size or time changes
+        with patch('plate_mapper.barseq_index._hash_file') as hash_file:
+            index = load_index(self.barseq_fp, index_dir)
+            self.assertFalse(hash_file.called)
+        self.assertListEqual(self._indexes(index_dir), obs)
+        index.close()
+        barseq_fp = join(self.wkdir, 'barseq.txt')
+        copyfile(self.barseq_fp, barseq_fp)
+        load_index(barseq_fp, index_dir).close()
+        os.utime(barseq_fp, ns=(1, 1))
+        with patch('plate_mapper.barseq_index._hash_file',
+                   wraps=_hash_file) as hash_file:
+            index = load_index(barseq_fp, index_dir)
+            self.assertTrue(hash_file.called)
+        self.assertListEqual(self._indexes(index_dir), obs)
+        index.close()
+        # index is readable as any other file
+        umask = os.umask(0o022)
+        os.umask(umask)
+        self.assertEqual(os.stat(join(index_dir, obs[0])).st_mode & 0o777,
+                         0o666 & ~umask)
+
+        # index is rebuilt when template changes
+        with open(barseq_fp, 'a') as f:
+            f.write('ACGTACGTACGT\tATCG\t5\tA1\n')
+        index = load_index(barseq_fp, index_dir)
+        self.assertEqual(len(self._indexes(index_dir)), 2)
+        self.assertEqual(list(index)[-1], ('ACGTACGTACGT', 'ATCG', '5', 'A1'))
+        index.close()
+
+        # corrupted index is rebuilt
+        with open(join(index_dir, obs[0]), 'wb') as f:
+            f.write(b'corrupted')
+        index = load_index(self.barseq_fp, index_dir)
+        self.assertEqual(next(iter(index)),
+                         ('AGCCTTCGTCGC', 'ATCG', '1', 'A1'))
+        index.close()
+
+    def test_plate_mapper_w_index(self):
+        """Test plate_mapper with compiled index."""
+        input_f = open(join(self.datadir, 'plate_map.txt'), 'r')
+        index = load_index(self.barseq_fp, self.wkdir)
+        obs_output_fp = join(self.wkdir, 'obs_mapping.txt')
+        plate_mapper(input_f, index, open(obs_output_fp, 'w'), empty=True)
+        with open(obs_output_fp, 'r') as f:
+            obs = f.read()
+        with open(join(self.datadir, 'exp_mapping.txt'), 'r') as f:
+            exp = f.read()
+        self.assertEqual(obs, exp)
+
+
+if __name__ == '__main__':
+    main()
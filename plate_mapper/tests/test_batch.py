@@ -0,0 +1,121 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from io import StringIO
+from unittest import TestCase, main
+from unittest.mock import patch
+from tempfile import mkdtemp
+from shutil import rmtree, copyfile
+from os import listdir, mkdir
+from os.path import join, dirname, realpath
+from plate_mapper.batch import plate_mapper_batch, _list_inputs, _output_fp
+from plate_mapper.stats import RunStats
+
+
+class BatchTests(TestCase):
+    """Tests for batch.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+        self.datadir = join(dirname(realpath(__file__)), 'data')
+        self.maxDiff = None
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def test_plate_mapper_batch(self):
+        """Test plate_mapper_batch."""
+        # input directory with two valid plate maps and one invalid
+        indir = join(self.wkdir, 'in')
+        mkdir(indir)
+        for fn in ('plate_map.txt', 'plate_map_rherr.txt',
+                   'plate_map_w_special.txt'):
+            copyfile(join(self.datadir, fn), join(indir, fn))
+        barseq_fp = join(self.datadir, 'barseq_temp.txt')
+        special_fp = join(self.datadir, 'special_samples.txt')
+        outdir = join(self.wkdir, 'out')
+        merged_fp = join(self.wkdir, 'merged.txt')
+        for processes in (1, 2):
+            errors = plate_mapper_batch(
+                [indir], open(barseq_fp, 'r'), outdir, open(merged_fp, 'w'),
+                open(special_fp, 'r'), processes=processes)
+            # invalid plate map is reported without aborting the batch
+            err = 'Error: row headers are not letters in alphabetical order.'
+            self.assertDictEqual(
+                errors, {join(indir, 'plate_map_rherr.txt'): err})
+            self.assertListEqual(sorted(listdir(outdir)), [
+                'plate_map_mapping.txt', 'plate_map_w_special_mapping.txt'])
+            with open(join(outdir, 'plate_map_w_special_mapping.txt')) as f:
+                obs = f.read()
+            with open(join(self.datadir, 'exp_mapping_w_special.txt')) as f:
+                exp = f.read()
+            self.assertEqual(obs, exp)
+            # merged output follows input order
+            with open(join(outdir, 'plate_map_mapping.txt')) as f:
+                exp = f.read() + exp
+            with open(merged_fp) as f:
+                obs = f.read()
+            self.assertEqual(obs, exp)
+
+        # a plate map without primer plate ID, and plate maps of the same
+        # output file, fail alone
+        copyfile(join(self.datadir, 'plate_map.txt'), join(indir, 'a.txt'))
+        copyfile(join(self.datadir, 'plate_map.txt'), join(indir, 'a.tsv'))
+        with open(join(indir, 'b.txt'), 'w') as f:
+            f.write('Plate 1\t1\t2\tPrimer Plate #\nA\tsp1\tsp2\n')
+        rmtree(outdir)
+        with patch('sys.stdout', new_callable=StringIO) as out:
+            errors = plate_mapper_batch(
+                [join(indir, x) for x in ('a.tsv', 'b.txt', 'a.txt')],
+                open(barseq_fp, 'r'), outdir, processes=2,
+                stats=RunStats(quiet=True))
+        self.assertEqual(out.getvalue(), '')
+        self.assertDictEqual(errors, {
+            join(indir, 'b.txt'): 'Error: first row of plate has no primer '
+                                  'plate ID.',
+            join(indir, 'a.txt'): 'Error: output file %s is also that of %s.'
+                                  % (join(outdir, 'a_mapping.txt'),
+                                     join(indir, 'a.tsv'))})
+        self.assertListEqual(listdir(outdir), ['a_mapping.txt'])
+        # so does any other failure
+        with patch('plate_mapper.batch._read_plate_map',
+                   side_effect=KeyError('x')):
+            errors = plate_mapper_batch(
+                [join(indir, 'a.txt')], open(barseq_fp, 'r'), outdir,
+                processes=1, stats=RunStats(quiet=True))
+        self.assertDictEqual(errors, {join(indir, 'a.txt'):
+                                      "Error: KeyError: 'x'."})
+
+        # test error when no output is specified
+        with self.assertRaises(ValueError) as context:
+            plate_mapper_batch([indir], None)
+        err = ('Error: either output directory or merged output file must be '
+               'specified.')
+        self.assertEqual(str(context.exception), err)
+
+    def test__list_inputs(self):
+        """Test _list_inputs."""
+        for fn in ('b.txt', 'a.txt', '.hidden'):
+            open(join(self.wkdir, fn), 'w').close()
+        mkdir(join(self.wkdir, 'sub'))
+        obs = _list_inputs(['z.txt', self.wkdir])
+        exp = ['z.txt', join(self.wkdir, 'a.txt'), join(self.wkdir, 'b.txt')]
+        self.assertListEqual(obs, exp)
+
+    def test__output_fp(self):
+        """Test _output_fp."""
+        self.assertEqual(_output_fp('in/p1.txt', 'out'),
+                         join('out', 'p1_mapping.txt'))
+        self.assertEqual(_output_fp('in/p1.txt.gz', 'out'),
+                         join('out', 'p1_mapping.txt.gz'))
+
+
+if __name__ == '__main__':
+    main()
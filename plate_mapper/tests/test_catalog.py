@@ -0,0 +1,114 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from io import StringIO
+from unittest import TestCase, main
+from unittest.mock import patch
+from tempfile import mkdtemp
+from shutil import rmtree, copyfile
+from os.path import join, dirname, realpath, abspath
+from warnings import catch_warnings, simplefilter
+from plate_mapper.catalog import Catalog, main as catalog_main
+from plate_mapper.plate_mapper import plate_mapper
+from plate_mapper.stats import RunStats
+
+
+class CatalogTests(TestCase):
+    """Tests for catalog.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+        self.datadir = join(dirname(realpath(__file__)), 'data')
+        self.db_fp = join(self.wkdir, 'catalog.db')
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def _map(self, output_fp):
+        """Convert the test plate map into a catalog."""
+        with catch_warnings(record=True):
+            simplefilter('always')
+            plate_mapper(open(join(self.datadir, 'plate_map.txt'), 'r'),
+                         open(join(self.datadir, 'barseq_temp.txt'), 'r'),
+                         open(output_fp, 'w'), stats=RunStats(quiet=True),
+                         catalog_fp=self.db_fp)
+
+    def test_catalog(self):
+        """Test Catalog."""
+        output_fp = join(self.wkdir, 'mapping.txt')
+        self._map(output_fp)
+        with open(join(self.datadir, 'exp_mapping.txt'), 'r') as f:
+            exp_lines = f.read().splitlines()
+        # rows without samples are not recorded
+        n = len([x for x in exp_lines if not x.startswith('\t')])
+        with Catalog(self.db_fp) as catalog:
+            runs = catalog.runs()
+            self.assertEqual(len(runs), 1)
+            self.assertEqual(runs[0]['tool'], 'plate_mapper')
+            self.assertEqual(runs[0]['output'], abspath(output_fp))
+            self.assertEqual(runs[0]['rows'], n)
+            obs = catalog.by_sample('sp001')
+            self.assertEqual(len(obs), 1)
+            self.assertEqual(obs[0]['barcode'], 'AGCCTTCGTCGC')
+            self.assertEqual(obs[0]['well'], 'A1')
+            self.assertEqual(obs[0]['plate_id'], '1')
+            self.assertEqual(obs[0]['metadata'], 'QZ\t8/15/16')
+            self.assertEqual(catalog.by_barcode('AGCCTTCGTCGC'), obs)
+            self.assertEqual(catalog.by_well('1', 'A1'), obs)
+            self.assertListEqual(catalog.by_sample('nosuch'), [])
+            self.assertListEqual(catalog.duplicates(), [])
+
+        # converting to the same output replaces the run
+        self._map(output_fp)
+        # recording a copy adds a run of the same samples
+        copy_fp = join(self.wkdir, 'copy.txt')
+        copyfile(output_fp, copy_fp)
+        with Catalog(self.db_fp) as catalog:
+            self.assertEqual(catalog.add_file(copy_fp), n)
+            runs = catalog.runs()
+            self.assertEqual(len(runs), 2)
+            self.assertIsNone(runs[1]['tool'])
+            obs = catalog.by_sample('sp001')
+            self.assertListEqual([x['run'] for x in obs],
+                                 [x['id'] for x in runs])
+            self.assertIsNone(obs[1]['plate_id'])
+            dups = catalog.duplicates()
+            self.assertIn(('sp001', 2), dups)
+
+            # uncommitted runs are discarded
+            rows = catalog.collect([(['sp999', 'A', 'C', '1', 'A1'], '\n')],
+                                   'test')
+            self.assertEqual(len(list(rows)), 1)
+        with Catalog(self.db_fp) as catalog:
+            self.assertEqual(len(catalog.runs()), 2)
+            self.assertListEqual(catalog.by_sample('sp999'), [])
+
+        # not a catalog
+        with self.assertRaisesRegex(ValueError, 'is not a catalog'):
+            Catalog(join(self.datadir, 'plate_map.txt'))
+
+    def test_main(self):
+        """Test command-line queries."""
+        self._map(join(self.wkdir, 'mapping.txt'))
+        with patch('sys.stdout', new=StringIO()) as out:
+            status = catalog_main(['-d', self.db_fp, 'well', '1', 'A2'])
+        self.assertIsNone(status)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split('\t')[0], 'run')
+        self.assertEqual(lines[1].split('\t')[3:6],
+                         ['sp004', 'TCCATACCGGAA', 'ATCG'])
+        with patch('sys.stdout', new=StringIO()) as out:
+            status = catalog_main(['-d', self.db_fp, 'duplicates'])
+        self.assertEqual(status, 1)
+        self.assertEqual(out.getvalue(), 'sample\truns\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import sys
+import subprocess
+from io import StringIO
+from unittest import TestCase, main
+from unittest.mock import patch
+from tempfile import mkdtemp
+from shutil import rmtree
+from os.path import join, dirname, realpath
+from plate_mapper.cli import main as wetlab
+
+
+class CliTests(TestCase):
+    """Tests for cli.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def test_main(self):
+        """Test dispatching commands."""
+        with patch('sys.stdout', new_callable=StringIO) as out:
+            self.assertIsNone(wetlab(['-h']))
+        self.assertTrue(out.getvalue().startswith(
+            'usage: wetlab <command> [options]'))
+        self.assertIn('  map       convert a plate map file', out.getvalue())
+        with patch('sys.stderr', new_callable=StringIO) as err:
+            self.assertEqual(wetlab([]), 2)
+            self.assertEqual(wetlab(['mapp']), 2)
+        self.assertTrue(err.getvalue().endswith(
+            'wetlab: error: invalid command: mapp\n'))
+
+        # run a command
+        datadir = join(dirname(realpath(__file__)), 'data')
+        output_fp = join(self.wkdir, 'mapping.txt')
+        with patch('sys.stdout', new_callable=StringIO) as out:
+            wetlab(['map', '-q', '-e', '-i', join(datadir, 'plate_map.txt'),
+                    '-t', join(datadir, 'barseq_temp.txt'), '-o',
+                    output_fp])
+        self.assertEqual(out.getvalue(), '')
+        with open(output_fp, 'r') as f:
+            obs = f.read()
+        with open(join(datadir, 'exp_mapping.txt'), 'r') as f:
+            exp = f.read()
+        self.assertEqual(obs, exp)
+
+        # command-specific usage
+        with patch('sys.stdout', new_callable=StringIO) as out:
+            with self.assertRaises(SystemExit):
+                wetlab(['link', '-h'])
+        self.assertTrue(out.getvalue().startswith('usage: wetlab link'))
+
+    def test_lazy_imports(self):
+        """Test that no tool is imported until a command runs."""
+        root = join(dirname(realpath(__file__)), '..', '..')
+        code = ('import sys; sys.path.insert(0, %r); import plate_mapper.cli; '
+                'print(sorted(x for x in sys.modules if x.startswith('
+                '("plate_", "argparse"))))' % root)
+        obs = subprocess.run([sys.executable, '-c', code], check=True,
+                             stdout=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(obs.stdout, "['plate_mapper', 'plate_mapper.cli']\n")
+
+    def test_scripts(self):
+        """Test running the tools by path, from their own directories."""
+        root = join(dirname(realpath(__file__)), '..', '..')
+        env = {x: y for x, y in os.environ.items() if x != 'PYTHONPATH'}
+        for tool in ('plate_mapper', 'plate_linker'):
+            obs = subprocess.run([sys.executable, '%s.py' % tool, '-h'],
+                                 cwd=join(root, tool), env=env,
+                                 stdout=subprocess.PIPE,
+                                 universal_newlines=True)
+            self.assertEqual(obs.returncode, 0)
+            self.assertTrue(obs.stdout.startswith('usage: %s.py' % tool))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import gzip
+import json
+import argparse
+from unittest import TestCase, main
+from unittest.mock import patch
+from tempfile import mkdtemp
+from shutil import rmtree
+from os.path import join, dirname, realpath
+from plate_mapper.fileio import (compression, split_ext, open_file, FileArg,
+                                 MappedFile, content_digest)
+from plate_mapper.plate_mapper import plate_mapper, main as mapper_main
+from plate_mapper.stats import RunStats
+from plate_linker.plate_linker import plate_linker, main as linker_main
+
+
+class FileIOTests(TestCase):
+    """Tests for fileio.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+        self.text = 'a\tb\tc\n\nd\te\nf'
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def test_open_file(self):
+        """Test open_file with compressed files."""
+        for ext, fmt in (('.gz', 'gzip'), ('.bz2', 'bzip2'), ('.xz', 'xz'),
+                         ('.txt', None)):
+            fp = join(self.wkdir, 'test' + ext)
+            self.assertEqual(compression(fp, 'w'), fmt)
+            with open_file(fp, 'w') as f:
+                f.write(self.text)
+            self.assertEqual(compression(fp), fmt)
+            with open_file(fp) as f:
+                self.assertEqual(f.read(), self.text)
+        # detected by magic bytes rather than extension
+        fp = join(self.wkdir, 'test.txt')
+        with gzip.open(fp, 'wt') as f:
+            f.write(self.text)
+        self.assertEqual(compression(fp), 'gzip')
+        with open_file(fp) as f:
+            self.assertListEqual(list(f), self.text.splitlines(True))
+        fp = join(self.wkdir, 'plain.gz')
+        with open(fp, 'w') as f:
+            f.write(self.text)
+        self.assertIsNone(compression(fp))
+        with open_file(fp) as f:
+            self.assertEqual(f.read(), self.text)
+        with self.assertRaises(ValueError) as context:
+            open_file(fp, 'rb')
+        self.assertEqual(str(context.exception),
+                         'Error: invalid file mode: rb.')
+
+    def test_split_ext(self):
+        """Test split_ext."""
+        self.assertTupleEqual(split_ext('a/b.txt.gz'), ('a/b.txt', '.gz'))
+        self.assertTupleEqual(split_ext('b.XZ'), ('b', '.XZ'))
+        self.assertTupleEqual(split_ext('b.txt'), ('b.txt', ''))
+
+    def test_FileArg(self):
+        """Test FileArg."""
+        fp = join(self.wkdir, 'test.txt.bz2')
+        f = FileArg('w')(fp)
+        f.write(self.text)
+        f.close()
+        f = FileArg()(fp)
+        self.assertEqual(f.name, fp)
+        self.assertEqual(f.read(), self.text)
+        f.close()
+        with self.assertRaises(argparse.ArgumentTypeError):
+            FileArg()(join(self.wkdir, 'missing.txt'))
+
+    def test_MappedFile(self):
+        """Test MappedFile."""
+        fp = join(self.wkdir, 'test.txt')
+        with open(fp, 'w') as f:
+            f.write(self.text)
+        with MappedFile(fp) as f:
+            self.assertTrue(f.mapped)
+            self.assertEqual(f.readline(), 'a\tb\tc\n')
+            pos = f.tell()
+            self.assertListEqual(list(f), ['\n', 'd\te\n', 'f'])
+            f.seek(pos)
+            self.assertListEqual(list(f.rows()), [[''], ['d', 'e'], ['f']])
+            f.seek(0)
+            self.assertEqual(f.read(), self.text)
+            self.assertEqual(f.readline(), '')
+        self.assertTrue(f.closed)
+        # large files are memory-mapped
+        f = open_file(fp, mmap_threshold=1)
+        self.assertIsInstance(f, MappedFile)
+        f.close()
+        # files with carriage returns or without content are not
+        with open(fp, 'w', newline='') as f:
+            f.write('a\r\nb\r\n')
+        f = open_file(fp, mmap_threshold=1)
+        self.assertNotIsInstance(f, MappedFile)
+        self.assertListEqual(list(f), ['a\n', 'b\n'])
+        f.close()
+        with open(fp, 'w') as f:
+            pass
+        f = MappedFile(fp)
+        self.assertFalse(f.mapped)
+        f.close()
+
+    def test_plate_mapper_compressed(self):
+        """Test plate_mapper with compressed input and output."""
+        datadir = join(dirname(realpath(__file__)), 'data')
+        fps = {}
+        for name in ('plate_map', 'barseq_temp'):
+            fps[name] = join(self.wkdir, '%s.txt.xz' % name)
+            with open(join(datadir, '%s.txt' % name), 'r') as f, \
+                    open_file(fps[name], 'w') as g:
+                g.write(f.read())
+        output_fp = join(self.wkdir, 'mapping.txt.gz')
+        plate_mapper(open_file(fps['plate_map']),
+                     open_file(fps['barseq_temp'], mmap_threshold=0),
+                     open_file(output_fp, 'w'), empty=True,
+                     stats=RunStats(quiet=True))
+        with gzip.open(output_fp, 'rt') as f:
+            obs = f.read()
+        with open(join(datadir, 'exp_mapping.txt'), 'r') as f:
+            exp = f.read()
+        self.assertEqual(obs, exp)
+
+    def test_plate_linker_mapped(self):
+        """Test plate_linker with memory-mapped input files."""
+        datadir = join(dirname(realpath(__file__)), '..', '..',
+                       'plate_linker', 'tests', 'data')
+        with open(join(datadir, 'exp_output.txt'), 'r') as f:
+            exp = f.read()
+        for engine in ('hash', 'merge'):
+            metadata_f = open_file(join(datadir, 'metadata.txt'),
+                                   mmap_threshold=0)
+            primer_f = open_file(join(datadir, 'primer.txt'),
+                                 mmap_threshold=0)
+            self.assertIsInstance(metadata_f, MappedFile)
+            output_fp = join(self.wkdir, 'output.txt')
+            plate_linker(metadata_f, primer_f, open(output_fp, 'w'), engine,
+                         RunStats(quiet=True))
+            with open(output_fp, 'r') as f:
+                self.assertEqual(f.read(), exp)
+
+    def test_manifest(self):
+        """Test atomic outputs and manifests of command-line runs."""
+        datadir = join(dirname(realpath(__file__)), 'data')
+        output_fp = join(self.wkdir, 'mapping.txt.gz')
+        manifest_fp = join(self.wkdir, 'manifest.json')
+        argv = ['-q', '-i', join(datadir, 'plate_map.txt'),
+                '-t', join(datadir, 'barseq_temp.txt'),
+                '-o', output_fp, '--manifest', manifest_fp]
+        mtimes = []
+        for _ in range(2):
+            with patch('sys.stderr'):
+                mapper_main(argv)
+            mtimes.append(os.stat(output_fp).st_mtime_ns)
+            with open(manifest_fp, 'r') as f:
+                obs = json.load(f)
+            self.assertEqual(obs['tool'], 'plate_mapper')
+            self.assertListEqual(sorted(obs['inputs']), ['barseq', 'input'])
+            self.assertEqual(obs['outputs'][0]['sha256'],
+                             content_digest(output_fp))
+        # the second run changed nothing, and left the output untouched
+        self.assertTrue(obs['changed'] is False)
+        self.assertEqual(mtimes[1], mtimes[0])
+
+        # a failed run leaves the output untouched, and no temporary file
+        linkdir = join(datadir, '..', '..', '..', 'plate_linker', 'tests',
+                       'data')
+        metadata_fp = join(self.wkdir, 'metadata.txt')
+        with open(metadata_fp, 'w') as f:
+            f.write('Sample\tPlate\tWell\nspX\t9\tA1\n')
+        with self.assertRaisesRegex(ValueError, 'do not have matched'):
+            linker_main(['-q', '-m', metadata_fp,
+                         '-p', join(linkdir, 'primer.txt'), '-o', output_fp])
+        self.assertEqual(os.stat(output_fp).st_mtime_ns, mtimes[0])
+        self.assertListEqual(sorted(os.listdir(self.wkdir)),
+                             ['manifest.json', 'mapping.txt.gz',
+                              'metadata.txt'])
+
+
+if __name__ == '__main__':
+    main()
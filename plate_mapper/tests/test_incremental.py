@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+from unittest import TestCase, main
+from tempfile import mkdtemp
+from shutil import rmtree
+from os.path import join, dirname, realpath
+from warnings import catch_warnings, simplefilter
+from plate_mapper.plate_mapper import plate_mapper
+from plate_mapper.incremental import plate_mapper_incremental
+from plate_mapper.stats import RunStats
+
+
+class IncrementalTests(TestCase):
+    """Tests for incremental.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+        self.datadir = join(dirname(realpath(__file__)), 'data')
+        self.cache_fp = join(self.wkdir, 'cache.json')
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def _run(self, input_fp, incremental, special_fp=None):
+        """Convert a plate map and return output and statistics."""
+        output_fp = join(self.wkdir, 'mapping.txt')
+        args = (open(input_fp, 'r'),
+                open(join(self.datadir, 'barseq_temp.txt'), 'r'),
+                open(output_fp, 'w'))
+        kwargs = {'names_f': open(join(self.datadir, 'sample_list.txt')),
+                  'special_f': open(special_fp or join(
+                      self.datadir, 'special_samples.txt')),
+                  'empty': True, 'stats': RunStats(quiet=True)}
+        with catch_warnings(record=True):
+            simplefilter('always')
+            if incremental:
+                stats = plate_mapper_incremental(
+                    *args, cache_fp=self.cache_fp, **kwargs)
+            else:
+                stats = plate_mapper(*args, **kwargs)
+        with open(output_fp, 'r') as f:
+            return f.read(), stats
+
+    def test_plate_mapper_incremental(self):
+        """Test plate_mapper_incremental."""
+        input_fp = join(self.datadir, 'plate_map.txt')
+        exp, exp_stats = self._run(input_fp, False)
+
+        # first run renders all plates
+        obs, stats = self._run(input_fp, True)
+        self.assertEqual(obs, exp)
+        self.assertEqual(stats.counters['regenerated'], 2)
+        self.assertNotIn('reused', stats.counters)
+        self.assertListEqual(stats.warnings, exp_stats.warnings)
+        # the cache is readable as any other output, and nothing else is left
+        umask = os.umask(0o022)
+        os.umask(umask)
+        self.assertEqual(os.stat(self.cache_fp).st_mode & 0o777,
+                         0o666 & ~umask)
+        self.assertListEqual(sorted(os.listdir(self.wkdir)),
+                             ['cache.json', 'mapping.txt'])
+
+        # second run reuses all plates
+        obs, stats = self._run(input_fp, True)
+        self.assertEqual(obs, exp)
+        self.assertEqual(stats.counters['reused'], 2)
+        self.assertNotIn('regenerated', stats.counters)
+        for key, n in exp_stats.counters.items():
+            self.assertEqual(stats.counters[key], n)
+
+        # fix one well, which only regenerates its plate, while global checks
+        # still cover both plates
+        with open(input_fp, 'r') as f:
+            text = f.read()
+        input_fp = join(self.wkdir, 'plate_map.txt')
+        with open(input_fp, 'w') as f:
+            f.write(text.replace('sp220', 'sp012'))
+        exp, exp_stats = self._run(input_fp, False)
+        obs, stats = self._run(input_fp, True)
+        self.assertEqual(obs, exp)
+        self.assertEqual(stats.counters['reused'], 1)
+        self.assertEqual(stats.counters['regenerated'], 1)
+        self.assertListEqual(stats.warnings, exp_stats.warnings)
+        self.assertIn('Repeated samples: sp012.', stats.warnings[0])
+
+        # a corrupt cache is discarded
+        with open(self.cache_fp, 'w') as f:
+            f.write('{')
+        obs, stats = self._run(input_fp, True)
+        self.assertEqual(obs, exp)
+        self.assertEqual(stats.counters['regenerated'], 2)
+
+    def test_pattern_codes(self):
+        """Test that changed pattern definitions regenerate plates."""
+        input_fp = join(self.datadir, 'plate_map.txt')
+        special_fp = join(self.wkdir, 'special.txt')
+        for name, note in (('Blank', 'X'), ('Ctrl', 'Y')):
+            with open(special_fp, 'w') as f:
+                f.write('Code\tName\tNote\nprefix:blank\t%s\t%s\n'
+                        % (name, note))
+            exp, _ = self._run(input_fp, False, special_fp)
+            self.assertIn('%s1.A4\t' % name, exp)
+            obs, stats = self._run(input_fp, True, special_fp)
+            self.assertEqual(obs, exp)
+            self.assertEqual(stats.counters['regenerated'], 2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+from plate_mapper.plate import (Plate, plate_format, normalize_well,
+                                _row_name, ROWS, WELL_INDEX)
+
+
+class PlateTests(TestCase):
+    """Tests for plate.py."""
+
+    def test__row_name(self):
+        """Test _row_name."""
+        obs = [_row_name(i) for i in (0, 1, 25, 26, 31, 51, 52)]
+        exp = ['A', 'B', 'Z', 'AA', 'AF', 'AZ', 'BA']
+        self.assertListEqual(obs, exp)
+        self.assertEqual(len(ROWS), 32)
+        self.assertEqual(len(WELL_INDEX), 1536)
+        self.assertEqual(WELL_INDEX['AF48'], (31, 47))
+
+    def test_normalize_well(self):
+        """Test normalize_well."""
+        self.assertEqual(normalize_well('A2'), 'A2')
+        self.assertEqual(normalize_well('A02'), 'A2')
+        self.assertEqual(normalize_well('AF048'), 'AF48')
+        for well in ('A0', 'A00', 'A49', 'AG1', 'a1', 'A', '1', 'A1B', ''):
+            self.assertIsNone(normalize_well(well))
+
+    def test_plate_format(self):
+        """Test plate_format."""
+        self.assertEqual(plate_format(0, 0), (96, 8, 12))
+        self.assertEqual(plate_format(8, 12), (96, 8, 12))
+        self.assertEqual(plate_format(9, 4), (384, 16, 24))
+        self.assertEqual(plate_format(3, 25), (1536, 32, 48))
+        with self.assertRaises(ValueError) as context:
+            plate_format(3, 49)
+        err = 'Error: plate exceeds the largest supported format (1536 wells).'
+        self.assertEqual(str(context.exception), err)
+
+    def test_plate(self):
+        """Test Plate."""
+        plate = Plate('1', ['QZ', '8/15/16'], cols=4)
+        self.assertEqual(plate.wells, 96)
+        self.assertTupleEqual(plate.metadata, ('QZ', '8/15/16'))
+        plate.set(0, 0, 'sp001')
+        plate.set(1, 3, 'sp002')
+        self.assertEqual(plate.get('A1'), 'sp001')
+        self.assertEqual(plate.get('B4'), 'sp002')
+        self.assertIsNone(plate.get('A2'))
+        self.assertIsNone(plate.get('A13'))
+        self.assertIsNone(plate.get('a1'))
+        self.assertEqual(plate.position('B4'), 15)
+        # promote to larger format when a well beyond it is filled
+        plate.set(8, 12, 'sp003')
+        self.assertEqual(plate.wells, 384)
+        self.assertEqual(plate.get('B4'), 'sp002')
+        self.assertEqual(plate.get('I13'), 'sp003')
+        self.assertEqual(plate.position('B4'), 27)
+        obs = list(plate.items())
+        exp = [('A1', 'sp001'), ('B4', 'sp002'), ('I13', 'sp003')]
+        self.assertListEqual(obs, exp)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,8 +11,10 @@ from tempfile import mkdtemp
 from shutil import rmtree
 from os.path import join, dirname, realpath
 from warnings import catch_warnings, simplefilter
-from plate_mapper.plate_mapper import (plate_mapper,
+from plate_mapper.plate_mapper import (plate_mapper, map_plates,
                                        _print_list)
+from plate_mapper.records import Result
+from plate_mapper.stats import RunStats
 
 
 class PlateMapperTests(TestCase):
@@ -137,6 +139,102 @@ class PlateMapperTests(TestCase):
             plate_mapper(input_f, barseq_f, output_f, names_f)
             assert msg in str(w[-1].message)
 
+    def test_plate_mapper_stats(self):
+        """Test statistics of plate_mapper."""
+        datadir = join(dirname(realpath(__file__)), 'data')
+        output_f = open(join(self.wkdir, 'obs_mapping.txt'), 'w')
+        with catch_warnings(record=True):
+            simplefilter('always')
+            obs = plate_mapper(
+                open(join(datadir, 'plate_map_w_special.txt'), 'r'),
+                open(join(datadir, 'barseq_temp.txt'), 'r'), output_f,
+                names_f=open(join(datadir, 'sample_list.txt'), 'r'),
+                special_f=open(join(datadir, 'special_samples.txt'), 'r'),
+                stats=RunStats(quiet=True))
+        exp = {'plates': 1, 'wells': 11, 'specials': 4, 'empty': 1,
+               'rows': 12, 'repeated': 0, 'novel': 2, 'missing': 14}
+        self.assertDictEqual(obs.counters, exp)
+        exp = ['read_plate_map', 'read_special', 'resolve', 'validate_names']
+        self.assertListEqual([x['name'] for x in obs.phases], exp)
+        self.assertEqual(len(obs.warnings), 1)
+        self.assertIn('Novel samples: sp004-A, sp005_B.', obs.warnings[0])
+
+    def test_map_plates(self):
+        """Test map_plates."""
+        datadir = join(dirname(realpath(__file__)), 'data')
+        inputs = {}
+        for name in ('plate_map_w_special', 'barseq_temp', 'special_samples',
+                     'sample_list', 'exp_mapping_w_special'):
+            with open(join(datadir, '%s.txt' % name), 'r') as f:
+                inputs[name] = f.read().splitlines(True)
+        result = Result()
+        obs = list(map_plates(inputs['plate_map_w_special'],
+                              inputs['barseq_temp'],
+                              special=inputs['special_samples'],
+                              names=inputs['sample_list'], result=result))
+        self.assertEqual(''.join(x.line() for x in obs),
+                         ''.join(inputs['exp_mapping_w_special']))
+        self.assertEqual(obs[0].sample, 'sp001')
+        self.assertEqual(obs[0].barcode, 'AGCCTTCGTCGC')
+        self.assertTupleEqual(obs[0].metadata, ('QZ', '8/15/16'))
+        self.assertListEqual(result.novel, ['sp004-A', 'sp005_B'])
+        self.assertEqual(len(result.missing), 14)
+        self.assertListEqual(result.repeated, [])
+        self.assertEqual(len(result.warnings), 1)
+        self.assertEqual(result.stats.counters['rows'], 12)
+        # lines without newlines work as well
+        obs = list(map_plates([x.rstrip('\n') for x in
+                               inputs['plate_map_w_special']],
+                              inputs['barseq_temp'],
+                              special=inputs['special_samples']))
+        self.assertEqual(len(obs), 12)
+
+    def test_plate_mapper_1536(self):
+        """Test plate_mapper with a 1536-well plate."""
+        rows = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L',
+                'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X',
+                'Y', 'Z', 'AA', 'AB', 'AC', 'AD', 'AE', 'AF']
+        input_fp = join(self.wkdir, 'plate_map.txt')
+        with open(input_fp, 'w') as f:
+            f.write('Plate#7\t%s\tPrimer\tWho\n'
+                    % '\t'.join(str(i) for i in range(1, 49)))
+            for row in rows:
+                f.write('%s\t%s' % (row, '\t'.join(
+                    's%s%d' % (row, i) for i in range(1, 49))))
+                f.write('\t5\tQZ\n' if row == 'A' else '\n')
+        barseq_fp = join(self.wkdir, 'barseq.txt')
+        with open(barseq_fp, 'w') as f:
+            f.write('Barcode\tPrimer\tPlate\tWell\n')
+            for well in ('A1', 'Z48', 'AA1', 'AF48', 'AG1'):
+                f.write('ACGT\tATCG\t5\t%s\n' % well)
+        output_fp = join(self.wkdir, 'mapping.txt')
+        plate_mapper(open(input_fp, 'r'), open(barseq_fp, 'r'),
+                     open(output_fp, 'w'))
+        with open(output_fp, 'r') as f:
+            obs = f.read()
+        exp = ''.join('s%s\tACGT\tATCG\t5\t%s\tQZ\n' % (well, well)
+                      for well in ('A1', 'Z48', 'AA1', 'AF48'))
+        self.assertEqual(obs, exp)
+
+        # test error when rows are beyond 1536-well format
+        with open(input_fp, 'a') as f:
+            f.write('AG\tsAG1\n')
+        with self.assertRaises(ValueError) as context:
+            plate_mapper(open(input_fp, 'r'), None, None)
+        err = 'Error: plate exceeds the largest supported format (1536 wells).'
+        self.assertEqual(str(context.exception), err)
+
+        # test error when multi-letter rows are out of order
+        with open(input_fp, 'w') as f:
+            f.write('Plate#7\t%s\tPrimer\n'
+                    % '\t'.join(str(i) for i in range(1, 49)))
+            for row in rows[:26] + ['AB']:
+                f.write('%s\ts1%s\n' % (row, '\t' * 47 + '\t5'))
+        with self.assertRaises(ValueError) as context:
+            plate_mapper(open(input_fp, 'r'), None, None)
+        err = 'Error: row headers are not letters in alphabetical order.'
+        self.assertEqual(str(context.exception), err)
+
     def test__print_list(self):
         """Test _print_list."""
         l = ['1', '2', '3', '4', '5']
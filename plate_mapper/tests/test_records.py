@@ -0,0 +1,63 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+from plate_mapper.records import Record, Result
+from plate_mapper.plate_mapper import map_plates
+from plate_mapper.stats import RunStats
+
+
+class RecordsTests(TestCase):
+    """Tests for records.py."""
+
+    def test_record(self):
+        """Test Record."""
+        rec = Record(('sp001', 'ACGT', 'GT', '1', 'A1'), '\tQZ\t8/15/16\n')
+        self.assertEqual(rec.sample, 'sp001')
+        self.assertEqual(rec.barcode, 'ACGT')
+        self.assertEqual(rec.primer, 'GT')
+        self.assertEqual(rec.plate, '1')
+        self.assertEqual(rec.well, 'A1')
+        self.assertTupleEqual(rec.metadata, ('QZ', '8/15/16'))
+        self.assertTupleEqual(rec.columns(), ('sp001', 'ACGT', 'GT', '1',
+                                              'A1', 'QZ', '8/15/16'))
+        self.assertEqual(rec.line(), 'sp001\tACGT\tGT\t1\tA1\tQZ\t8/15/16\n')
+        self.assertEqual(rec, Record(['sp001', 'ACGT', 'GT', '1', 'A1'],
+                                     '\tQZ\t8/15/16\n'))
+        with self.assertRaises(AttributeError):
+            rec.note = ''
+        # no metadata, or a single empty metadatum
+        self.assertTupleEqual(Record(('', 'A', 'G', '1', 'A1')).metadata, ())
+        self.assertTupleEqual(Record(('', 'A', 'G', '1', 'A1'),
+                                     '\t\n').metadata, ())
+
+    def test_record_wo_metadata(self):
+        """Test Record of a plate without metadata."""
+        plate_map = ['Plate#1\t1\t2\t#\n', 'A\tsp001\tsp002\t1\n']
+        barseq = ['BarcodeSequence\tLinkerPrimerSequence\tPrimer_Plate\t'
+                  'Well_ID\n', 'ACGT\tGT\t1\tA1\n']
+        rec, = map_plates(plate_map, barseq)
+        self.assertEqual(rec.suffix, '\t\n')
+        self.assertTupleEqual(rec.metadata, ())
+        self.assertTupleEqual(rec.columns(), ('sp001', 'ACGT', 'GT', '1',
+                                              'A1'))
+        # as a linker row without metadata
+        self.assertTupleEqual(rec.columns(), Record(rec.fields).columns())
+
+    def test_result(self):
+        """Test Result."""
+        result = Result()
+        self.assertTrue(result.stats.quiet)
+        stats = RunStats()
+        result = Result(stats)
+        stats.warnings.append('  Repeated samples: sp001.\n')
+        self.assertListEqual(result.warnings, stats.warnings)
+
+
+if __name__ == '__main__':
+    main()
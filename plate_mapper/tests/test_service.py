@@ -0,0 +1,185 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import asyncio
+from threading import Thread
+from unittest import TestCase, main
+from tempfile import mkdtemp
+from shutil import rmtree, copyfile
+from os.path import join, dirname, realpath
+from concurrent.futures import ThreadPoolExecutor
+from plate_mapper.service import (LRUCache, ConversionService, start_server,
+                                  send_request)
+
+
+class ServiceTests(TestCase):
+    """Tests for service.py."""
+
+    def setUp(self):
+        """Create working directory and locate test data."""
+        self.wkdir = mkdtemp()
+        self.datadir = join(dirname(realpath(__file__)), 'data')
+        self.linkdir = join(dirname(realpath(__file__)), '..', '..',
+                            'plate_linker', 'tests', 'data')
+        self.request = {
+            'tool': 'plate_mapper',
+            'input': join(self.datadir, 'plate_map_w_special.txt'),
+            'barseq': join(self.datadir, 'barseq_temp.txt'),
+            'special': join(self.datadir, 'special_samples.txt'),
+            'names': join(self.datadir, 'sample_list.txt')}
+        with open(join(self.datadir, 'exp_mapping_w_special.txt'), 'r') as f:
+            self.exp = f.read()
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def test_LRUCache(self):
+        """Test LRUCache."""
+        cache = LRUCache(2)
+        self.assertTupleEqual(cache.get('a', lambda: 1), (1, False))
+        self.assertTupleEqual(cache.get('b', lambda: 2), (2, False))
+        self.assertTupleEqual(cache.get('a', lambda: 0), (1, True))
+        # least recently used item "b" is evicted
+        cache.get('c', lambda: 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 3)
+
+    def test_plate_mapper(self):
+        """Test plate_mapper requests."""
+        service = ConversionService()
+        obs = service.handle(self.request)
+        self.assertTrue(obs['ok'])
+        self.assertEqual(obs['mapping'], self.exp)
+        self.assertDictEqual(obs['cached'], {'barseq': False,
+                                             'special': False})
+        self.assertEqual(obs['counters']['rows'], 12)
+        self.assertEqual(len(obs['warnings']), 1)
+        # parsed template and definitions are reused
+        output_fp = join(self.wkdir, 'mapping.txt')
+        obs = service.handle(dict(self.request, output=output_fp))
+        self.assertDictEqual(obs['cached'], {'barseq': True,
+                                             'special': True})
+        self.assertNotIn('mapping', obs)
+        with open(output_fp, 'r') as f:
+            self.assertEqual(f.read(), self.exp)
+        # a copy of the template has the same content
+        barseq_fp = join(self.wkdir, 'barseq.txt')
+        copyfile(self.request['barseq'], barseq_fp)
+        obs = service.handle(dict(self.request, barseq=barseq_fp))
+        self.assertTrue(obs['cached']['barseq'])
+        # a changed template does not
+        with open(barseq_fp, 'a') as f:
+            f.write('AAAAAAAAAAAA\tATCG\t9\tA1\n')
+        obs = service.handle(dict(self.request, barseq=barseq_fp))
+        self.assertFalse(obs['cached']['barseq'])
+        self.assertEqual(obs['mapping'], self.exp)
+
+    def test_plate_linker(self):
+        """Test plate_linker requests."""
+        service = ConversionService()
+        request = {'tool': 'plate_linker',
+                   'metadata': join(self.linkdir, 'metadata.txt'),
+                   'primer': join(self.linkdir, 'primer.txt')}
+        with open(join(self.linkdir, 'exp_output.txt'), 'r') as f:
+            exp = f.read()
+        for engine in ('hash', 'merge'):
+            obs = service.handle(dict(request, engine=engine))
+            self.assertTrue(obs['ok'])
+            self.assertEqual(obs['mapping'], exp)
+        self.assertTrue(obs['cached']['primer'])
+
+    def test_handle_errors(self):
+        """Test error responses."""
+        service = ConversionService()
+        obs = service.handle({'tool': 'plate_tuner'})
+        self.assertDictEqual(obs, {'ok': False, 'error':
+                                   'Error: invalid tool: plate_tuner.'})
+        obs = service.handle({'tool': 'plate_mapper'})
+        self.assertEqual(obs['error'], 'Error: missing request field: '
+                                       'barseq.')
+        obs = service.handle(dict(self.request, input=join(
+            self.datadir, 'plate_map_rherr.txt')))
+        self.assertEqual(obs['error'], 'Error: row headers are not letters '
+                                       'in alphabetical order.')
+        obs = service.handle(dict(self.request, barseq=join(
+            self.wkdir, 'missing.txt')))
+        self.assertFalse(obs['ok'])
+        # a plate without primer plate ID
+        input_fp = join(self.wkdir, 'plate_map.txt')
+        with open(input_fp, 'w') as f:
+            f.write('Plate 1\t1\t2\tPrimer Plate #\nA\tsp1\tsp2\n')
+        obs = service.handle(dict(self.request, input=input_fp))
+        self.assertFalse(obs['ok'])
+        self.assertTrue(obs['error'].startswith('Error: '))
+
+        # samples without matched primers leave the output as it was
+        metadata_fp = join(self.wkdir, 'metadata.txt')
+        with open(metadata_fp, 'w') as f:
+            f.write('Sample\tPlate\tWell\nsp1\t1\tA1\nspX\t9\tA1\n')
+        output_fp = join(self.wkdir, 'output.txt')
+        with open(output_fp, 'w') as f:
+            f.write('old\n')
+        request = {'tool': 'plate_linker', 'metadata': metadata_fp,
+                   'primer': join(self.linkdir, 'primer.txt')}
+        for output in (output_fp, None):
+            obs = service.handle(dict(request, output=output))
+            self.assertDictEqual(obs, {'ok': False, 'error': (
+                'Error: the following samples do not have matched primers: '
+                'spX.')})
+        with open(output_fp, 'r') as f:
+            self.assertEqual(f.read(), 'old\n')
+        self.assertListEqual(sorted(os.listdir(self.wkdir)), [
+            'metadata.txt', 'output.txt', 'plate_map.txt'])
+
+    def test_server(self):
+        """Test serving requests over Unix socket and TCP."""
+        service = ConversionService()
+        loop = asyncio.new_event_loop()
+        sock_fp = join(self.wkdir, 'service.sock')
+        servers = [loop.run_until_complete(start_server(service, sock_fp)),
+                   loop.run_until_complete(start_server(service))]
+        port = servers[1].sockets[0].getsockname()[1]
+        thread = Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            obs = send_request(self.request, sock_fp, timeout=10)
+            self.assertEqual(obs['mapping'], self.exp)
+            # concurrent requests
+            with ThreadPoolExecutor(4) as pool:
+                obs = list(pool.map(lambda x: send_request(
+                    self.request, port=port, timeout=10), range(8)))
+            for x in obs:
+                self.assertEqual(x['mapping'], self.exp)
+                self.assertTrue(x['cached']['barseq'])
+            obs = send_request(['plate_mapper'], sock_fp, timeout=10)
+            self.assertDictEqual(obs, {'ok': False,
+                                       'error': 'Error: invalid request.'})
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            for server in servers:
+                server.close()
+                loop.run_until_complete(server.wait_closed())
+            loop.close()
+
+        # other hosts cannot reach the service
+        for host in ('0.0.0.0', '192.168.0.1', 'example.org'):
+            with self.assertRaises(ValueError) as context:
+                asyncio.run(start_server(service, host=host))
+            self.assertEqual(str(context.exception), 'Error: the service '
+                             'only listens on a loopback address, not %s.'
+                             % host)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import pickle
+from unittest import TestCase, main
+from plate_mapper.special import SpecialSamples
+from plate_mapper.plate_mapper import _read_special, map_plates
+
+
+class SpecialTests(TestCase):
+    """Tests for special.py."""
+
+    def test_match(self):
+        """Test SpecialSamples.match precedence."""
+        specs = SpecialSamples()
+        for code in ('BLANK1', 'prefix:BL', 'prefix:BLANK', 're:BLANK\\d+',
+                     'glob:BLANK*', 'glob:NTC?', 're:NTC\\d'):
+            specs.add(code, {'name': code})
+        self.assertListEqual(list(specs), ['BLANK1'])
+        self.assertEqual(len(specs.patterns), 6)
+        obs = [specs.match(x) for x in ('BLANK1', 'BLANK2', 'BLUE', 'BX',
+                                        'NTC1', 'NTCA', 'NTC12', 'sp1')]
+        exp = ['BLANK1', 'prefix:BLANK', 'prefix:BL', None, 'glob:NTC?',
+               'glob:NTC?', None, None]
+        self.assertListEqual([x and x['name'] for x in obs], exp)
+        # remembered names are forgotten when definitions change
+        specs.add('re:NTC\\d\\d', {'name': 'two digits'})
+        self.assertEqual(specs.match('NTC12')['name'], 'two digits')
+        # definitions survive pickling, as used by parallel workers
+        obs = pickle.loads(pickle.dumps(specs))
+        self.assertEqual(obs.match('NTC12')['name'], 'two digits')
+        self.assertEqual(obs.match('BLANK1')['name'], 'BLANK1')
+
+        # invalid patterns
+        with self.assertRaisesRegex(ValueError, 'empty pattern'):
+            specs.add('prefix:', {})
+        with self.assertRaisesRegex(ValueError, 'not a valid pattern'):
+            specs.add('re:(', {})
+        specs.add('re:(?P<x>a)', {})
+        specs.add('re:(?P<x>b)', {})
+        with self.assertRaisesRegex(ValueError, 'cannot be combined'):
+            specs.compile()
+
+    def test_map_plates(self):
+        """Test map_plates with pattern codes."""
+        plate_map = ['Plate#1\t1\t2\t3\t#\tWho\n',
+                     'A\tBLANK.1\tsp1\tNTC_2\t1\tQZ\n',
+                     'B\tBLANK.2\t+\tBLANKET\n']
+        barseq = ['Barcode\tPrimer\tPlate\tWell\n'] + [
+            'AAA%s%d\tATCG\t1\t%s%d\n' % (r, c, r, c)
+            for r in 'AB' for c in (1, 2, 3)]
+        special = ['Code\tName\tNote\tWho\n',
+                   '+\tPosCtl\tpositive control\tXY\n',
+                   'prefix:BLANK.\tBlank\tblank\n',
+                   're:NTC_\\d+\tNTC\tno template control\tNA\n']
+        specs = _read_special(special)
+        self.assertListEqual(list(specs), ['+'])
+        obs = [x.line() for x in map_plates(plate_map, barseq, special)]
+        exp = ['Blank1.A1\tAAAA1\tATCG\t1\tA1\tQZ\n',
+               'sp1\tAAAA2\tATCG\t1\tA2\tQZ\n',
+               'NTC1.A3\tAAAA3\tATCG\t1\tA3\tNA\n',
+               'Blank1.B1\tAAAB1\tATCG\t1\tB1\tQZ\n',
+               'PosCtl1.B2\tAAAB2\tATCG\t1\tB2\tXY\n',
+               'BLANKET\tAAAB3\tATCG\t1\tB3\tQZ\n']
+        self.assertListEqual(obs, exp)
+        with self.assertRaisesRegex(ValueError, 'has duplicates'):
+            _read_special(special + [special[2]])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import json
+from io import StringIO
+from unittest import TestCase, main
+from unittest.mock import patch
+from tempfile import mkdtemp
+from shutil import rmtree
+from os.path import join
+from plate_mapper.stats import RunStats
+
+
+class StatsTests(TestCase):
+    """Tests for stats.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def test_run_stats(self):
+        """Test RunStats."""
+        stats = RunStats()
+        with patch('sys.stdout', new_callable=StringIO) as out:
+            with stats.phase('read', 'Reading file'):
+                pass
+            with stats.phase('write'):
+                pass
+            stats.log('Task completed.')
+        self.assertEqual(out.getvalue(),
+                         'Reading file...\n  Done.\nTask completed.\n')
+        self.assertListEqual([x['name'] for x in stats.phases],
+                             ['read', 'write'])
+        self.assertNotIn('peak', stats.phases[0])
+        stats.count('rows', 3)
+        stats.count('rows')
+        self.assertDictEqual(stats.counters, {'rows': 4})
+
+        # quiet mode and peak memory
+        stats = RunStats(quiet=True, memory=True)
+        with patch('sys.stdout', new_callable=StringIO) as out:
+            with stats.phase('alloc', 'Allocating'):
+                x = [0] * 100000
+            del x
+        self.assertEqual(out.getvalue(), '')
+        self.assertGreater(stats.phases[0]['peak'], 100000 * 8)
+
+        # phase is recorded even if it fails
+        with self.assertRaises(ValueError):
+            with stats.phase('fail'):
+                raise ValueError('Error: failed.')
+        self.assertEqual(stats.phases[-1]['name'], 'fail')
+
+        # JSON sidecar
+        stats.warnings.append('  Repeated samples: sp001.\n')
+        fp = join(self.wkdir, 'stats.json')
+        stats.dump(fp)
+        with open(fp, 'r') as f:
+            obs = json.load(f)
+        self.assertDictEqual(obs, stats.to_dict())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import json
+from unittest import TestCase, main
+from tempfile import mkdtemp
+from shutil import rmtree
+from os.path import join, dirname, realpath
+from warnings import catch_warnings, simplefilter
+from plate_mapper.plate_mapper import plate_mapper
+from plate_mapper.suggest import (edit_distance, NameIndex, suggest_names,
+                                  _deletions)
+
+
+class SuggestTests(TestCase):
+    """Tests for suggest.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def test_edit_distance(self):
+        """Test edit_distance."""
+        self.assertEqual(edit_distance('', ''), 0)
+        self.assertEqual(edit_distance('sp001', ''), 5)
+        self.assertEqual(edit_distance('sp001', 'sp001'), 0)
+        self.assertEqual(edit_distance('sp001', 'sp01'), 1)
+        self.assertEqual(edit_distance('sp001', 'sp010'), 2)
+        self.assertEqual(edit_distance('kitten', 'sitting'), 3)
+        # capped at k + 1
+        self.assertEqual(edit_distance('kitten', 'sitting', 1), 2)
+        self.assertEqual(edit_distance('sp001', 'sp001.B.2', 2), 3)
+
+    def test__deletions(self):
+        """Test _deletions."""
+        self.assertSetEqual(_deletions('abc', 1), {'abc', 'bc', 'ac', 'ab'})
+        self.assertEqual(len(_deletions('abc', 2)), 7)
+
+    def test_name_index(self):
+        """Test NameIndex."""
+        index = NameIndex(['sp001', 'sp002', 'sp010', 'blank1', 'sp001'])
+        obs = index.search('sp01')
+        exp = [(1, 'sp001'), (1, 'sp010'), (2, 'sp002')]
+        self.assertListEqual(obs, exp)
+        self.assertListEqual(index.search('sp01', 0), [])
+        self.assertListEqual(index.search('xyz'), [])
+
+    def test_suggest_names(self):
+        """Test suggest_names."""
+        obs = suggest_names(['sp0l1', 'sp001-A', 'other'],
+                            ['sp011', 'sp001', 'sp001A', 'sp002'])
+        # ties are broken by name
+        exp = {'sp0l1': [('sp001', 1), ('sp011', 1), ('sp001A', 2)],
+               'sp001-A': [('sp001A', 1), ('sp001', 2)]}
+        self.assertDictEqual(obs, exp)
+        obs = suggest_names(['sp0l1'], ['sp011', 'sp001'], max_dist=1,
+                            limit=1)
+        self.assertDictEqual(obs, {'sp0l1': [('sp001', 1)]})
+
+    def test_write_report(self):
+        """Test sample name report of plate_mapper."""
+        datadir = join(dirname(realpath(__file__)), 'data')
+        report_fp = join(self.wkdir, 'report.json')
+        with catch_warnings(record=True):
+            simplefilter('always')
+            plate_mapper(
+                open(join(datadir, 'plate_map_w_special.txt'), 'r'),
+                open(join(datadir, 'barseq_temp.txt'), 'r'),
+                open(join(self.wkdir, 'mapping.txt'), 'w'),
+                names_f=open(join(datadir, 'sample_list.txt'), 'r'),
+                special_f=open(join(datadir, 'special_samples.txt'), 'r'),
+                stats=None, report_fp=report_fp)
+        with open(report_fp, 'r') as f:
+            obs = json.load(f)
+        self.assertListEqual(obs['novel'], ['sp004-A', 'sp005_B'])
+        self.assertEqual(len(obs['missing']), 14)
+        self.assertListEqual(obs['repeated'], [])
+        self.assertListEqual(obs['suggestions']['sp004-A'],
+                             [{'name': 'sp004', 'distance': 2}])
+        self.assertListEqual(obs['suggestions']['sp005_B'],
+                             [{'name': 'sp005', 'distance': 2}])
+
+
+if __name__ == '__main__':
+    main()
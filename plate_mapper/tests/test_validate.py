@@ -0,0 +1,205 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import json
+from io import StringIO
+from unittest import TestCase, main
+from unittest.mock import patch
+from tempfile import mkdtemp
+from shutil import rmtree
+from os.path import join, dirname, realpath
+from plate_mapper.validate import (Issue, Report, check_plate_mapper,
+                                   check_plate_linker)
+from plate_mapper.plate_mapper import main as mapper_main
+from plate_linker.plate_linker import main as linker_main
+
+
+class ValidateTests(TestCase):
+    """Tests for validate.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+        self.datadir = join(dirname(realpath(__file__)), 'data')
+        with open(join(self.datadir, 'barseq_temp.txt'), 'r') as f:
+            self.barseq = f.read().splitlines(True)
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def test_report(self):
+        """Test Issue and Report."""
+        report = Report()
+        report.error('bad well', 'a.txt', 3, 2)
+        report.warning('odd name', 'a.txt')
+        report.warning('odd barcode')
+        self.assertEqual(len(report.errors), 1)
+        self.assertEqual(len(report.warnings), 2)
+        exp = ('a.txt:3:2: error: bad well\n'
+               'a.txt: warning: odd name\n'
+               'warning: odd barcode\n'
+               '1 error, 2 warnings.\n')
+        self.assertEqual(report.text(), exp)
+        obs = report.to_dict()
+        self.assertEqual(obs['errors'], 1)
+        self.assertDictEqual(obs['issues'][0], {
+            'level': 'error', 'message': 'bad well', 'file': 'a.txt',
+            'line': 3, 'column': 2})
+        fp = join(self.wkdir, 'report.json')
+        report.dump(fp)
+        with open(fp, 'r') as f:
+            self.assertDictEqual(json.load(f), obs)
+        self.assertEqual(repr(Issue('error', 'x')),
+                         "Issue('error', 'x', None, None, None)")
+
+    def test_check_plate_mapper(self):
+        """Test check_plate_mapper."""
+        # valid inputs
+        with open(join(self.datadir, 'plate_map.txt'), 'r') as f:
+            report = check_plate_mapper(f, self.barseq)
+        self.assertListEqual(report.issues, [])
+
+        # all errors of a plate map are found in one pass
+        plate_map = ['Plate#1\t1\t2\t4\t#\n',
+                     'A\tsp1\tsp2\t\t1\tQZ\n',
+                     'C\tsp3\tsp1\t+\n',
+                     '\n',
+                     'Plate#2\t1\t2\t3\t#\n',
+                     'A\tsp4\t\t\t1\n',
+                     'B\tsp5\tsp6\n',
+                     'A\tsp7\n']
+        special = ['Code\tName\tNote\n', '+\tPos\tpositive\n',
+                   '+\tPos\tpositive again\n', '-\t\tnegative\n', 'x\n']
+        names = ['sp1\n', 'sp2\n', 'sp3\n', 'sp9\n']
+        report = check_plate_mapper(plate_map, self.barseq, names, special)
+        obs = [str(x) for x in report.issues]
+        exp = ['plate map:1:4: error: column headers are not incremental '
+               'integers: expected 3, found 4',
+               'plate map:3:1: error: row headers are not letters in '
+               'alphabetical order: expected B, found C',
+               'plate map:6:5: warning: primer plate 1 is also mapped on '
+               'line 2, which this plate replaces',
+               'plate map:8:1: error: row headers are not letters in '
+               'alphabetical order: expected C, found A',
+               'special sample definitions:3:1: error: code \'+\' has '
+               'duplicates: first defined on line 2',
+               'special sample definitions:4:2: error: code \'-\' has no '
+               'name',
+               'special sample definitions:5:1: error: invalid definition: '
+               'x',
+               'plate map:6:2: warning: sample sp4 is not in the name list',
+               'plate map:7:2: warning: sample sp5 is not in the name list',
+               'plate map:7:3: warning: sample sp6 is not in the name list',
+               'plate map:8:2: warning: sample sp7 is not in the name list',
+               'sample name list: warning: sample sp1 of the name list is '
+               'not in the plate map',
+               'sample name list: warning: sample sp2 of the name list is '
+               'not in the plate map',
+               'sample name list: warning: sample sp3 of the name list is '
+               'not in the plate map',
+               'sample name list: warning: sample sp9 of the name list is '
+               'not in the plate map']
+        self.assertListEqual(obs, exp)
+
+        # template problems and barcodes
+        barseq = self.barseq[:3] + ['AAAA\tATCG\t1\n', self.barseq[2]]
+        report = check_plate_mapper(['Plate#7\t1\t2\t#\n',
+                                     'A\tsp1\tsp1\t1\n',
+                                     '\n',
+                                     'Plate#8\t1\t#\n',
+                                     'A\tsp2\t9\n'],
+                                    barseq, barcode_dist=0)
+        obs = [str(x) for x in report.issues]
+        exp = ['barcode sequence template:4:1: error: template row has 3 '
+               'columns instead of 4',
+               'barcode sequence template:5:3: warning: well 1.A2 is also on '
+               'line 3',
+               'plate map: warning: primer plate 9 is not in the template',
+               'plate map:2:2: warning: sample sp1 occurs 3 times',
+               'warning: barcode TCCATACCGGAA is assigned to more than one '
+               'sample: 1.A2 1.A2']
+        self.assertListEqual(obs, exp)
+
+    def test_check_plate_linker(self):
+        """Test check_plate_linker."""
+        datadir = join(dirname(dirname(dirname(realpath(__file__)))),
+                       'plate_linker', 'tests', 'data')
+        with open(join(datadir, 'primer.txt'), 'r') as f:
+            primers = f.read().splitlines(True)
+        with open(join(datadir, 'metadata.txt'), 'r') as f:
+            report = check_plate_linker([f], primers)
+        self.assertListEqual([x for x in report.issues
+                              if x.level == 'error'], [])
+
+        metadata = [['Sample\tPlate\n',
+                     'sp1\t1\tA1\n',
+                     'sp2\t1\tZZ9\n',
+                     'sp3\tx\tA2\n',
+                     'sp4\t1\tA1\n',
+                     'sp5\t9\tA1\n',
+                     'bad\n'],
+                    ['Sample\tPlate\tWell\n',
+                     'sp6\t1\tA1\n']]
+        report = check_plate_linker(metadata, primers[:3] + primers[2:3])
+        obs = [str(x) for x in report.issues]
+        exp = ['metadata table 1:1:1: error: table has 2 columns instead of '
+               'at least 3',
+               'metadata table 1:3:3: error: invalid well identifier: 1.ZZ9',
+               'metadata table 1:4:2: error: invalid well identifier: x.A2',
+               'metadata table 1:5:2: warning: well 1.A1 is also on line 2, '
+               'which this row replaces',
+               'metadata table 1:7:1: error: row has 1 columns instead of at '
+               'least 3',
+               'metadata table 2:2:2: error: well 1.A1 is also in metadata '
+               'table 1 on line 5',
+               'primer table:4:4: warning: well 1.A2 is also on line 3',
+               'metadata table 1:6:2: error: sample sp5 does not have a '
+               'matched primer']
+        self.assertListEqual(obs, exp)
+
+    def test_check_mode(self):
+        """Test --check mode of the tools."""
+        json_fp = join(self.wkdir, 'report.json')
+        with patch('sys.stdout', new=StringIO()) as out:
+            status = mapper_main(['-q', '--check', '--check-json', json_fp,
+                                  '-i', join(self.datadir,
+                                             'plate_map_rherr.txt'),
+                                  '-t', join(self.datadir,
+                                             'barseq_temp.txt')])
+        self.assertEqual(status, 1)
+        self.assertIn('1 error, 0 warnings.', out.getvalue())
+        with open(json_fp, 'r') as f:
+            self.assertEqual(json.load(f)['errors'], 1)
+        with patch('sys.stdout', new=StringIO()) as out:
+            status = mapper_main(['-q', '--check',
+                                  '-i', join(self.datadir, 'plate_map.txt'),
+                                  '-t', join(self.datadir,
+                                             'barseq_temp.txt')])
+        self.assertIsNone(status)
+        self.assertEqual(out.getvalue(), '0 errors, 0 warnings.\n')
+
+        # output is required unless checking
+        with patch('sys.stderr', new=StringIO()):
+            with self.assertRaises(SystemExit):
+                mapper_main(['-i', join(self.datadir, 'plate_map.txt'),
+                             '-t', join(self.datadir, 'barseq_temp.txt')])
+
+        metadata_fp = join(self.wkdir, 'metadata.txt')
+        with open(metadata_fp, 'w') as f:
+            f.write('Sample\tPlate\tWell\nsp1\t1\tA0\n')
+        with patch('sys.stdout', new=StringIO()) as out:
+            status = linker_main(['--check', '-m', metadata_fp,
+                                  '-p', join(self.datadir,
+                                             'barseq_temp.txt')])
+        self.assertEqual(status, 1)
+        self.assertIn('error: invalid well identifier: 1.A0', out.getvalue())
+
+
+if __name__ == '__main__':
+    main()
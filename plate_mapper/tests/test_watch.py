@@ -0,0 +1,212 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+from unittest import TestCase, main
+from tempfile import mkdtemp
+from shutil import rmtree, copyfile
+from os.path import join, dirname, realpath
+from plate_mapper.fileio import AtomicFile, content_digest
+from plate_mapper.watch import Watcher, _kind
+
+
+class WatchTests(TestCase):
+    """Tests for watch.py."""
+
+    def setUp(self):
+        """Create watched and output directories."""
+        self.wkdir = mkdtemp()
+        self.indir = join(self.wkdir, 'in')
+        self.outdir = join(self.wkdir, 'out')
+        os.mkdir(self.indir)
+        os.mkdir(self.outdir)
+        self.datadir = join(dirname(realpath(__file__)), 'data')
+        self.linkdir = join(dirname(realpath(__file__)), '..', '..',
+                            'plate_linker', 'tests', 'data')
+        self.barseq_fp = join(self.wkdir, 'barseq_temp.txt')
+        copyfile(join(self.datadir, 'barseq_temp.txt'), self.barseq_fp)
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def _read(self, fp):
+        with open(fp, 'r') as f:
+            return f.read()
+
+    def test__kind(self):
+        """Test _kind."""
+        self.assertEqual(_kind(join(self.datadir, 'plate_map.txt')), 'map')
+        self.assertEqual(_kind(join(self.linkdir, 'metadata.txt')),
+                         'metadata')
+
+    def test_poll(self):
+        """Test converting files as they change."""
+        watcher = Watcher(self.indir, self.outdir, self.barseq_fp,
+                          join(self.linkdir, 'primer.txt'), empty=True,
+                          debounce=2)
+        self.assertListEqual(watcher.poll(0), [])
+        map_fp = join(self.indir, 'plate_map.txt')
+        copyfile(join(self.datadir, 'plate_map.txt'), map_fp)
+        out_fp = join(self.outdir, 'plate_map_mapping.txt')
+        exp = self._read(join(self.datadir, 'exp_mapping.txt'))
+
+        # not converted until unchanged for debounce period
+        self.assertListEqual(watcher.poll(1), [])
+        self.assertListEqual(watcher.poll(2), [])
+        obs = watcher.poll(3)
+        self.assertEqual(len(obs), 1)
+        self.assertEqual(obs[0][0], map_fp)
+        self.assertTrue(obs[0][1]['ok'])
+        self.assertEqual(self._read(out_fp), exp)
+        self.assertListEqual(watcher.poll(10), [])
+
+        # a changed file is converted again, after the last save
+        with open(map_fp, 'a') as f:
+            f.write('\n')
+        os.utime(map_fp, ns=(1, 1))
+        self.assertListEqual(watcher.poll(11), [])
+        with open(map_fp, 'a') as f:
+            f.write('\n')
+        self.assertListEqual(watcher.poll(12), [])
+        self.assertListEqual(watcher.poll(13), [])
+        self.assertEqual(len(watcher.poll(14)), 1)
+        # a touched file is not
+        os.utime(map_fp, ns=(2, 2))
+        watcher.poll(15)
+        self.assertListEqual(watcher.poll(20), [])
+
+        # metadata tables are linked to primers
+        meta_fp = join(self.indir, 'metadata.txt')
+        copyfile(join(self.linkdir, 'metadata.txt'), meta_fp)
+        watcher.poll(21)
+        obs = watcher.poll(23)
+        self.assertListEqual([x[0] for x in obs], [meta_fp])
+        self.assertEqual(self._read(join(self.outdir,
+                                         'metadata_mapping.txt')),
+                         self._read(join(self.linkdir, 'exp_output.txt')))
+
+        # all files are converted again when the template changes
+        with open(self.barseq_fp, 'a') as f:
+            f.write('AAAAAAAAAAAA\tATCG\t9\tA1\n')
+        watcher.poll(30)
+        obs = watcher.poll(32)
+        self.assertListEqual(sorted(x[0] for x in obs), [meta_fp, map_fp])
+        self.assertEqual(self._read(out_fp), exp + '\tAAAAAAAAAAAA\tATCG\t9'
+                                                   '\tA1\t\n')
+
+        # errors are reported
+        bad_fp = join(self.indir, 'bad.txt')
+        copyfile(join(self.datadir, 'plate_map_rherr.txt'), bad_fp)
+        watcher.poll(40)
+        obs = watcher.poll(42)
+        self.assertEqual(obs[0][1]['error'], 'Error: row headers are not '
+                                             'letters in alphabetical order.')
+        self.assertFalse(os.path.exists(join(self.outdir,
+                                             'bad_mapping.txt')))
+
+    def test_poll_failure(self):
+        """Test going on after a file fails to convert."""
+        watcher = Watcher(self.indir, self.outdir, self.barseq_fp,
+                          debounce=0)
+        map_fp = join(self.indir, 'plate_map.txt')
+        copyfile(join(self.datadir, 'plate_map.txt'), map_fp)
+        handle = watcher.service.handle
+        watcher.service.handle = lambda request: 1 / 0
+        obs = watcher.poll(0)
+        self.assertEqual(obs[0][1], {'ok': False, 'error': 'Error: '
+                                     'ZeroDivisionError: division by zero.'})
+        # converted again once changed, and other files are still converted
+        watcher.service.handle = handle
+        self.assertListEqual(watcher.poll(1), [])
+        with open(map_fp, 'a') as f:
+            f.write('\n')
+        copyfile(map_fp, join(self.indir, 'plate_map2.txt'))
+        obs = watcher.poll(2)
+        self.assertEqual(len(obs), 2)
+        self.assertTrue(all(x[1]['ok'] for x in obs))
+
+    def test_poll_collision(self):
+        """Test reporting files whose outputs would be the same."""
+        watcher = Watcher(self.indir, self.outdir, self.barseq_fp,
+                          debounce=0)
+        tsv_fp = join(self.indir, 'plate_map.tsv')
+        txt_fp = join(self.indir, 'plate_map.txt')
+        copyfile(join(self.datadir, 'plate_map.txt'), tsv_fp)
+        copyfile(join(self.datadir, 'plate_map_w_dup.txt'), txt_fp)
+        out_fp = join(self.outdir, 'plate_map_mapping.txt')
+        obs = dict(watcher.poll(0))
+        self.assertTrue(obs[tsv_fp]['ok'])
+        self.assertDictEqual(obs[txt_fp], {'ok': False, 'error': (
+            'Error: output file %s is also that of %s.' % (out_fp, tsv_fp))})
+        exp = self._read(out_fp)
+        # reported once, and the output is left to its file
+        with open(txt_fp, 'a') as f:
+            f.write('\n')
+        self.assertListEqual(watcher.poll(1), [])
+        self.assertEqual(self._read(out_fp), exp)
+        # converted once the other file is gone, although the output is newer
+        os.remove(tsv_fp)
+        obs = watcher.poll(2)
+        self.assertListEqual([x[0] for x in obs], [txt_fp])
+        self.assertNotEqual(self._read(out_fp), exp)
+
+    def test_poll_current(self):
+        """Test skipping files whose outputs are up to date."""
+        map_fp = join(self.indir, 'plate_map.txt')
+        copyfile(join(self.datadir, 'plate_map.txt'), map_fp)
+        watcher = Watcher(self.indir, self.outdir, self.barseq_fp,
+                          debounce=0)
+        self.assertEqual(len(watcher.poll()), 1)
+        watcher = Watcher(self.indir, self.outdir, self.barseq_fp,
+                          debounce=0)
+        self.assertListEqual(watcher.poll(), [])
+        with self.assertRaises(ValueError):
+            Watcher(self.indir, self.indir, self.barseq_fp)
+
+    def test_AtomicFile(self):
+        """Test AtomicFile."""
+        fp = join(self.outdir, 'out.txt')
+        with open(fp, 'w') as f:
+            f.write('old\n')
+        with AtomicFile(fp) as f:
+            f.write('new\n')
+            # the file is only replaced once complete
+            self.assertEqual(self._read(fp), 'old\n')
+            self.assertEqual(len(os.listdir(self.outdir)), 2)
+        self.assertEqual(self._read(fp), 'new\n')
+        self.assertListEqual(os.listdir(self.outdir), ['out.txt'])
+        # an error leaves the file untouched
+        with self.assertRaises(ValueError):
+            with AtomicFile(fp) as f:
+                f.write('partial\n')
+                raise ValueError
+        self.assertEqual(self._read(fp), 'new\n')
+        self.assertListEqual(os.listdir(self.outdir), ['out.txt'])
+        # an unchanged file is left as it is
+        os.utime(fp, (0, 0))
+        with AtomicFile(fp, skip_unchanged=True) as f:
+            f.writelines(['ne', 'w\n'])
+        self.assertFalse(f.changed)
+        self.assertEqual(os.stat(fp).st_mtime, 0)
+        self.assertEqual(f.digest, content_digest(fp))
+        self.assertListEqual(os.listdir(self.outdir), ['out.txt'])
+        with AtomicFile(fp, skip_unchanged=True) as f:
+            f.write('newer\n')
+        self.assertTrue(f.changed)
+        self.assertEqual(self._read(fp), 'newer\n')
+        # nothing is created until written
+        f = AtomicFile(join(self.outdir, 'other.txt'))
+        self.assertListEqual(os.listdir(self.outdir), ['out.txt'])
+        f.discard()
+        self.assertListEqual(os.listdir(self.outdir), ['out.txt'])
+        self.assertIsNone(content_digest(join(self.outdir, 'other.txt')))
+
+
+if __name__ == '__main__':
+    main()
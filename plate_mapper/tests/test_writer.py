@@ -0,0 +1,168 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+from unittest import TestCase, main
+from io import StringIO
+from contextlib import redirect_stderr
+from tempfile import mkdtemp
+from shutil import rmtree
+from os.path import join, dirname, realpath
+from plate_mapper.writer import (BatchWriter, ShardWriter, render_suffix,
+                                 shard_key)
+from plate_mapper.plate_mapper import main as mapper_main
+from plate_linker.plate_linker import main as linker_main
+
+
+class WriterTests(TestCase):
+    """Tests for writer.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def _read(self, fp):
+        with open(fp, 'r') as f:
+            return f.read()
+
+    def test_render_suffix(self):
+        """Test render_suffix."""
+        self.assertEqual(render_suffix(('QZ', '8/15/16')), '\tQZ\t8/15/16\n')
+        self.assertEqual(render_suffix(()), '\t\n')
+
+    def test_batch_writer(self):
+        """Test BatchWriter."""
+        f = StringIO()
+        writer = BatchWriter(f, size=2)
+        writer.write('a\n')
+        self.assertEqual(f.getvalue(), '')
+        writer.write('b\n')
+        self.assertEqual(f.getvalue(), 'a\nb\n')
+        writer.write('c\n')
+        writer.writelines('%d\n' % i for i in range(5))
+        self.assertEqual(f.getvalue(), 'a\nb\nc\n0\n1\n2\n3\n4\n')
+        writer.write('d\n')
+        writer.flush()
+        self.assertEqual(f.getvalue(), 'a\nb\nc\n0\n1\n2\n3\n4\nd\n')
+        writer.close()
+        self.assertTrue(f.closed)
+
+    def test_shard_key(self):
+        """Test shard_key."""
+        fields = ('sp1', 'AAAA', 'ATCG', '7', 'A1')
+        suffix = '\tQZ\t8/15/16\n'
+        self.assertEqual(shard_key('primer_plate')(fields, suffix), '7')
+        self.assertEqual(shard_key('plate_id', plate_ids={'7': 'P1'})(
+            fields, suffix), 'P1')
+        self.assertEqual(shard_key(5)(fields, suffix), 'A1')
+        self.assertEqual(shard_key('7')(fields, suffix), '8/15/16')
+        self.assertEqual(shard_key('8')(fields, suffix), '')
+        self.assertEqual(shard_key('Date', ['a', 'b', 'c', 'd', 'e', 'Plating',
+                                            'Date'])(fields, suffix),
+                         '8/15/16')
+        with self.assertRaisesRegex(ValueError, 'only known'):
+            shard_key('plate_id')
+        with self.assertRaisesRegex(ValueError, 'no column Lane'):
+            shard_key('Lane', ['a', 'b'])
+        with self.assertRaisesRegex(ValueError, 'no column 0'):
+            shard_key('0')
+
+    def test_shard_writer(self):
+        """Test ShardWriter."""
+        out_dir = join(self.wkdir, 'shards')
+        writer = ShardWriter(out_dir, header='h\n', max_open=2, size=3)
+        writer.writelines((k, '%s%d\n' % (k, i))
+                          for i, k in enumerate('abcab'))
+        # only full buffers are written, to hidden files
+        self.assertEqual(len(os.listdir(out_dir)), 3)
+        self.assertTrue(all(x.startswith('.') for x in os.listdir(out_dir)))
+        # the least recently used shard is closed, and reopened when written
+        writer.write('c', 'c5\n')
+        writer.writelines([('a', 'a6\n'), ('b/x', 'b7\n'), ('', '8\n'),
+                           ('b_x', 'b9\n')])
+        self.assertEqual(sum(x.f is not None for x in
+                             writer.shards.values()), 2)
+        writer.close()
+        self.assertEqual(self._read(join(out_dir, 'a.txt')),
+                         'h\na0\na3\na6\n')
+        self.assertEqual(self._read(join(out_dir, 'c.txt')), 'h\nc2\nc5\n')
+        self.assertEqual(self._read(join(out_dir, 'b_x.2.txt')), 'h\nb9\n')
+        self.assertEqual(self._read(join(out_dir, 'index.tsv')), (
+            'shard\tfile\trows\na\ta.txt\t3\nb\tb.txt\t2\nc\tc.txt\t2\n'
+            'b/x\tb_x.txt\t1\n\tunassigned.txt\t1\nb_x\tb_x.2.txt\t1\n'))
+        self.assertEqual(len(os.listdir(out_dir)), 7)
+
+        # discarded shards leave earlier ones untouched
+        with self.assertRaises(ValueError):
+            with ShardWriter(out_dir, size=1) as writer:
+                writer.write('a', 'new\n')
+                raise ValueError
+        self.assertEqual(len(os.listdir(out_dir)), 7)
+        self.assertEqual(self._read(join(out_dir, 'a.txt')),
+                         'h\na0\na3\na6\n')
+        with self.assertRaisesRegex(ValueError, 'At least one'):
+            ShardWriter(out_dir, max_open=0)
+
+    def test_main(self):
+        """Test sharded output of plate_mapper and plate_linker."""
+        datadir = join(dirname(realpath(__file__)), 'data')
+        output_fp = join(self.wkdir, 'mapping.txt')
+        out_dir = join(self.wkdir, 'shards')
+        argv = ['-q', '-i', join(datadir, 'plate_map.txt'),
+                '-t', join(datadir, 'barseq_temp.txt')]
+        for shard_by in ('primer_plate', 'plate_id', '6'):
+            rmtree(out_dir, ignore_errors=True)
+            mapper_main(argv + ['-o', output_fp])
+            mapper_main(argv + ['--shard-by', shard_by, '--shard-dir',
+                                out_dir, '--max-open', '1'])
+            exp = self._read(output_fp).splitlines()
+            obs = []
+            index = self._read(join(out_dir, 'index.tsv')).splitlines()
+            for line in index[1:]:
+                key, fp, n = line.split('\t')
+                lines = self._read(join(out_dir, fp)).splitlines()
+                self.assertEqual(len(lines), int(n))
+                obs.extend(lines)
+            # shards partition the rows, in order within each
+            self.assertListEqual(sorted(obs), sorted(exp))
+            self.assertListEqual([x for x in exp if x in set(lines)], lines)
+
+        # each shard has the column headers
+        linkdir = join(datadir, '..', '..', '..', 'plate_linker', 'tests',
+                       'data')
+        rmtree(out_dir)
+        linker_main(['-q', '-m', join(linkdir, 'metadata.txt'),
+                     '-p', join(linkdir, 'primer.txt'),
+                     '--shard-by', 'Primer_Plate', '--shard-dir', out_dir])
+        index = self._read(join(out_dir, 'index.tsv')).splitlines()
+        self.assertGreater(len(index), 2)
+        header = self._read(join(linkdir, 'exp_output.txt')).splitlines()[0]
+        for line in index[1:]:
+            key, fp, n = line.split('\t')
+            lines = self._read(join(out_dir, fp)).splitlines()
+            self.assertEqual(lines[0], header)
+            self.assertEqual(len(lines), int(n) + 1)
+            self.assertTrue(all(x.split('\t')[3] == key for x in lines[1:]))
+
+        # shard column and directory are given together
+        link_argv = ['-m', join(linkdir, 'metadata.txt'),
+                     '-p', join(linkdir, 'primer.txt')]
+        for main_, args in ((mapper_main, argv), (linker_main, link_argv)):
+            with redirect_stderr(StringIO()) as f, \
+                    self.assertRaises(SystemExit):
+                main_(args + ['--shard-by', 'primer_plate'])
+            self.assertIn('--shard-by and --shard-dir must be given together',
+                          f.getvalue())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import zipfile
+from unittest import TestCase, main
+from unittest.mock import patch
+from tempfile import mkdtemp
+from shutil import rmtree
+from os.path import join, dirname, realpath
+from warnings import catch_warnings, simplefilter
+from plate_mapper.fileio import open_file
+from plate_mapper.xlsx import XlsxFile, format_date, select_sheets
+from plate_mapper.plate_mapper import plate_mapper
+from plate_linker.plate_linker import main as linker_main
+from plate_mapper.stats import RunStats
+
+
+_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def _cell(ref, value, styles=None):
+    """Write a cell as Excel does: numbers as values, text as shared
+    strings."""
+    if isinstance(value, tuple):  # (value, style index)
+        value, style = value
+        return '<c r="%s" s="%d"><v>%s</v></c>' % (ref, style, value)
+    if isinstance(value, (int, float)):
+        return '<c r="%s"><v>%r</v></c>' % (ref, value)
+    return '<c r="%s" t="s"><v>%d</v></c>' % (ref, styles.index(value))
+
+
+def write_workbook(fp, sheets):
+    """Write a minimal workbook.
+
+    Parameters
+    ----------
+    fp : str
+        Workbook file path
+    sheets : list of tuple of (str, list of list)
+        Sheet name and rows of cell values, which are str, int, float,
+        None, or (serial date, style index); a row may be None to leave it
+        out of the sheet
+    """
+    strings = sorted({x for _, rows in sheets for row in rows or []
+                      for x in row or [] if isinstance(x, str)})
+    with zipfile.ZipFile(fp, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('xl/workbook.xml', (
+            '<workbook xmlns="%s" xmlns:r="%s"><sheets>%s</sheets>'
+            '</workbook>' % (_MAIN, _REL, ''.join(
+                '<sheet name="%s" sheetId="%d" r:id="rId%d"/>'
+                % (name, i, i) for i, (name, _) in enumerate(sheets, 1)))))
+        z.writestr('xl/_rels/workbook.xml.rels', (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/'
+            'package/2006/relationships">%s</Relationships>' % ''.join(
+                '<Relationship Id="rId%d" Target="worksheets/sheet%d.xml"/>'
+                % (i, i) for i in range(1, len(sheets) + 1))))
+        z.writestr('xl/sharedStrings.xml', '<sst xmlns="%s">%s</sst>' % (
+            _MAIN, ''.join('<si><t>%s</t></si>' % x for x in strings)))
+        z.writestr('xl/styles.xml', (
+            '<styleSheet xmlns="%s"><numFmts><numFmt numFmtId="164" '
+            'formatCode="yyyy\\-mm\\-dd"/></numFmts><cellXfs><xf/>'
+            '<xf numFmtId="14"/><xf numFmtId="164"/><xf numFmtId="11"/>'
+            '</cellXfs></styleSheet>' % _MAIN))
+        for i, (_, rows) in enumerate(sheets, 1):
+            xml = []
+            for r, row in enumerate(rows, 1):
+                if row is None:
+                    continue
+                xml.append('<row r="%d">%s</row>' % (r, ''.join(
+                    _cell('%s%d' % (chr(65 + c), r), x, strings)
+                    for c, x in enumerate(row) if x is not None)))
+            z.writestr('xl/worksheets/sheet%d.xml' % i, (
+                '<worksheet xmlns="%s"><sheetData>%s</sheetData>'
+                '</worksheet>' % (_MAIN, ''.join(xml))))
+
+
+class XlsxTests(TestCase):
+    """Tests for xlsx.py."""
+
+    def setUp(self):
+        """Create working directory."""
+        self.wkdir = mkdtemp()
+        self.datadir = join(dirname(realpath(__file__)), 'data')
+
+    def tearDown(self):
+        """Delete working directory."""
+        rmtree(self.wkdir)
+
+    def test_xlsx_file(self):
+        """Test XlsxFile."""
+        fp = join(self.wkdir, 'book.xlsx')
+        write_workbook(fp, [
+            ('First', [['a', 1, None, 0.1], None, [None, 'b\tc'],
+                       [(42597, 1), (42597.5, 2), (10, 3)]]),
+            ('Second', [None, ['x', 'y'], [2, 'z']])])
+        f = open_file(fp)
+        self.assertIsInstance(f, XlsxFile)
+        self.assertListEqual(f.sheet_names, ['First', 'Second'])
+        # numbers are kept as stored, dates rendered by their formats, and
+        # missing rows and cells are empty
+        exp = ['a\t1\t\t0.1\n', '\n', '\tb c\n',
+               '8/15/2016\t2016-08-15\t10\n']
+        self.assertListEqual(list(f), exp)
+        # iterating again starts over
+        self.assertEqual(f.read(), ''.join(exp))
+        f.select(['Second', 'First'])
+        self.assertListEqual(list(f)[:4], ['\n', 'x\ty\n', '2\tz\n', '\n'])
+        # headers of later sheets are skipped
+        f.select(None, header=True)
+        self.assertListEqual(list(f)[4:], ['2\tz\n'])
+        with self.assertRaisesRegex(ValueError, 'no sheet named Third'):
+            f.select(['Third'])
+        f.close()
+        self.assertTrue(f.closed)
+
+        # not a workbook
+        with self.assertRaisesRegex(ValueError, 'not an .xlsx workbook'):
+            XlsxFile(join(self.datadir, 'plate_map.txt'))
+        with open_file(join(self.datadir, 'plate_map.txt')) as f:
+            with self.assertRaisesRegex(ValueError, 'sheets can be chosen'):
+                select_sheets([f], ['First'])
+
+    def test_format_date(self):
+        """Test format_date."""
+        self.assertEqual(format_date(42597, 'm/d/yy'), '8/15/16')
+        self.assertEqual(format_date(42597.75, 'dd-mmm-yyyy hh:mm AM/PM'),
+                         '15-Aug-2016 06:00 PM')
+        self.assertEqual(format_date(0.5, 'h:mm:ss'), '12:00:00')
+        self.assertEqual(format_date(0, '[$-409]mmmm d", "yyyy', True),
+                         'January 1, 1904')
+
+    def test_plate_mapper(self):
+        """Test plate_mapper and plate_linker with workbooks."""
+        with open(join(self.datadir, 'plate_map.txt'), 'r') as f:
+            rows = [[int(x) if x.isdigit() else x or None
+                     for x in line.rstrip('\n').split('\t')] for line in f]
+        fp = join(self.wkdir, 'plate_map.xlsx')
+        write_workbook(fp, [('Plates', rows)])
+        obs = []
+        for input_fp in (join(self.datadir, 'plate_map.txt'), fp):
+            output_fp = join(self.wkdir, 'mapping.txt')
+            with catch_warnings(record=True):
+                simplefilter('always')
+                plate_mapper(open_file(input_fp),
+                             open(join(self.datadir, 'barseq_temp.txt'), 'r'),
+                             open(output_fp, 'w'), stats=RunStats(quiet=True))
+            with open(output_fp, 'r') as f:
+                obs.append(f.read())
+        self.assertEqual(obs[1], obs[0])
+
+        # metadata tables split across sheets
+        fp = join(self.wkdir, 'metadata.xlsx')
+        write_workbook(fp, [('A', [['Sample', 'Plate', 'Well', 'Note'],
+                                   ['sp1', 1, 'A1', 'x']]),
+                            ('B', [['Sample', 'Plate', 'Well', 'Note'],
+                                   ['sp2', 1, 'A2', 'y']])])
+        with patch('sys.stdout'):
+            linker_main(['-q', '--all-sheets', '-m', fp, '-p',
+                         join(dirname(dirname(dirname(realpath(__file__)))),
+                              'plate_linker', 'tests', 'data', 'primer.txt'),
+                         '-o', output_fp])
+        with open(output_fp, 'r') as f:
+            obs = f.read().splitlines()
+        self.assertEqual(obs[0].split('\t')[-1], 'Note')
+        self.assertListEqual([x.split('\t')[0] for x in obs[1:]],
+                             ['sp1', 'sp2'])
+
+
+if __name__ == '__main__':
+    main()
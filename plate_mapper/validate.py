@@ -0,0 +1,540 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Validation of all inputs of a run in one pass.
+
+The tools stop at the first invalid input. The checks here follow the same
+rules, but record each problem with its location and carry on, so that one
+run lists everything that needs fixing.
+"""
+
+import re
+from collections import Counter
+from plate_mapper.barseq_index import BarseqIndex
+from plate_mapper.plate import Plate, ROWS, FORMATS, plate_format
+
+
+# row header : row index
+_ROW_INDEX = {x: i for i, x in enumerate(ROWS)}
+
+
+class Issue(object):
+    """A problem found in an input.
+
+    Parameters
+    ----------
+    level : {'error', 'warning'}
+        Severity: errors stop a run, whereas warnings do not
+    message : str
+        Description of the problem
+    file : str (optional)
+        File name
+    line : int (optional)
+        Line number, starting at 1
+    column : int (optional)
+        Column number, starting at 1
+    """
+
+    __slots__ = ('level', 'message', 'file', 'line', 'column')
+
+    def __init__(self, level, message, file=None, line=None, column=None):
+        self.level = level
+        self.message = message
+        self.file = file
+        self.line = line
+        self.column = column
+
+    def location(self):
+        """Location as "file:line:column", omitting unknown parts."""
+        return ':'.join(str(x) for x in (self.file, self.line, self.column)
+                        if x is not None)
+
+    def to_dict(self):
+        """Convert issue into a dictionary."""
+        return {x: getattr(self, x) for x in self.__slots__}
+
+    def __str__(self):
+        location = self.location()
+        return '%s%s: %s' % (location + ': ' if location else '', self.level,
+                             self.message)
+
+    def __repr__(self):
+        return 'Issue(%r, %r, %r, %r, %r)' % (
+            self.level, self.message, self.file, self.line, self.column)
+
+
+class Report(object):
+    """Errors and warnings of all inputs of a run.
+
+    Attributes
+    ----------
+    issues : list of Issue
+        Problems, in the order they were found
+    """
+
+    def __init__(self):
+        self.issues = []
+
+    def error(self, message, file=None, line=None, column=None):
+        """Record an error (see `Issue`)."""
+        self.issues.append(Issue('error', message, file, line, column))
+
+    def warning(self, message, file=None, line=None, column=None):
+        """Record a warning (see `Issue`)."""
+        self.issues.append(Issue('warning', message, file, line, column))
+
+    @property
+    def errors(self):
+        """Errors."""
+        return [x for x in self.issues if x.level == 'error']
+
+    @property
+    def warnings(self):
+        """Warnings."""
+        return [x for x in self.issues if x.level == 'warning']
+
+    def text(self):
+        """Render report as text, one issue per line, and a summary."""
+        nerr, nwarn = len(self.errors), len(self.warnings)
+        lines = [str(x) for x in self.issues]
+        lines.append('%d error%s, %d warning%s.' % (
+            nerr, '' if nerr == 1 else 's', nwarn, '' if nwarn == 1 else 's'))
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        """Convert report into a dictionary."""
+        return {'errors': len(self.errors), 'warnings': len(self.warnings),
+                'issues': [x.to_dict() for x in self.issues]}
+
+    def dump(self, fp):
+        """Write report to a JSON file.
+
+        Parameters
+        ----------
+        fp : str
+            Output file path
+        """
+        import json
+        with open(fp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def _name(f, default):
+    """Get name of an input for locations."""
+    return getattr(f, 'name', None) or default
+
+
+def _message(e):
+    """Turn an error of the tools into an issue message."""
+    msg = str(e)
+    if msg.startswith('Error: '):
+        msg = msg[7:]
+    return msg.rstrip('.')
+
+
+def _check_plate_map(input_f, report, name):
+    """Read a plate map, recording problems instead of raising.
+
+    Parameters
+    ----------
+    input_f : iterable of str
+        Lines of plate map file
+    report : Report
+        Report to record problems into
+    name : str
+        File name
+
+    Returns
+    -------
+    dict of Plate
+        Primer plate ID : plate of sample IDs, as `_read_plate_map` would
+        read from the valid lines
+    dict of tuple of (int, int)
+        Sample ID : line and column of its first occurrence
+
+    Notes
+    -----
+    After an invalid row header, reading resumes at the row it names if that
+    comes later in the plate, and at the next row otherwise, so that one
+    mistake is reported once.
+    """
+    plates = {}
+    where = {}
+    heads = {}  # primer plate ID : line of first row of plate
+    cols = 0
+    row = None
+    plate_id = ''
+    grid = None
+    for n, line in enumerate(input_f, 1):
+        l = line.rstrip().split('\t')
+        if l == ['']:
+            continue
+        if len(l) > 1 and l[1] == '1':  # plate head
+            # keep counting columns after a wrong header, so that the
+            # primer plate ID and metadata are still found
+            bad = None
+            for cols, v in enumerate(l[1:]):
+                if not v.isdigit():
+                    break
+                elif int(v) != cols + 1 and bad is None:
+                    bad = cols
+            if bad is not None:
+                report.error('column headers are not incremental integers: '
+                             'expected %d, found %s' % (bad + 1, l[bad + 1]),
+                             name, n, bad + 2)
+            m = re.search(r'(\d+)$', l[0])
+            if m:
+                plate_id = m.group(1)
+            try:
+                plate_format(0, cols)
+            except ValueError as e:
+                report.error(_message(e), name, n, FORMATS[-1][2] + 2)
+                cols = FORMATS[-1][2]
+            row = 0
+            grid = None
+            continue
+        if row is None:
+            report.error('plate row before first plate head', name, n, 1)
+            continue
+        if row >= len(ROWS):
+            if row == len(ROWS):
+                try:
+                    plate_format(row + 1, cols)
+                except ValueError as e:
+                    report.error(_message(e), name, n, 1)
+            row += 1
+            continue
+        if ROWS[row] != l[0]:
+            report.error('row headers are not letters in alphabetical '
+                         'order: expected %s, found %s' % (ROWS[row], l[0]),
+                         name, n, 1)
+            if _ROW_INDEX.get(l[0], -1) > row:
+                row = _ROW_INDEX[l[0]]
+        if grid is None:  # first row
+            grid = Plate(plate_id, l[cols + 2:], cols=cols)
+            if len(l) <= cols + 1:
+                report.error('first row of plate has no primer plate ID '
+                             'column', name, n, cols + 2)
+            elif not l[cols + 1]:
+                report.warning('primer plate ID is empty, so the plate is '
+                               'not mapped', name, n, cols + 2)
+            else:
+                primer_plate = l[cols + 1]
+                if primer_plate in heads:
+                    report.warning('primer plate %s is also mapped on line '
+                                   '%d, which this plate replaces'
+                                   % (primer_plate, heads[primer_plate]),
+                                   name, n, cols + 2)
+                heads[primer_plate] = n
+                plates[primer_plate] = grid
+        for i in range(1, min(cols + 1, len(l))):
+            if l[i]:
+                grid.set(row, i - 1, l[i])
+                where.setdefault(l[i], (n, i + 1))
+        row += 1
+    return plates, where
+
+
+def _check_special(special_f, report, name):
+    """Read special sample definitions, recording problems.
+
+    Parameters
+    ----------
+    special_f : iterable of str
+        Lines of special sample definition file, starting with a header
+    report : Report
+        Report to record problems into
+    name : str
+        File name
+
+    Returns
+    -------
+    SpecialSamples
+        Valid definitions, as returned by `_read_special`
+    """
+    from plate_mapper.writer import render_suffix
+    from plate_mapper.special import SpecialSamples
+    specs = SpecialSamples()
+    lines = {}  # code : line of first definition
+    for n, line in enumerate(special_f, 1):
+        if n == 1:  # header
+            continue
+        line = line.rstrip()
+        l = line.split('\t')
+        if len(l) < 3:
+            report.error('invalid definition: %s' % line, name, n, 1)
+            continue
+        if l[0] in lines:
+            report.error('code %r has duplicates: first defined on line %d'
+                         % (l[0], lines[l[0]]), name, n, 1)
+            continue
+        if not l[1]:
+            report.error('code %r has no name' % l[0], name, n, 2)
+            continue
+        try:
+            specs.add(l[0], {'name': l[1], 'note': l[2], 'metadatum': l[3:],
+                             'suffix': render_suffix(l[3:])})
+        except ValueError as e:
+            report.error(_message(e), name, n, 1)
+            continue
+        lines[l[0]] = n
+    try:
+        specs.compile()
+    except ValueError as e:
+        report.error(_message(e), name)
+        specs.patterns = []  # resolve exact codes only
+    return specs
+
+
+def _check_barseq(barseq_f, report, name):
+    """Read barcode sequence template rows, recording problems.
+
+    Parameters
+    ----------
+    barseq_f : iterable of str, or BarseqIndex
+        Lines of barcode sequence template file, starting with a header, or
+        its compiled index, which is valid already
+    report : Report
+        Report to record problems into
+    name : str
+        File name
+
+    Yields
+    ------
+    list of str
+        Valid rows of barcode, primer, primer plate ID and well ID
+    """
+    if isinstance(barseq_f, BarseqIndex):
+        yield from barseq_f
+        return
+    seen = {}  # (primer plate ID, well ID) : line
+    for n, line in enumerate(barseq_f, 1):
+        line = line.rstrip()
+        if n == 1 or not line:
+            continue
+        l = line.split('\t')
+        if len(l) != 4:
+            report.error('template row has %d columns instead of 4'
+                         % len(l), name, n, 1)
+            continue
+        key = (l[2], l[3])
+        if key in seen:
+            report.warning('well %s.%s is also on line %d'
+                           % (l[2], l[3], seen[key]), name, n, 3)
+        else:
+            seen[key] = n
+        yield l
+
+
+def _check_barcodes(barcodes, k, report):
+    """Record duplicated and similar barcodes as warnings."""
+    from plate_mapper.barcodes import find_collisions
+    duplicates, similar = find_collisions(barcodes, k)
+    for x in sorted(duplicates):
+        report.warning('barcode %s is assigned to more than one sample: %s'
+                       % (x, ' '.join(duplicates[x])))
+    for a, b, d in similar:
+        report.warning('barcodes %s and %s are within Hamming distance %d'
+                       % (a, b, d))
+
+
+def check_plate_mapper(input_f, barseq_f, names_f=None, special_f=None,
+                       barcode_dist=None, report=None):
+    """Validate the inputs of plate_mapper.
+
+    Parameters
+    ----------
+    input_f : iterable of str
+        Lines of input plate map file
+    barseq_f : iterable of str, or BarseqIndex
+        Lines of barcode sequence template file, or its compiled index
+    names_f : iterable of str (optional)
+        Lines of sample name list file
+    special_f : iterable of str (optional)
+        Lines of special sample definition file
+    barcode_dist : int (optional)
+        If given, also check barcodes assigned to samples for duplicates, and
+        for pairs within this Hamming distance
+    report : Report (optional)
+        Report to record problems into (default: a new one)
+
+    Returns
+    -------
+    Report
+        Errors and warnings
+
+    Notes
+    -----
+    Each input is read once. Errors are the problems on which
+    `plate_mapper` stops, and warnings are those it warns about, plus
+    primer plates mapped more than once or not in the template, and wells
+    repeated in the template. Samples are resolved as in `plate_mapper`,
+    from the valid rows of the inputs, but nothing is written.
+
+    Inputs are consumed but not closed.
+    """
+    from plate_mapper.plate_mapper import (_resolve, _check_repeated,
+                                           _check_names)
+    if report is None:
+        report = Report()
+    input_name = _name(input_f, 'plate map')
+    plates, where = _check_plate_map(input_f, report, input_name)
+    specs = {}
+    if special_f:
+        specs = _check_special(special_f, report,
+                               _name(special_f, 'special sample definitions'))
+    barseq_name = _name(barseq_f, 'barcode sequence template')
+    counts = Counter()
+    mapped = set()
+    barcodes = []
+
+    def rows():
+        for row in _check_barseq(barseq_f, report, barseq_name):
+            mapped.add(row[2])
+            yield row
+    for fields, _ in _resolve(rows(), plates, specs, counts):
+        if barcode_dist is not None:
+            barcodes.append((fields[1], '%s.%s' % (fields[3], fields[4])))
+    for plate in sorted(set(plates) - mapped):
+        report.warning('primer plate %s is not in the template' % plate,
+                       input_name)
+    for x in _check_repeated(counts):
+        report.warning('sample %s occurs %d times' % (x, counts[x]),
+                       input_name, *where[x])
+    if names_f:
+        novel, missing = _check_names(counts, names_f)
+        for x in novel:
+            report.warning('sample %s is not in the name list' % x,
+                           input_name, *where[x])
+        names_name = _name(names_f, 'sample name list')
+        for x in missing:
+            report.warning('sample %s of the name list is not in the plate '
+                           'map' % x, names_name)
+    if barcode_dist is not None:
+        _check_barcodes(barcodes, barcode_dist, report)
+    return report
+
+
+def _check_table(table, ncols, exact, report, name):
+    """Read a metadata or primer table, recording problems.
+
+    Parameters
+    ----------
+    table : file object, BarseqIndex or iterable
+        Table, starting with column headers
+    ncols : int
+        Number of columns required
+    exact : bool
+        Whether the header must have exactly, rather than at least, ncols
+        columns
+    report : Report
+        Report to record problems into
+    name : str
+        File name
+
+    Returns
+    -------
+    list of str
+        Column headers
+    iterator of tuple of (int, list of str, tuple)
+        Line number, fields and well sort key of each valid row
+    """
+    from plate_linker.plate_linker import _read_primer, _check_well
+    header, rows = _read_primer(table)
+    if len(header) < ncols or exact and len(header) != ncols:
+        report.error('table has %d columns instead of %s%d'
+                     % (len(header), '' if exact else 'at least ', ncols),
+                     name, 1, 1)
+    i = ncols - 2  # index of primer plate ID
+
+    def check():
+        for n, l in enumerate(rows, 2):
+            if len(l) < ncols:
+                report.error('row has %d columns instead of at least %d'
+                             % (len(l), ncols), name, n, 1)
+                continue
+            try:
+                key = _check_well(l[i], l[i + 1])
+            except ValueError as e:
+                column = i + 2 if l[i].isdecimal() else i + 1
+                report.error(_message(e), name, n, column)
+                continue
+            yield n, l, key
+    return header, check()
+
+
+def check_plate_linker(metadata_fs, primer_f, barcode_dist=None,
+                       report=None):
+    """Validate the inputs of plate_linker.
+
+    Parameters
+    ----------
+    metadata_fs : list of iterable
+        Metadata tables (see `plate_linker`)
+    primer_f : iterable or BarseqIndex
+        Primer table, or compiled barcode sequence template index
+    barcode_dist : int (optional)
+        If given, also check barcodes of matched primers for duplicates, and
+        for pairs within this Hamming distance
+    report : Report (optional)
+        Report to record problems into (default: a new one)
+
+    Returns
+    -------
+    Report
+        Errors and warnings
+
+    Notes
+    -----
+    Each input is read once. Errors are the problems on which
+    `plate_linker` stops: invalid column headers and well identifiers,
+    wells in more than one metadata table, and samples without matched
+    primers. Warnings are wells repeated in a metadata table, of which the
+    last occurrence is used, and in the primer table.
+
+    Inputs are consumed but not closed.
+    """
+    if report is None:
+        report = Report()
+    names = [_name(f, 'metadata table %d' % (i + 1))
+             for i, f in enumerate(metadata_fs)]
+    index = {}  # well sort key : (table index, line, sample ID)
+    for t, f in enumerate(metadata_fs):
+        _, rows = _check_table(f, 3, False, report, names[t])
+        for n, l, key in rows:
+            prev = index.get(key)
+            if prev is None:
+                pass
+            elif prev[0] == t:
+                report.warning('well %s.%s is also on line %d, which this '
+                               'row replaces' % (key[3], key[4], prev[1]),
+                               names[t], n, 2)
+            else:
+                report.error('well %s.%s is also in %s on line %d'
+                             % (key[3], key[4], names[prev[0]], prev[1]),
+                             names[t], n, 2)
+            index[key] = (t, n, l[0])
+    primer_name = _name(primer_f, 'primer table')
+    _, rows = _check_table(primer_f, 5, True, report, primer_name)
+    used = {}  # well sort key : line
+    barcodes = []
+    for n, l, key in rows:
+        if key in used:
+            report.warning('well %s.%s is also on line %d'
+                           % (key[3], key[4], used[key]), primer_name, n, 4)
+            continue
+        used[key] = n
+        if barcode_dist is not None and key in index:
+            barcodes.append((l[1], '%s.%s' % (l[3], l[4])))
+    for key, (t, n, sample) in sorted(index.items(), key=lambda x: x[1]):
+        if key not in used:
+            report.error('sample %s does not have a matched primer' % sample,
+                         names[t], n, 2)
+    if barcode_dist is not None:
+        _check_barcodes(barcodes, barcode_dist, report)
+    return report
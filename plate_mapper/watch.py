@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import os
+import time
+import argparse
+from plate_mapper.batch import _output_fp
+from plate_mapper.fileio import open_file
+from plate_mapper.service import ConversionService, describe_error
+
+
+def _kind(fp):
+    """Tell a plate map from a metadata table by its first line.
+
+    Parameters
+    ----------
+    fp : str
+        File path
+
+    Returns
+    -------
+    str
+        "map" if the first non-empty line is a plate head, whose second
+        column is "1", otherwise "metadata"
+    """
+    with open_file(fp) as f:
+        for line in f:
+            l = line.rstrip().split('\t')
+            if l != ['']:
+                return 'map' if len(l) > 1 and l[1] == '1' else 'metadata'
+    return 'metadata'
+
+
+class Watcher(object):
+    """Convert plate maps and link metadata tables as they change.
+
+    Parameters
+    ----------
+    watch_dir : str
+        Directory to watch
+    output_dir : str
+        Directory to write mapping files to, other than watch_dir
+    barseq_fp : str (optional)
+        Barcode sequence template file, needed to convert plate maps
+    primer_fp : str (optional)
+        Primer file, needed to link metadata tables
+    special_fp : str (optional)
+        Special sample definition file
+    names_fp : str (optional)
+        Sample name list file
+    empty : bool (optional)
+        Whether to keep empty lines in mapping files (default: false)
+    engine : str (optional)
+        Join engine of plate_linker (default: auto)
+    debounce : float (optional)
+        Seconds a file must stay unchanged before it is converted
+        (default: 2)
+    service : ConversionService (optional)
+        Service to convert files, which keeps parsed templates, definitions
+        and primers in memory (default: a new one)
+
+    Raises
+    ------
+    ValueError
+        If the output directory is the watched directory.
+
+    Notes
+    -----
+    Each poll lists the watched directory, skipping hidden files. A file is
+    converted once its size and modification time have not changed for the
+    debounce period, so that a burst of saves leads to one conversion, and
+    only if its content digest differs from that of its last conversion.
+    Plate maps are told from metadata tables by their first line. Each file
+    has its own output, named as in batch mode, which is written atomically.
+
+    When the template, primer, special sample definition or name list file
+    changes, all files are converted again. Files whose outputs are newer
+    than them and than these files when watching starts are not converted.
+
+    A file that fails to convert, or to be read, is reported with an error
+    response, and converted again once it changes; it does not stop the
+    other files or later polls.
+
+    Files whose outputs would be the same, such as p1.txt and p1.tsv, are
+    not converted but reported with an error response, except for the one
+    watched first (or first by name when watching starts), which keeps the
+    output. Once that file is removed, the next one is converted.
+    """
+
+    def __init__(self, watch_dir, output_dir, barseq_fp=None, primer_fp=None,
+                 special_fp=None, names_fp=None, empty=False, engine='auto',
+                 debounce=2.0, service=None):
+        if os.path.abspath(watch_dir) == os.path.abspath(output_dir):
+            raise ValueError('Error: output directory must be different from '
+                             'watched directory.')
+        self.watch_dir = watch_dir
+        self.output_dir = output_dir
+        self.barseq_fp = barseq_fp
+        self.primer_fp = primer_fp
+        self.special_fp = special_fp
+        self.names_fp = names_fp
+        self.empty = empty
+        self.engine = engine
+        self.debounce = debounce
+        self.service = service or ConversionService()
+        self.done = {}  # file path : (stat, digest) of last conversion
+        self.pending = {}  # file path : (stat, time it was first seen)
+        self.owners = {}  # output file path : file path it is written from
+        self.collided = {}  # file path : file path owning its output
+        self.shared = self._shared()
+
+    def _shared(self):
+        """Get digests of files shared by all conversions."""
+        return tuple(self.service._digest(x) if x else None for x in (
+            self.barseq_fp, self.primer_fp, self.special_fp, self.names_fp))
+
+    def _request(self, fp, kind):
+        """Build a conversion request of a file."""
+        output = _output_fp(fp, self.output_dir)
+        if kind == 'map':
+            if not self.barseq_fp:
+                return None
+            return {'tool': 'plate_mapper', 'input': fp, 'output': output,
+                    'barseq': self.barseq_fp, 'special': self.special_fp,
+                    'names': self.names_fp, 'empty': self.empty}
+        if not self.primer_fp:
+            return None
+        return {'tool': 'plate_linker', 'metadata': fp, 'output': output,
+                'primer': self.primer_fp, 'engine': self.engine}
+
+    def _is_current(self, fp, st):
+        """Check if the output of a file is newer than all its inputs."""
+        try:
+            mtime = os.stat(_output_fp(fp, self.output_dir)).st_mtime_ns
+        except OSError:
+            return False
+        shared = [os.stat(x).st_mtime_ns for x in (
+            self.barseq_fp, self.primer_fp, self.special_fp, self.names_fp)
+            if x]
+        return all(mtime >= x for x in shared + [st[0]])
+
+    def poll(self, now=None):
+        """Check the watched directory once, and convert files that are due.
+
+        Parameters
+        ----------
+        now : float (optional)
+            Current time in seconds (default: time.time())
+
+        Returns
+        -------
+        list of tuple of (str, dict)
+            Path and response (see `ConversionService.handle`) of each file
+            converted
+        """
+        if now is None:
+            now = time.time()
+        shared = self._shared()
+        if shared != self.shared:
+            self.shared = shared
+            self.pending.update((x, (None, now)) for x in self.done)
+            self.done = {}
+        res = []
+        fps = [os.path.join(self.watch_dir, x) for x in
+               sorted(os.listdir(self.watch_dir)) if not x.startswith('.')]
+        fps = [x for x in fps if os.path.isfile(x)]
+        seen = set(fps)
+        for output, fp in list(self.owners.items()):
+            if fp not in seen:
+                del self.owners[output]
+        for fp in fps:
+            self.owners.setdefault(_output_fp(fp, self.output_dir), fp)
+        for fp in fps:
+            output = _output_fp(fp, self.output_dir)
+            owner = self.owners[output]
+            if owner != fp:
+                if self.collided.get(fp) != owner:
+                    self.collided[fp] = owner
+                    self.done.pop(fp, None)
+                    self.pending.pop(fp, None)
+                    res.append((fp, {'ok': False, 'error': (
+                        'Error: output file %s is also that of %s.'
+                        % (output, owner))}))
+                continue
+            try:
+                st = os.stat(fp)
+                st = (st.st_mtime_ns, st.st_size)
+                if fp in self.done and self.done[fp][0] == st:
+                    continue
+                if fp in self.collided:  # output is that of another file
+                    del self.collided[fp]
+                elif fp not in self.done and fp not in self.pending and \
+                        self._is_current(fp, st):
+                    self.done[fp] = (st, self.service._digest(fp))
+                    continue
+            except OSError:  # removed since listed
+                continue
+            prev = self.pending.get(fp)
+            if prev is None or prev[0] != st:  # changed since last poll
+                prev = self.pending[fp] = (st, now)
+            if now - prev[1] < self.debounce:
+                continue
+            del self.pending[fp]
+            try:
+                digest = self.service._digest(fp)
+                if fp in self.done and self.done[fp][1] == digest:
+                    self.done[fp] = (st, digest)  # touched but not changed
+                    continue
+                request = self._request(fp, _kind(fp))
+                if request is None:
+                    response = {'ok': False, 'error': 'Error: no barcode '
+                                'sequence template or primer file given.'}
+                else:
+                    response = self.service.handle(request)
+            except Exception as e:
+                digest = None
+                response = {'ok': False, 'error': describe_error(e)}
+            res.append((fp, response))
+            self.done[fp] = (st, digest)
+        for fp in set(self.done) - seen:
+            del self.done[fp]
+        for fp in set(self.pending) - seen:
+            del self.pending[fp]
+        for fp in set(self.collided) - seen:
+            del self.collided[fp]
+        return res
+
+    def run(self, interval=1.0):
+        """Poll the watched directory until interrupted.
+
+        Parameters
+        ----------
+        interval : float (optional)
+            Seconds between polls (default: 1)
+        """
+        while True:
+            try:
+                responses = self.poll()
+            except OSError as e:  # such as the watched directory is gone
+                print(e)
+                responses = []
+            for fp, response in responses:
+                if response['ok']:
+                    print('Converted %s.' % fp)
+                    for warning in response['warnings']:
+                        print('  %s: Warning:\n%s' % (fp, warning.rstrip()))
+                else:
+                    print('  %s: %s' % (fp, response['error']))
+            time.sleep(interval)
+
+
+def main(argv=None, prog=None):
+    """Run the watch mode from the command line.
+
+    Parameters
+    ----------
+    argv : list of str (optional)
+        Command-line arguments (default: those of the process)
+    prog : str (optional)
+        Program name shown in usage (default: that of the script)
+    """
+    # Welcome information
+    print('Plate Watcher: Convert plate maps and metadata tables as they '
+          'change.')
+    # Parse arguments
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('-i', '--input', help='directory to watch',
+                        required=True)
+    parser.add_argument('-d', '--outdir',
+                        help='output directory of mapping files',
+                        required=True)
+    parser.add_argument('-t', '--barseq',
+                        help='barcode sequence template file, to convert '
+                             'plate maps',
+                        required=False, default=None)
+    parser.add_argument('-p', '--primer',
+                        help='primer file, to link metadata tables',
+                        required=False, default=None)
+    parser.add_argument('-s', '--special',
+                        help='(optional) special sample definition file',
+                        required=False, default=None)
+    parser.add_argument('-n', '--names',
+                        help='(optional) sample name list file',
+                        required=False, default=None)
+    parser.add_argument('-e', '--empty', action='store_true',
+                        help='keep empty lines in mapping files')
+    parser.add_argument('-j', '--engine', choices=['auto', 'hash', 'merge'],
+                        help='(optional) join engine (default: auto)',
+                        required=False, default='auto')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='seconds between polls (default: 1)')
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        help='seconds a file must stay unchanged before it '
+                             'is converted (default: 2)')
+    args = parser.parse_args(argv)
+    if not args.barseq and not args.primer:
+        parser.error('a barcode sequence template or primer file is '
+                     'required')
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+    watcher = Watcher(args.input, args.outdir, args.barseq, args.primer,
+                      args.special, args.names, args.empty, args.engine,
+                      args.debounce)
+    print('Watching %s...' % args.input)
+    try:
+        watcher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
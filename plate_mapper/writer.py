@@ -0,0 +1,410 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+
+import os
+import re
+from collections import OrderedDict
+from itertools import islice
+from plate_mapper.fileio import AtomicFile, open_file, _mkstemp
+
+
+# shard of rows without a key
+_UNKEYED = 'unassigned'
+
+
+def render_suffix(metadata):
+    """Render metadata as the tail of a tab-delimited output line.
+
+    Parameters
+    ----------
+    metadata : sequence of str
+        Metadata
+
+    Returns
+    -------
+    str
+        Tab, metadata separated by tabs, and newline
+    """
+    return '\t%s\n' % '\t'.join(metadata)
+
+
+class BatchWriter(object):
+    """Buffer lines and write them to a file in chunks.
+
+    Parameters
+    ----------
+    f : file object
+        Output file
+    size : int (optional)
+        Number of lines per chunk (default: 4096)
+
+    Attributes
+    ----------
+    lines : int
+        Number of lines written so far
+
+    Notes
+    -----
+    Each chunk of lines is concatenated and handed to the file in a single
+    call, which avoids the per-call overhead of the text I/O layer. Remaining
+    lines are written by `flush` or `close`.
+    """
+
+    def __init__(self, f, size=4096):
+        self.f = f
+        self.size = size
+        self.buf = []
+        self.lines = 0
+
+    def write(self, line):
+        """Add a line to the buffer.
+
+        Parameters
+        ----------
+        line : str
+            Line to write, including newline
+        """
+        self.buf.append(line)
+        self.lines += 1
+        if len(self.buf) >= self.size:
+            self.f.write(''.join(self.buf))
+            self.buf = []
+
+    def writelines(self, lines):
+        """Write lines in chunks.
+
+        Parameters
+        ----------
+        lines : iterable of str
+            Lines to write, including newlines
+
+        Notes
+        -----
+        Lines are pulled from the iterable one chunk at a time, so that a
+        generator of lines is consumed without a method call per line.
+        """
+        if self.buf:
+            self.f.write(''.join(self.buf))
+            self.buf = []
+        it = iter(lines)
+        while True:
+            chunk = list(islice(it, self.size))
+            if not chunk:
+                break
+            self.lines += len(chunk)
+            self.f.write(''.join(chunk))
+
+    def flush(self):
+        """Write buffered lines to the file."""
+        if self.buf:
+            self.f.write(''.join(self.buf))
+            self.buf = []
+        self.f.flush()
+
+    def close(self):
+        """Write buffered lines and close the file."""
+        self.flush()
+        self.f.close()
+
+
+def shard_key(shard_by, header=None, plate_ids=None):
+    """Make a function that finds the shard of a mapping row.
+
+    Parameters
+    ----------
+    shard_by : str or int
+        "primer_plate" (primer plate ID), "plate_id" (plate ID of the plate
+        map), a column header of the output, or a column number (1-based)
+    header : list of str (optional)
+        Column headers of the output
+    plate_ids : dict of str (optional)
+        Primer plate ID : plate ID of the plate map; it may be filled while
+        rows are generated, as it is only read when they are
+
+    Returns
+    -------
+    callable
+        Function of the fields and rendered metadata of a row, which returns
+        its shard key
+
+    Raises
+    ------
+    ValueError
+        If the output has no such column, or plate IDs are not known.
+    """
+    if shard_by == 'primer_plate':
+        return lambda fields, suffix: fields[3]
+    if shard_by == 'plate_id':
+        if plate_ids is None:
+            raise ValueError('Error: Plate IDs are only known when '
+                             'converting plate maps.')
+        return lambda fields, suffix: plate_ids.get(fields[3], '')
+    if header and shard_by in header:
+        i = header.index(shard_by)
+    elif isinstance(shard_by, int) or shard_by.isdigit():
+        i = int(shard_by) - 1
+    else:
+        i = -1
+    if i < 0:
+        raise ValueError('Error: Output has no column %s.' % shard_by)
+    if i < 5:
+        return lambda fields, suffix: fields[i]
+    i -= 5
+
+    def key(fields, suffix):
+        l = suffix[1:].rstrip('\r\n').split('\t')
+        return l[i] if i < len(l) else ''
+    return key
+
+
+class _Shard(object):
+    """Output file of a shard key; see `ShardWriter`.
+
+    Attributes
+    ----------
+    key : str
+        Shard key
+    name : str
+        File path
+    rows : int
+        Number of lines written, besides the header
+    digest : str or None
+        SHA-256 hex digest of the content, once closed
+    changed : bool
+        Always true, as shards are always replaced
+    """
+
+    def __init__(self, key, name):
+        import hashlib
+        self.key = key
+        self.name = name
+        self.rows = 0
+        self.digest = None
+        self.changed = True
+        self.buf = []
+        self.f = None
+        self.tmp_fp = None
+        self._hash = hashlib.sha256()
+
+    def write(self, s):
+        self._hash.update(s.encode(self.f.encoding))
+        self.f.write(s)
+
+
+class ShardWriter(object):
+    """Write lines to one file per key, in a single pass.
+
+    Parameters
+    ----------
+    out_dir : str
+        Output directory, created if missing
+    suffix : str (optional)
+        File name extension of shards, which are compressed by it as in
+        `open_file` (default: ".txt")
+    header : str (optional)
+        Line written at the top of each shard, including newline; it may be
+        set until lines are written
+    max_open : int (optional)
+        Maximum number of shards open at a time (default: 64)
+    size : int (optional)
+        Number of lines buffered across shards before they are written
+        (default: 65536)
+
+    Attributes
+    ----------
+    name : str
+        Index file path: "index.tsv" in the output directory
+    shards : dict of _Shard
+        Shard key : shard, in order of first line
+
+    Raises
+    ------
+    ValueError
+        If `max_open` is less than 1.
+
+    Notes
+    -----
+    Lines are buffered per shard, and once `size` lines are buffered in
+    all, the buffer of each shard is written in one call. Shards are kept
+    open in least recently used order: when more than `max_open` would be,
+    the least recently used one is closed, and it is reopened for appending
+    when next written. Open shards are written first, so that they are not
+    closed in turn. Thus any number of shards is written with bounded file
+    handles and memory.
+
+    As with `AtomicFile`, shards are written to hidden temporary files in
+    the output directory, and `close` moves them into place and writes the
+    index, a table of the key, file name and number of rows (besides the
+    header) of each shard; `discard` removes them instead. Shards of
+    earlier runs that no key of this run maps to are left as they are, and
+    are not in the index.
+
+    Hence no shard is available before `close`, even one whose last line
+    has been written: rows come in input order rather than grouped by key,
+    so a shard is only known to be complete at the end, and a run that
+    fails at the end (such as when samples lack primers) leaves none of its
+    shards behind. Shards are also written one after another from the
+    calling thread, not by concurrent writers: lines come from one stream
+    and are written in batches, so the run is bound by producing the lines,
+    not by writing them.
+
+    A shard is named after its key, with characters other than letters,
+    digits, ".", "-" and "_" replaced with "_", and a number appended if the
+    name is taken; rows without a key go to shard "unassigned".
+    """
+
+    def __init__(self, out_dir, suffix='.txt', header=None, max_open=64,
+                 size=65536):
+        if max_open < 1:
+            raise ValueError('Error: At least one shard must be open at a '
+                             'time.')
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        self.out_dir = out_dir
+        self.name = os.path.join(out_dir, 'index.tsv')
+        self.suffix = suffix
+        self.header = header
+        self.max_open = max_open
+        self.size = size
+        self.shards = {}
+        self._names = set()
+        self._open = OrderedDict()  # open shards, least recently used first
+        self._nbuf = 0
+        self._done = False
+
+    @property
+    def closed(self):
+        return self._done
+
+    def _add(self, key):
+        """Add a shard of a key."""
+        base = re.sub(r'[^A-Za-z0-9._-]', '_', key) or _UNKEYED
+        if base.startswith('.'):
+            base = '_' + base[1:]
+        name, n = base, 1
+        while name in self._names:
+            n += 1
+            name = '%s.%d' % (base, n)
+        self._names.add(name)
+        shard = _Shard(key, os.path.join(self.out_dir, name + self.suffix))
+        self.shards[key] = shard
+        return shard
+
+    def write(self, key, line):
+        """Add a line to the buffer of a shard.
+
+        Parameters
+        ----------
+        key : str
+            Shard key
+        line : str
+            Line to write, including newline
+        """
+        shard = self.shards.get(key)
+        if shard is None:
+            shard = self._add(key)
+        shard.buf.append(line)
+        self._nbuf += 1
+        if self._nbuf >= self.size:
+            self._write()
+
+    def writelines(self, rows):
+        """Write lines to shards.
+
+        Parameters
+        ----------
+        rows : iterable of tuple of (str, str)
+            Shard key and line to write, including newline
+        """
+        shards = self.shards
+        size = self.size
+        n = self._nbuf
+        for key, line in rows:
+            shard = shards.get(key)
+            if shard is None:
+                shard = self._add(key)
+            shard.buf.append(line)
+            n += 1
+            if n >= size:
+                self._write()
+                n = 0
+        self._nbuf = n
+
+    def _write(self):
+        """Write the buffers of all shards."""
+        pending = [x for x in self.shards.values() if x.buf]
+        pending.sort(key=lambda x: x.f is None)
+        for shard in pending:
+            if shard.f is None:
+                if len(self._open) >= self.max_open:
+                    _, lru = self._open.popitem(last=False)
+                    lru.f.close()
+                    lru.f = None
+                if shard.tmp_fp is None:
+                    shard.tmp_fp = _mkstemp(shard.name)
+                    shard.f = open_file(shard.tmp_fp, 'w')
+                    if self.header:
+                        shard.write(self.header)
+                else:
+                    shard.f = open_file(shard.tmp_fp, 'a')
+                self._open[shard.key] = shard
+            else:
+                self._open.move_to_end(shard.key)
+            shard.write(''.join(shard.buf))
+            shard.rows += len(shard.buf)
+            shard.buf = []
+        self._nbuf = 0
+
+    def flush(self):
+        """Write buffered lines to the shards."""
+        self._write()
+        for shard in self._open.values():
+            shard.f.flush()
+
+    def close(self):
+        """Write buffered lines, move shards into place, and write the
+        index."""
+        if self._done:
+            return
+        self._write()
+        self._done = True
+        for shard in self.shards.values():
+            if shard.f is not None:
+                shard.f.close()
+                shard.f = None
+            os.replace(shard.tmp_fp, shard.name)
+            shard.digest = shard._hash.hexdigest()
+        self._open.clear()
+        with AtomicFile(self.name) as f:
+            f.write('shard\tfile\trows\n')
+            f.writelines('%s\t%s\t%d\n' % (x.key, os.path.basename(x.name),
+                                           x.rows)
+                         for x in self.shards.values())
+
+    def discard(self):
+        """Stop writing, and remove the temporary files of shards."""
+        if self._done:
+            return
+        self._done = True
+        for shard in self.shards.values():
+            if shard.f is not None:
+                shard.f.close()
+                shard.f = None
+            if shard.tmp_fp is not None:
+                os.remove(shard.tmp_fp)
+        self._open.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
@@ -0,0 +1,494 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, The Wetlab Assistant Development Team.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+"""Streaming reader of Excel workbooks (.xlsx), using the standard library.
+
+A workbook is read as a text file of tab-delimited lines, one per row of a
+sheet, so that the tools read it as they read exported text. `open_file`
+opens files with an .xlsx or .xlsm extension with this module.
+"""
+
+import re
+import posixpath
+import zipfile
+from datetime import datetime, timedelta
+from xml.etree.ElementTree import XML, iterparse, ParseError
+
+
+_REL_NS = ('http://schemas.openxmlformats.org/officeDocument/2006/'
+           'relationships')
+
+# built-in number formats of dates and times, as Excel displays them in the
+# en-US locale
+_DATE_FORMATS = {14: 'm/d/yyyy', 15: 'd-mmm-yy', 16: 'd-mmm', 17: 'mmm-yy',
+                 18: 'h:mm AM/PM', 19: 'h:mm:ss AM/PM', 20: 'h:mm',
+                 21: 'h:mm:ss', 22: 'm/d/yyyy h:mm'}
+
+# tokens of number formats of dates and times
+_TOKENS = re.compile(r'"[^"]*"|\\.|\[[^\]]*\]|AM/PM|A/P|yyyy|yy|mmmmm|mmmm|'
+                     r'mmm|mm|m|dddd|ddd|dd|d|hh|h|ss|s|\.0+|.',
+                     re.IGNORECASE)
+
+# number of bytes of a sheet decompressed at a time
+_CHUNK_SIZE = 1 << 20
+
+# start of the rows of a sheet, and namespace declarations before them
+_SHEET_DATA = re.compile(br'<((?:[\w.-]+:)?)sheetData\b[^>]*?(/?)>')
+_XMLNS = re.compile(br'xmlns(?::[\w.-]+)?="[^"]*"')
+
+# column index by column letters, filled as columns are read
+_columns = {}
+
+# characters escaped in text, such as "_x000D_"
+_ESCAPE = re.compile(r'_x([0-9A-Fa-f]{4})_')
+
+
+def _local(tag):
+    """Strip the namespace of an XML tag."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _column(ref):
+    """Convert a cell reference such as "AB12" into a column index (0-based).
+    """
+    i = 0
+    for c in ref:
+        if c.isdigit():
+            break
+        i = i * 26 + ord(c.upper()) - 64
+    return i - 1
+
+
+def _text(elem):
+    """Get the text of a string item, which is plain or rich text, leaving
+    out phonetic guides."""
+    parts = [x.text or '' for x in elem if _local(x.tag) == 't']
+    parts.extend(x.text or '' for r in elem if _local(r.tag) == 'r'
+                 for x in r if _local(x.tag) == 't')
+    return _unescape(''.join(parts))
+
+
+def _unescape(text):
+    """Decode characters escaped in text, and replace tabs and line breaks,
+    which would split cells and rows, with spaces."""
+    if '_x' in text:
+        text = _ESCAPE.sub(lambda m: chr(int(m.group(1), 16)), text)
+    if '\t' in text or '\n' in text or '\r' in text:
+        text = text.replace('\r\n', ' ').replace('\t', ' ').replace(
+            '\r', ' ').replace('\n', ' ')
+    return text
+
+
+def _is_date_format(code):
+    """Tell whether a number format code displays a date or time."""
+    for token in _TOKENS.findall(code.split(';', 1)[0]):
+        if token[0] in '"\\[':
+            if token.startswith('[') and token[1:2].lower() in 'hms' and \
+                    token[1:-1].strip('hmsHMS') == '':
+                return True  # elapsed time
+            continue
+        if token[0].lower() in 'ydhs' or token[0].lower() == 'm':
+            return True
+    return False
+
+
+def format_date(value, code, date1904=False):
+    """Render a serial date number as Excel displays it.
+
+    Parameters
+    ----------
+    value : float
+        Serial date: days since the epoch of the workbook
+    code : str
+        Number format code, such as "m/d/yy"
+    date1904 : bool (optional)
+        Whether the workbook counts days from 1904 instead of 1900
+
+    Returns
+    -------
+    str
+        Date and time rendered by the first section of the format code
+
+    Notes
+    -----
+    Years, months, days, hours, minutes, seconds and AM/PM markers are
+    rendered, as are literal text and fractions of seconds. Colors, locales
+    and elapsed times are ignored.
+    """
+    epoch = datetime(1904, 1, 1) if date1904 else datetime(1899, 12, 30)
+    # round to milliseconds, as serial dates are not exact
+    dt = epoch + timedelta(milliseconds=round(value * 86400000))
+    tokens = _TOKENS.findall(code.split(';', 1)[0])
+    ampm = any(x.upper() in ('AM/PM', 'A/P') for x in tokens)
+    # "m" is minutes after hours or before seconds, otherwise months
+    kinds = [x[0].lower() if x[0] not in '"\\[' else '' for x in tokens]
+    minutes = set()
+    for i, kind in enumerate(kinds):
+        if kind != 'm':
+            continue
+        before = [x for x in kinds[:i] if x in 'ydhms' and x]
+        after = [x for x in kinds[i + 1:] if x in 'ydhms' and x]
+        if before and before[-1] == 'h' or after and after[0] == 's':
+            minutes.add(i)
+    out = []
+    for i, token in enumerate(tokens):
+        low = token.lower()
+        if token[0] == '"':
+            out.append(token[1:-1])
+        elif token[0] == '\\':
+            out.append(token[1:])
+        elif token[0] == '[':
+            continue
+        elif low == 'yyyy':
+            out.append('%04d' % dt.year)
+        elif low == 'yy':
+            out.append('%02d' % (dt.year % 100))
+        elif low[0] == 'm' and i in minutes:
+            out.append('%02d' % dt.minute if len(low) > 1 else
+                       str(dt.minute))
+        elif low == 'mmmmm':
+            out.append(dt.strftime('%B')[0])
+        elif low == 'mmmm':
+            out.append(dt.strftime('%B'))
+        elif low == 'mmm':
+            out.append(dt.strftime('%b'))
+        elif low == 'mm':
+            out.append('%02d' % dt.month)
+        elif low == 'm':
+            out.append(str(dt.month))
+        elif low == 'dddd':
+            out.append(dt.strftime('%A'))
+        elif low == 'ddd':
+            out.append(dt.strftime('%a'))
+        elif low == 'dd':
+            out.append('%02d' % dt.day)
+        elif low == 'd':
+            out.append(str(dt.day))
+        elif low in ('hh', 'h'):
+            hour = dt.hour % 12 or 12 if ampm else dt.hour
+            out.append('%02d' % hour if low == 'hh' else str(hour))
+        elif low in ('ss', 's'):
+            out.append('%02d' % dt.second if low == 'ss' else str(dt.second))
+        elif low.startswith('.0'):
+            frac = dt.microsecond / 1e6
+            out.append(('%.*f' % (len(low) - 1, frac))[1:])
+        elif low == 'am/pm':
+            out.append('AM' if dt.hour < 12 else 'PM')
+        elif low == 'a/p':
+            out.append('A' if dt.hour < 12 else 'P')
+        else:
+            out.append(token)
+    return ''.join(out)
+
+
+class XlsxFile(object):
+    """Excel workbook read as a text file of tab-delimited lines.
+
+    Parameters
+    ----------
+    fp : str
+        Workbook file path
+    encoding : str (optional)
+        Ignored, as workbooks are always encoded in UTF-8
+
+    Attributes
+    ----------
+    name : str
+        File path
+    sheet_names : list of str
+        Names of all sheets, in workbook order
+
+    Raises
+    ------
+    ValueError
+        If the file is not a workbook.
+
+    Notes
+    -----
+    Only the first sheet is read, unless others are chosen with `select`.
+    The compressed sheet is read in chunks of rows, each of which is parsed
+    at once and discarded once read, so that memory does not grow with the
+    size of the sheet; only the table of shared strings, which cells refer
+    to, is kept in memory. Each iteration over the file
+    reads the sheets again from the start.
+
+    Cell text is kept as stored rather than as displayed: numbers keep all
+    their digits instead of being rounded or written in scientific notation,
+    formulas give their last computed values, and booleans are TRUE or FALSE.
+    Only dates and times, which are stored as numbers, are rendered by their
+    number formats. Tabs and line breaks within cells are replaced with
+    spaces. Rows that are missing from a sheet are read as empty lines, so
+    that line numbers are row numbers.
+    """
+
+    def __init__(self, fp, encoding=None):
+        self.name = fp
+        try:
+            self._zip = zipfile.ZipFile(fp)
+        except zipfile.BadZipFile:
+            raise ValueError('Error: %s is not an .xlsx workbook.' % fp)
+        try:
+            self._sheets = self._read_workbook()
+            self._strings = self._read_strings()
+            self._dates = self._read_styles()
+        except (KeyError, ParseError):
+            self._zip.close()
+            raise ValueError('Error: %s is not an .xlsx workbook.' % fp)
+        self.sheet_names = [x for x, _ in self._sheets]
+        self._selected = self._sheets[:1]
+        self._header = False
+
+    def _read_workbook(self):
+        """Read names and member paths of sheets, and the date system."""
+        rels = {}
+        with self._zip.open('xl/_rels/workbook.xml.rels') as f:
+            for _, elem in iterparse(f):
+                if _local(elem.tag) == 'Relationship':
+                    target = elem.get('Target')
+                    if target.startswith('/'):
+                        target = target[1:]
+                    else:
+                        target = posixpath.normpath(
+                            posixpath.join('xl', target))
+                    rels[elem.get('Id')] = target
+        sheets = []
+        self._date1904 = False
+        with self._zip.open('xl/workbook.xml') as f:
+            for _, elem in iterparse(f):
+                tag = _local(elem.tag)
+                if tag == 'sheet':
+                    sheets.append((elem.get('name'),
+                                   rels[elem.get('{%s}id' % _REL_NS)]))
+                elif tag == 'workbookPr':
+                    self._date1904 = elem.get('date1904') in ('1', 'true')
+        return sheets
+
+    def _read_strings(self):
+        """Read the table of shared strings."""
+        strings = []
+        try:
+            f = self._zip.open('xl/sharedStrings.xml')
+        except KeyError:
+            return strings
+        with f:
+            sst = None
+            for event, elem in iterparse(f, ('start', 'end')):
+                if sst is None:
+                    sst = elem
+                elif event == 'end' and _local(elem.tag) == 'si':
+                    strings.append(_text(elem))
+                    sst.remove(elem)
+        return strings
+
+    def _read_styles(self):
+        """Find cell styles of dates, and their number format codes."""
+        try:
+            f = self._zip.open('xl/styles.xml')
+        except KeyError:
+            return {}
+        codes = dict(_DATE_FORMATS)
+        dates = {}
+        with f:
+            xfs = False
+            n = 0
+            for event, elem in iterparse(f, ('start', 'end')):
+                tag = _local(elem.tag)
+                if tag == 'cellXfs':
+                    xfs = event == 'start'
+                elif event == 'start':
+                    continue
+                elif tag == 'numFmt':
+                    code = elem.get('formatCode', '')
+                    if _is_date_format(code):
+                        codes[int(elem.get('numFmtId'))] = code
+                elif tag == 'xf' and xfs:
+                    code = codes.get(int(elem.get('numFmtId', 0)))
+                    if code is not None:
+                        dates[n] = code
+                    n += 1
+        return dates
+
+    def select(self, names=None, header=False):
+        """Choose sheets to read.
+
+        Parameters
+        ----------
+        names : list of str (optional)
+            Sheet names, in the order to read them (default: all sheets)
+        header : bool (optional)
+            Whether each sheet starts with a header line, in which case only
+            that of the first sheet is read, as the header of all sheets;
+            otherwise, sheets are separated by an empty line (default: false)
+
+        Raises
+        ------
+        ValueError
+            If a sheet does not exist.
+        """
+        sheets = dict(self._sheets)
+        if names is None:
+            self._selected = list(self._sheets)
+        else:
+            for name in names:
+                if name not in sheets:
+                    raise ValueError('Error: %s has no sheet named %s; its '
+                                     'sheets are: %s.' % (
+                                         self.name, name,
+                                         ', '.join(self.sheet_names)))
+            self._selected = [(x, sheets[x]) for x in names]
+        self._header = header
+
+    def _rows(self, name, path):
+        """Read the rows of a sheet as lines.
+
+        Notes
+        -----
+        The sheet is decompressed in chunks, which are cut after the end tag
+        of their last row, so that each chunk of rows is parsed at once.
+        """
+        with self._zip.open(path) as f:
+            buf = b''
+            end = None  # end tag of rows
+            ns = None  # namespace of tags
+            n = 0  # number of the last row read
+            while True:
+                block = f.read(_CHUNK_SIZE)
+                buf += block
+                if end is None:
+                    # skip to the rows, keeping namespace declarations
+                    m = _SHEET_DATA.search(buf)
+                    if m is None:
+                        if block:
+                            continue
+                        return
+                    if m.group(2):  # no rows
+                        return
+                    head = b'<rows %s>' % b' '.join(
+                        _XMLNS.findall(buf[:m.start()]))
+                    end = b'</%srow>' % m.group(1)
+                    last = b'</%ssheetData>' % m.group(1)
+                    buf = buf[m.end():]
+                if block:
+                    cut = buf.rfind(end)
+                    if cut == -1:
+                        continue
+                    cut += len(end)
+                else:
+                    cut = buf.find(last)
+                    if cut == -1:
+                        cut = len(buf)
+                chunk, buf = buf[:cut], buf[cut:]
+                try:
+                    rows = XML(b'%s%s</rows>' % (head, chunk))
+                except ParseError as e:
+                    raise ValueError('Error: sheet %s of %s is invalid: %s.'
+                                     % (name, self.name, e))
+                for row in rows:
+                    if ns is None:
+                        ns = row.tag[:row.tag.rfind('}') + 1]
+                    r = int(row.get('r', n + 1))
+                    while n < r - 1:
+                        yield '\n'
+                        n += 1
+                    n = r
+                    yield '%s\n' % '\t'.join(self._cells(row, ns))
+                if not block:
+                    return
+
+    def _cells(self, row, ns):
+        """Get the text of the cells of a row, up to the last non-empty one.
+        """
+        cells = []
+        v_tag = ns + 'v'
+        for c in row:
+            ref = c.get('r')
+            if ref is not None:
+                i = _columns.get(ref.rstrip('0123456789'))
+                if i is None:
+                    i = _columns[ref.rstrip('0123456789')] = _column(ref)
+                if i > len(cells):
+                    cells.extend([''] * (i - len(cells)))
+            kind = c.get('t')
+            value = c.findtext(v_tag)
+            if kind is None or kind == 'n':
+                if value:
+                    code = self._dates.get(int(c.get('s', 0)))
+                    if code is not None:
+                        value = format_date(float(value), code,
+                                            self._date1904)
+            elif kind == 's':
+                value = self._strings[int(value)]
+            elif kind == 'inlineStr':
+                value = c.find(ns + 'is')
+                value = '' if value is None else _text(value)
+            elif kind == 'b':
+                value = 'TRUE' if value == '1' else 'FALSE'
+            elif value:
+                value = _unescape(value)
+            cells.append(value or '')
+        while cells and not cells[-1]:
+            cells.pop()
+        return cells
+
+    def __iter__(self):
+        for i, (name, path) in enumerate(self._selected):
+            rows = self._rows(name, path)
+            if i:
+                if self._header:
+                    for line in rows:  # skip to the end of the header
+                        if line != '\n':
+                            break
+                else:
+                    yield '\n'
+            yield from rows
+
+    def read(self):
+        """Read the chosen sheets."""
+        return ''.join(self)
+
+    @property
+    def closed(self):
+        return self._zip.fp is None
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def select_sheets(files, names=None, all_sheets=False, header=False):
+    """Choose sheets of workbooks given on the command line.
+
+    Parameters
+    ----------
+    files : list of file object
+        Input files, of which workbooks are `XlsxFile`
+    names : list of str (optional)
+        Sheet names (default: the first sheet)
+    all_sheets : bool (optional)
+        Whether to read all sheets (default: false)
+    header : bool (optional)
+        Whether sheets start with a header line (see `XlsxFile.select`)
+
+    Raises
+    ------
+    ValueError
+        If sheets are chosen but a file is not a workbook, or a sheet does
+        not exist.
+    """
+    if not names and not all_sheets:
+        return
+    for f in files:
+        if not isinstance(f, XlsxFile):
+            raise ValueError('Error: %s is not an .xlsx workbook, of which '
+                             'sheets can be chosen.' % getattr(f, 'name', f))
+        f.select(None if all_sheets else names, header)
@@ -40,5 +40,8 @@ setup(name='bloom_analyses',
       install_requires=[],
       classifiers=classifiers,
       package_data={
+          },
+      entry_points={
+          'console_scripts': ['wetlab=plate_mapper.cli:main']
           }
-      )-
+      )